@@ -0,0 +1,276 @@
+"""
+Hot path benchmark.
+
+Times the operations that grow with the size of the dojo on synthetic data:
+rooms and a people file in the resources/people.txt format, from a thousand
+to a million people. Every operation is timed on its own, taking the best
+of a few runs, and reported as seconds, items per second and the peak
+memory it allocated, traced with tracemalloc in a separate, untimed run.
+
+Results can be saved as baselines and later runs compared against them. A
+comparison fails when an operation takes longer or allocates more than its
+baseline allows, so it can guard a change against regressions. Timings
+depend on the machine, so baselines should be saved on the machine that
+compares against them.
+
+Usage:
+    hot_paths.py [--sizes=<sizes>] [--operations=<names>] [--repeat=<n>]
+        [--no-memory] [--save=<file>] [--compare=<file>]
+        [--tolerance=<ratio>]
+    hot_paths.py (-h | --help)
+Options:
+    --sizes=<sizes>  Comma separated numbers of people
+                     [default: 1000,10000,100000].
+    --operations=<names>  Comma separated operations to run, all by default.
+    --repeat=<n>  Timed runs of each operation, the fastest is kept
+                  [default: 3].
+    --no-memory  Skip the run that traces peak memory.
+    --save=<file>  Save the results as baselines to <file>.
+    --compare=<file>  Compare the results with the baselines in <file> and
+                      exit with an error on any regression.
+    --tolerance=<ratio>  How much slower or bigger than its baseline an
+                         operation may be [default: 0.25].
+    -h, --help  Show this screen and exit.
+"""
+
+import gc
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from docopt import docopt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.dojo import Dojo  # noqa: E402
+from src.output import SilentSink  # noqa: E402
+from src.strategies import FirstFitStrategy, make_strategy  # noqa: E402
+
+FIRST_NAMES = ("OLUWAFEMI", "DOMINIC", "SIMON", "MARI", "LEIGH", "TANA",
+               "KELLY", "ANDREW", "JOY", "ADA")
+LAST_NAMES = ("SULE", "WALTERS", "PATTERSON", "LAWRENCE", "RILEY", "LOPEZ",
+              "OBI", "ALI", "KIMANI", "MENSAH")
+
+# Moves timed by the reallocate_person benchmark, whatever the size
+MOVES = 10000
+
+# Slowdowns shorter than this, in seconds, are put down to noise
+NOISE_FLOOR = 0.005
+
+
+def room_names(prefix, count):
+    """Returns count alphabetic room names"""
+
+    return [prefix + "".join(chr(ord("a") + int(digit)) for digit in str(n))
+            for n in range(count)]
+
+
+def write_people(path, count, seed=0):
+    """Writes a people file of count random fellows and staff"""
+
+    rng = random.Random(seed)
+    with open(path, "w") as file:
+        for _ in range(count):
+            if rng.random() < 0.7:
+                file.write("{0} {1} FELLOW {2}\n".format(
+                    rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+                    rng.choice("YN")))
+            else:
+                file.write("{0} {1} STAFF\n".format(
+                    rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)))
+
+
+def empty_dojo(people):
+    """Returns a dojo with a fifth more office slots than people"""
+
+    dojo = Dojo(output=SilentSink(),
+                office_strategy=make_strategy("random", 0),
+                living_space_strategy=FirstFitStrategy())
+    dojo.create_room("office", *room_names("office", people // 5 + 1))
+    dojo.create_room("living_space",
+                     *room_names("living", people // 4 + 1))
+    return dojo
+
+
+class Workload(object):
+    """ This class is responsible for the data of one benchmark size
+
+    Each operation has a setup method, which is not timed, returning the
+    function that is timed and the number of items it handles.
+
+    Args:
+        people (int): Number of people in the dojo
+        directory (str): Where the generated files are written
+    """
+
+    def __init__(self, people, directory):
+        self.people = people
+        self.directory = directory
+        self.people_file = os.path.join(directory, "people.txt")
+        self.db_file = os.path.join(directory, "dojo.db")
+        write_people(self.people_file, people)
+        self._loaded = None
+
+    def resource(self, path):
+        """Names a file for the methods that write to resources/
+
+        Dojo opens resources/ relative to the working directory, which main
+        sets to ROOT.
+        """
+
+        return os.path.relpath(path, os.path.join(ROOT, "resources"))
+
+    def loaded(self):
+        """Returns a dojo holding everyone in the people file"""
+
+        if self._loaded is None:
+            self._loaded = empty_dojo(self.people)
+            self._loaded.load_people(self.people_file, self.people)
+        return self._loaded
+
+    def add_person(self):
+        dojo = empty_dojo(self.people)
+        with open(self.people_file) as file:
+            people = [line.split() for line in file]
+        return lambda: [dojo.add_person(*person) for person in people], \
+            self.people
+
+    def load_people(self):
+        dojo = empty_dojo(self.people)
+        return lambda: dojo.load_people(self.people_file, 10000), self.people
+
+    def reallocate_person(self):
+        dojo = self.loaded()
+        rng = random.Random(0)
+        offices = [room.name for room in dojo.rooms
+                   if room._type == "office"]
+        # Every other move leaves the office to the strategy
+        moves = [(rng.randint(1, self.people),
+                  rng.choice(offices) if move % 2 else None)
+                 for move in range(MOVES)]
+        return lambda: [dojo.reallocate_person(person_id, room_name)
+                        for person_id, room_name in moves], MOVES
+
+    def print_allocations(self):
+        dojo = self.loaded()
+        path = self.resource(os.path.join(self.directory, "report.csv"))
+        return lambda: dojo.print_allocations(path), len(dojo.rooms)
+
+    def save_state(self):
+        dojo = self.loaded()
+        if os.path.exists(self.db_file):
+            os.remove(self.db_file)
+        dojo._saved_to = None
+        return lambda: dojo.save_state(self.resource(self.db_file)), \
+            self.people
+
+    def load_state(self):
+        if not os.path.exists(self.db_file):
+            self.loaded().save_state(self.resource(self.db_file))
+        dojo = Dojo(output=SilentSink())
+        return lambda: dojo.load_state(self.db_file), self.people
+
+
+OPERATIONS = ("add_person", "load_people", "reallocate_person",
+              "print_allocations", "save_state", "load_state")
+
+
+def measure(workload, operation, repeat, trace_memory):
+    """Times the fastest of repeat runs of an operation
+
+    Returns:
+        dict: seconds, items per second and, when traced, peak MB
+    """
+
+    seconds = float("inf")
+    for _ in range(repeat):
+        run, items = getattr(workload, operation)()
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        seconds = min(seconds, time.perf_counter() - start)
+    result = {"seconds": round(seconds, 4),
+              "per_second": round(items / seconds, 1)}
+    if trace_memory:
+        run, _ = getattr(workload, operation)()
+        gc.collect()
+        tracemalloc.start()
+        run()
+        result["peak_mb"] = round(
+            tracemalloc.get_traced_memory()[1] / 1e6, 2)
+        tracemalloc.stop()
+    return result
+
+
+def regressions(results, baselines, tolerance):
+    """Lists the results worse than their baselines by more than tolerance
+    """
+
+    found = []
+    for size, operations in results.items():
+        for operation, result in operations.items():
+            baseline = baselines.get(size, {}).get(operation)
+            if baseline is None:
+                continue
+            for metric, floor in (("seconds", NOISE_FLOOR), ("peak_mb", 0)):
+                if metric in result and metric in baseline and \
+                        result[metric] > baseline[metric] * (
+                            1 + tolerance) + floor:
+                    found.append("{0} at {1} people: {2} {3} against "
+                                 "{4}".format(operation, size, metric,
+                                              result[metric],
+                                              baseline[metric]))
+    return found
+
+
+def main():
+    opt = docopt(__doc__)
+    for name in ("--save", "--compare"):
+        if opt[name]:
+            opt[name] = os.path.abspath(opt[name])
+    os.chdir(ROOT)
+    operations = opt["--operations"].split(",") if opt["--operations"] \
+        else OPERATIONS
+    unknown = set(operations) - set(OPERATIONS)
+    if unknown:
+        sys.exit("Unknown operations {0}, choose from {1}".format(
+            ", ".join(sorted(unknown)), ", ".join(OPERATIONS)))
+
+    directory = tempfile.mkdtemp()
+    results = {}
+    try:
+        for size in [int(size) for size in opt["--sizes"].split(",")]:
+            workload = Workload(size, directory)
+            results[str(size)] = {}
+            for operation in operations:
+                result = measure(workload, operation, int(opt["--repeat"]),
+                                 not opt["--no-memory"])
+                results[str(size)][operation] = result
+                print("{0:>8} {1:<18} {2:9.3f} s {3:12.0f}/s {4}".format(
+                    size, operation, result["seconds"],
+                    result["per_second"],
+                    "{0:8.1f} MB".format(result["peak_mb"])
+                    if "peak_mb" in result else ""))
+    finally:
+        shutil.rmtree(directory)
+
+    if opt["--save"]:
+        with open(opt["--save"], "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    if opt["--compare"]:
+        with open(opt["--compare"]) as file:
+            baselines = json.load(file)
+        found = regressions(results, baselines, float(opt["--tolerance"]))
+        for regression in found:
+            print("regression: " + regression)
+        sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
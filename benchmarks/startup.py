@@ -0,0 +1,93 @@
+"""
+Startup time benchmark.
+
+Times cold starts of the command line application in fresh interpreters and
+lists the heavy modules imported before any command runs. Times are medians
+in milliseconds, with the bare interpreter startup shown for reference.
+
+Usage:
+    startup.py [--runs=<n>] [--budget=<ms>] [--check]
+    startup.py (-h | --help)
+Options:
+    --runs=<n>  Number of runs per command [default: 10].
+    --budget=<ms>  Slowest median startup allowed by --check, in ms, on top
+                   of the bare interpreter startup.
+    --check  Exit with an error if a heavy module is imported at startup or
+             the budget is exceeded.
+    -h, --help  Show this screen and exit.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from docopt import docopt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    "interpreter": ["-c", "pass"],
+    "help": ["space_allocator.py", "--help"],
+    "import": ["-c", "import space_allocator"],
+    "dojo": ["-c", "import src.dojo; src.dojo.Dojo()"],
+}
+
+# Modules only some commands need, none of them may load at startup
+HEAVY_MODULES = ("asyncio", "colorful", "csv", "gzip", "numpy",
+                 "prettytable", "sqlite3")
+
+IMPORTED = """
+import sys
+import space_allocator
+import src.dojo
+src.dojo.Dojo()
+print(" ".join(sorted(set(sys.modules) & set(sys.argv[1:]))))
+"""
+
+
+def time_command(args, runs):
+    """Returns the median wall time of running args in ms"""
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=ROOT, check=True,
+                       stdout=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def heavy_imports():
+    """Returns the heavy modules imported by the application at startup"""
+
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORTED] + list(HEAVY_MODULES), cwd=ROOT,
+        check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return output.split()
+
+
+def main():
+    opt = docopt(__doc__)
+    runs = int(opt["--runs"])
+    timings = {name: time_command(args, runs)
+               for name, args in COMMANDS.items()}
+    for name, median in timings.items():
+        print("{0:<12} {1:8.1f} ms".format(name, median))
+    imported = heavy_imports()
+    print("heavy modules imported: " + (", ".join(imported) or "none"))
+
+    if opt["--check"]:
+        failed = bool(imported)
+        if opt["--budget"] is not None:
+            slowest = max(timings.values()) - timings["interpreter"]
+            if slowest > float(opt["--budget"]):
+                print("startup takes {0:.1f} ms over the interpreter, "
+                      "budget is {1} ms".format(slowest, opt["--budget"]))
+                failed = True
+        sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
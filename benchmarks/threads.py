@@ -0,0 +1,98 @@
+"""
+Concurrent allocation benchmark.
+
+Adds people to a ThreadSafeDojo from several worker threads at once, with
+every tenth operation a reallocation, and prints the throughput reached with
+each number of workers. After every run the rooms are checked for people
+above capacity and for residents out of step with the rooms people hold.
+
+Usage:
+    threads.py [--people=<n>] [--threads=<counts>]
+    threads.py (-h | --help)
+Options:
+    --people=<n>  People added in each run [default: 40000].
+    --threads=<counts>  Comma separated numbers of worker threads
+                        [default: 1,2,4,8].
+    -h, --help  Show this screen and exit.
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+
+from docopt import docopt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.output import SilentSink  # noqa: E402
+from src.thread_safe_dojo import ThreadSafeDojo  # noqa: E402
+
+
+def room_names(prefix, count):
+    """Returns count alphabetic room names"""
+
+    return [prefix + "".join(chr(ord("a") + int(digit)) for digit in str(n))
+            for n in range(count)]
+
+
+def violations(dojo):
+    """Returns the number of rooms over capacity or out of step"""
+
+    found = 0
+    for room in dojo.rooms:
+        if len(room.residents) > room.maximum_no_of_people:
+            found += 1
+        if any(getattr(person, room._type) is not room
+               for person in room.residents):
+            found += 1
+    return found
+
+
+def run(people, workers):
+    """Adds people from workers threads
+
+    Returns:
+        (float, int): People added per second and capacity violations
+    """
+
+    dojo = ThreadSafeDojo(output=SilentSink())
+    dojo.create_room("office", *room_names("office", people // 6))
+    dojo.create_room("living_space", *room_names("living", people // 8))
+    offices = room_names("office", people // 6)
+
+    def work(count, seed):
+        rng = random.Random(seed)
+        for n in range(count):
+            dojo.add_person("Fellow", "Worker", "Fellow", "Y")
+            if n % 10 == 9:
+                dojo.reallocate_person(
+                    rng.randint(1, len(dojo.people)), rng.choice(offices))
+
+    threads = [threading.Thread(target=work, args=(people // workers, seed))
+               for seed in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return len(dojo.people) / elapsed, violations(dojo)
+
+
+def main():
+    opt = docopt(__doc__)
+    people = int(opt["--people"])
+    failed = False
+    for workers in [int(count) for count in opt["--threads"].split(",")]:
+        throughput, found = run(people, workers)
+        print("{0:>3} threads {1:10.0f} people/s {2} violations".format(
+            workers, throughput, found))
+        failed = failed or found > 0
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,125 @@
 """
 Welcome to the Space allocator.
 Usage:
-    space_allocator create_room <room_type> <room_name>...
-    space_allocator add_person <first_name> <last_name> <person_type> [<wants_accommodation>]
+    space_allocator create_room <room_type> <room_name>... [--campus=<name>]
+    space_allocator add_person <first_name> <last_name> <person_type>
+        [<wants_accommodation>] [--campus=<name>]
     space_allocator print_room <room_name>
     space_allocator print_allocations [<file_name>] (-t | --table)
+    space_allocator print_allocations <file_name> [--format=<fmt>] [--gzip]
     space_allocator print_unallocated [<file_name>]
-    space_allocator reallocate_person <person_identifier> <new_room_name>
-    space_allocator load_people <file_name>
+    space_allocator print_utilisation
+    space_allocator reallocate_person <person_identifier> [<new_room_name>]
+        [--living]
+    space_allocator reallocate_people <file_name>
+    space_allocator load_people <file_name> [--batch=<size>]
+    space_allocator load_rooms <file_name>
     space_allocator save_state [<sqlite_database>]
     space_allocator load_state [<sqlite_database>]
-    space_allocator (-i | --interactive)
+    space_allocator stats [<file_name>] [--json]
+    space_allocator (-i | --interactive) [--output=<sink>]
+        [--office-strategy=<name>] [--living-strategy=<name>] [--seed=<n>]
+        [--waitlist] [--journal=<file>] [--columnar] [--stats]
+    space_allocator (-i | --interactive) --store=<sqlite_database>
+        [--output=<sink>] [--office-strategy=<name>]
+        [--living-strategy=<name>] [--seed=<n>] [--stats]
+    space_allocator --script=<file> [--keep-going] [--output=<sink>]
+        [--office-strategy=<name>] [--living-strategy=<name>] [--seed=<n>]
+        [--waitlist] [--journal=<file>] [--columnar] [--stats]
+    space_allocator --script=<file> --store=<sqlite_database> [--keep-going]
+        [--output=<sink>] [--office-strategy=<name>]
+        [--living-strategy=<name>] [--seed=<n>] [--stats]
+    space_allocator (-i | --interactive | --script=<file>) --campuses=<names>
+        [--keep-going] [--output=<sink>] [--office-strategy=<name>]
+        [--living-strategy=<name>] [--seed=<n>] [--waitlist] [--stats]
+    space_allocator serve [--host=<host>] [--port=<port>] [--socket=<path>]
+        [--db=<sqlite_database>] [--checkpoint=<seconds>]
+        [--office-strategy=<name>] [--living-strategy=<name>] [--seed=<n>]
+        [--waitlist] [--journal=<file>]
     space_allocator (-h | --help | --version)
 Options:
     --version  show program's version number and exit
     --table  Prints out a table on the screen.
+    --format=<fmt>  Format of the allocations file: text, csv or jsonl.
+                    Guessed from the file extension when left out.
+    --gzip  Compress the allocations file, the default for names ending .gz
+    --batch=<size>  Stream people in batches of <size>, "-" reads stdin.
     -i, --interactive  Interactive Mode
+    --script=<file>  Run the commands in <file>, one per line, against a
+                     single dojo. "-" reads them from stdin.
+    --keep-going  Carry on with the rest of the script after a command fails.
+    --output=<sink>  Where messages go: color, text, json or silent
+                     [default: color].
+    --office-strategy=<name>  How offices are picked: random, first_fit,
+                              least_loaded or most_loaded [default: random].
+    --living-strategy=<name>  How living spaces are picked
+                              [default: first_fit].
+    --seed=<n>  Seed of the random strategy for reproducible runs.
+    --living  Let the living space strategy pick the new room.
+    --waitlist  Queue people who can not be allocated and allocate them as
+                soon as space is created or freed.
+    --host=<host>  Address the service listens on [default: 127.0.0.1].
+    --port=<port>  Port the service listens on [default: 8000].
+    --socket=<path>  Serve on a Unix socket instead of a TCP port.
+    --db=<sqlite_database>  Database in resources/ the service is restored
+                            from and checkpointed to.
+    --checkpoint=<seconds>  Seconds between checkpoints [default: 30].
+    --store=<sqlite_database>  Keep the dojo in an SQLite database instead of
+                               memory. Nothing is loaded at start.
+    --columnar  Keep people in compact columns instead of objects.
+    --campuses=<names>  Comma separated campuses, each kept by its own
+                        worker process.
+    --campus=<name>  Campus the rooms are created on, or the person would
+                     like to join.
+    --stats  Time every command and count events and index hits, shown by
+             the stats command.
+    --json  Print the statistics as JSON.
+    --journal=<file>  Recover the dojo from <file> and append every change
+                      to it, compacting it into <file>.snapshot now and then.
     -h, --help  Show this screen and exit.
 """
 
 import sys
 import cmd
-from docopt import docopt, DocoptExit
-import colorful
-from src.dojo import Dojo
+import time
+from docopt import docopt, DocoptExit, TokenStream, extras, formal_usage, \
+    parse_argv, parse_defaults, parse_pattern, printable_usage
 
-# space_allocator print_allocations [<file_name>] [--table]
+# Only docopt is imported up front. Everything else is imported by the
+# commands that use it so that one-shot calls and --help start quickly.
 
-dojo = Dojo()
+INTRO = 'Welcome to my Space Allocator!\n' + \
+    ' (Please type help for a list of commands and guidance.)'
+
+# Usage patterns of the shell commands, parsed once per docstring
+usage_patterns = {}
+
+
+def parse_command(doc, argv):
+    """Matches argv against a usage docstring like docopt() does
+
+    docopt() parses the docstring on every call, which dominates the cost
+    of a command when a script runs thousands of them. The parsed pattern
+    of each docstring is kept in usage_patterns and only argv is parsed.
+
+    Raises:
+        DocoptExit: If argv does not match the usage
+        SystemExit: After printing the usage for --help
+    """
+
+    if doc not in usage_patterns:
+        usage = printable_usage(doc)
+        options = parse_defaults(doc)
+        usage_patterns[doc] = (
+            usage, options, parse_pattern(formal_usage(usage), options).fix())
+    usage, options, pattern = usage_patterns[doc]
+    DocoptExit.usage = usage
+    argv = parse_argv(TokenStream(argv, DocoptExit), list(options), False)
+    extras(True, None, argv, doc)
+    matched, left, collected = pattern.match(argv)
+    if matched and left == []:
+        return dict((a.name, a.value) for a in (pattern.flat() + collected))
+    raise DocoptExit()
 
 
 def docopt_cmd(func):
@@ -37,13 +129,16 @@ def docopt_cmd(func):
     """
 
     def fn(self, arg):
+        if self.stats is not None:
+            self.stats.cache('command_parser', fn.__doc__ in usage_patterns)
         try:
-            opt = docopt(fn.__doc__, arg)
+            opt = parse_command(fn.__doc__, arg)
 
         except DocoptExit as exception:
             # The DocoptExit is thrown when the args do not match.
             # We print a message to the user and the usage block.
 
+            self.failed = True
             print('Invalid Command!')
             print(exception)
             return
@@ -63,22 +158,88 @@ def docopt_cmd(func):
 
 
 class SpaceAllocator (cmd.Cmd):
-    intro = colorful.bold_green(
-        'Welcome to my Space Allocator!\n' +
-        ' (Please type help for a list of commands and guidance.)')
     prompt = '(space_allocator) '
     file = None
 
+    def __init__(self, dojo, stats=None):
+        super(SpaceAllocator, self).__init__()
+        self.dojo = dojo
+        self.stats = stats
+        self.failed = False
+
+    def onecmd(self, line):
+        """Runs a command, timing it when statistics are kept"""
+
+        if self.stats is None:
+            return super(SpaceAllocator, self).onecmd(line)
+        start = time.perf_counter()
+        try:
+            return super(SpaceAllocator, self).onecmd(line)
+        finally:
+            command = line.split()[0] if line.split() else 'emptyline'
+            self.stats.record(
+                'command.' + command, time.perf_counter() - start)
+
+    def run_script(self, lines, keep_going=False):
+        """Runs commands read from lines against the dojo
+
+        Blank lines and lines starting with # are skipped. A command fails
+        if it can not be parsed, reports an error or raises an exception.
+
+        Args:
+            lines: Iterable of command lines
+            keep_going (bool): Run the remaining commands after a failure
+
+        Returns:
+            int: Number of commands that failed
+        """
+
+        failures = 0
+        for line_no, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            self.failed = False
+            errors = self.dojo.output.errors
+            try:
+                stop = self.postcmd(self.onecmd(line), line)
+            except Exception as exception:
+                print('Line {0} raised {1}: {2}'.format(
+                    line_no, type(exception).__name__, exception),
+                    file=sys.stderr)
+                self.failed, stop = True, False
+            if self.failed or self.dojo.output.errors > errors:
+                failures += 1
+                if not keep_going:
+                    print('Stopped at line {0}: {1}'.format(line_no, line),
+                          file=sys.stderr)
+                    break
+            if stop:
+                break
+        return failures
+
     @docopt_cmd
     def do_create_room(self, arg):
-        """Usage: create_room <room_type> <room_name>..."""
+        """Usage: create_room <room_type> <room_name>... [--campus=<name>]"""
 
-        for room_name in arg['<room_name>']:
-            dojo.create_room(arg['<room_type>'], room_name)
+        if arg['--campus'] is None:
+            self.dojo.create_room(arg['<room_type>'], *arg['<room_name>'])
+        elif self.has_campuses():
+            self.dojo.create_room(arg['<room_type>'], *arg['<room_name>'],
+                                  campus=arg['--campus'])
+
+    @docopt_cmd
+    def do_load_rooms(self, arg):
+        """Usage: load_rooms <file_name>"""
+
+        self.dojo.load_rooms(arg['<file_name>'])
 
     def default(self, line):
         """Defines the default message output for the incase he/she enters a wrong command"""
 
+        import colorful
+
+        self.failed = True
         print(colorful.bold_orange(
             'The command ' +
             line.lower() +
@@ -88,89 +249,302 @@ class SpaceAllocator (cmd.Cmd):
 
     @docopt_cmd
     def do_add_person(self, arg):
-        """Usage: add_person <first_name> <last_name> <person_type> [<wants_accommodation>]"""
-
-        if arg['<wants_accommodation>'] is None:
-            dojo.add_person(
+        """Usage: add_person <first_name> <last_name> <person_type> [<wants_accommodation>] [--campus=<name>]"""
+
+        if arg['--campus'] is not None:
+            if self.has_campuses():
+                self.dojo.add_person(
+                    arg['<first_name>'],
+                    arg['<last_name>'],
+                    arg['<person_type>'],
+                    (arg['<wants_accommodation>'] or "N").upper(),
+                    campus=arg['--campus'])
+        elif arg['<wants_accommodation>'] is None:
+            self.dojo.add_person(
                 arg['<first_name>'],
                 arg['<last_name>'],
                 arg['<person_type>'])
         else:
-            dojo.add_person(
+            self.dojo.add_person(
                 arg['<first_name>'],
                 arg['<last_name>'],
                 arg['<person_type>'],
                 arg['<wants_accommodation>'])
 
+    def has_campuses(self):
+        """Reports a failed command unless the dojo is split into campuses
+        """
+
+        if hasattr(self.dojo, 'campuses'):
+            return True
+        self.dojo.output.emit(
+            "red", "no_campuses",
+            "--campus needs a dojo started with --campuses")
+        return False
+
     @docopt_cmd
     def do_print_room(self, arg):
         """Usage: print_room <room_name>"""
 
-        dojo.print_room(arg['<room_name>'])
+        self.dojo.print_room(arg['<room_name>'])
 
     @docopt_cmd
     def do_print_allocations(self, arg):
-        """Usage: print_allocations [<file_name>] [--table]"""
+        """Usage: print_allocations [<file_name>] [--table] [--format=<fmt>] [--gzip]"""
 
         if arg['<file_name>'] is not None:
-            dojo.print_allocations(arg['<file_name>'])
+            self.dojo.print_allocations(
+                arg['<file_name>'], output_format=arg['--format'],
+                compress=arg['--gzip'] or None)
         else:
             if arg['--table']:
-                dojo.print_allocations(print_table="Y")
+                self.dojo.print_allocations(print_table="Y")
             else:
-                # dojo.print_allocations(print_table="Y")
-                dojo.print_allocations(print_table="N")
+                # self.dojo.print_allocations(print_table="Y")
+                self.dojo.print_allocations(print_table="N")
 
     @docopt_cmd
     def do_print_unallocated(self, arg):
         """Usage: print_unallocated [<file_name>]"""
 
         if arg['<file_name>'] is None:
-            dojo.print_unallocated()
+            self.dojo.print_unallocated()
         else:
-            dojo.print_unallocated(arg['<file_name>'])
+            self.dojo.print_unallocated(arg['<file_name>'])
+
+    @docopt_cmd
+    def do_print_utilisation(self, arg):
+        """Usage: print_utilisation"""
+
+        self.dojo.print_utilisation()
 
     @docopt_cmd
     def do_reallocate_person(self, arg):
-        """Usage: reallocate_person <person_identifier> <new_room_name>"""
+        """Usage: reallocate_person <person_identifier> [<new_room_name>] [--living]"""
 
-        dojo.reallocate_person(
-            int(arg['<person_identifier>']), arg['<new_room_name>'])
+        self.dojo.reallocate_person(
+            int(arg['<person_identifier>']), arg['<new_room_name>'],
+            "living_space" if arg['--living'] else "office")
 
     @docopt_cmd
-    def do_load_people(self, arg):
-        """Usage: load_people <file_name>"""
+    def do_reallocate_people(self, arg):
+        """Usage: reallocate_people <file_name>"""
+
+        import os.path
+        from src.helpers import parse_people
+
+        file_name = arg['<file_name>']
+        if not os.path.isfile(file_name):
+            self.dojo.output.emit(
+                "red", "missing_file",
+                "File does not exist! Please specify another file",
+                file_name=file_name)
+            return
+        with open(file_name) as lines:
+            moves = [(int(fields[0]) if fields[0].isdigit() else fields[0],
+                      " ".join(fields[1:]))
+                     for _, fields in parse_people(lines)]
+        self.dojo.reallocate_many(moves)
 
-        dojo.load_people(arg['<file_name>'])
+    @docopt_cmd
+    def do_load_people(self, arg):
+        """Usage: load_people <file_name> [--batch=<size>]"""
+
+        batch_size = arg['--batch']
+        if batch_size is not None and (
+                not batch_size.isdigit() or int(batch_size) == 0):
+            self.dojo.output.emit(
+                "red", "invalid_batch",
+                "Batch size must be a whole number above 0, got {batch}",
+                batch=batch_size)
+            return
+        self.dojo.load_people(arg['<file_name>'], batch_size)
 
     @docopt_cmd
     def do_save_state(self, arg):
         """Usage: save_state [<sqlite_database>]"""
 
         if arg['<sqlite_database>'] is None:
-            dojo.save_state()
+            self.dojo.save_state()
         else:
-            dojo.save_state(arg['<sqlite_database>'])
+            self.dojo.save_state(arg['<sqlite_database>'])
 
     @docopt_cmd
     def do_load_state(self, arg):
         """Usage: load_state [<sqlite_database>]"""
 
         if arg['<sqlite_database>'] is None:
-            dojo.load_state()
+            self.dojo.load_state()
         else:
-            dojo.load_state(arg['<sqlite_database>'])
+            self.dojo.load_state(arg['<sqlite_database>'])
+
+    @docopt_cmd
+    def do_stats(self, arg):
+        """Usage: stats [<file_name>] [--json]"""
+
+        if self.stats is None:
+            self.dojo.output.emit(
+                "red", "stats_off",
+                "Statistics are off, start the allocator with --stats")
+            return
+        if arg['<file_name>'] is not None:
+            self.stats.dump('resources/' + arg['<file_name>'], self.dojo)
+            return
+        figures = self.stats.snapshot(self.dojo)
+        if arg['--json']:
+            import json
+
+            self.dojo.output.emit(
+                "blue", "stats", lambda: json.dumps(figures, indent=2),
+                stats=figures)
+            return
+
+        from src.helpers import make_table
+
+        self.dojo.output.emit(
+            "blue", "stats_latency", lambda: make_table(
+                ['Operation', 'Calls', 'Mean ms', 'p50 ms', 'p90 ms',
+                 'p99 ms', 'Max ms'],
+                [[name, latency['count'], latency['mean_ms'],
+                  latency['p50_ms'], latency['p90_ms'], latency['p99_ms'],
+                  latency['max_ms']]
+                 for name, latency in figures['latency'].items()]),
+            latency=figures['latency'])
+        self.dojo.output.emit(
+            "blue", "stats_counters", lambda: make_table(
+                ['Counter', 'Value'],
+                [[event, count] for event, count in figures['events'].items()]
+                + [[name + ' ' + key, value]
+                   for name, counts in figures['caches'].items()
+                   for key, value in counts.items()]),
+            events=figures['events'], caches=figures['caches'])
+        for room_type, occupancy in figures.get('rooms', {}).items():
+            self.dojo.output.emit(
+                "blue", "stats_rooms",
+                "{room_type}: {residents} of {capacity} slots in use "
+                "({percent:.0%}), {full_rooms} of {rooms} rooms full",
+                room_type=room_type, percent=occupancy['utilisation'],
+                **occupancy)
+
+    def postcmd(self, stop, line):
+        """Flushes buffered output once a command has run"""
+
+        self.dojo.output.flush()
+        if self.dojo.journal is not None:
+            self.dojo.journal.commit()
+        return stop
 
     def do_quit(self, arg):
         """Quits out of Interactive Mode."""
 
+        if self.dojo.journal is not None:
+            self.dojo.journal.close()
+        if hasattr(self.dojo, 'close'):
+            self.dojo.close()
         print('Good Bye!')
         exit()
 
 
-opt = docopt(__doc__, sys.argv[1:])
+def make_dojo(opt):
+    """Builds the Dojo described by the command line options
+
+    Returns:
+        Dojo: The new dojo, None if an option is invalid
+    """
+
+    from src.dojo import Dojo
+    from src.output import SINKS
+    from src.strategies import make_strategy
+
+    if opt['--output'] not in SINKS:
+        print('Unknown output sink: ' + opt['--output'])
+        return
+    try:
+        office_strategy = make_strategy(
+            opt['--office-strategy'], opt['--seed'])
+        living_space_strategy = make_strategy(
+            opt['--living-strategy'], opt['--seed'])
+    except ValueError as exception:
+        print(exception)
+        return
+    if opt['--campuses']:
+        from src.sharded import ShardedDojo
+
+        return ShardedDojo(opt['--campuses'].split(','),
+                           output=SINKS[opt['--output']](sys.stdout),
+                           office_strategy=office_strategy,
+                           living_space_strategy=living_space_strategy,
+                           waitlist=opt['--waitlist'])
+    if opt['--store']:
+        from src.sqlite_dojo import SQLiteDojo
+
+        return SQLiteDojo(opt['--store'],
+                          output=SINKS[opt['--output']](sys.stdout),
+                          office_strategy=office_strategy,
+                          living_space_strategy=living_space_strategy)
+    dojo_class = Dojo
+    if opt['--columnar']:
+        from src.columnar_dojo import ColumnarDojo as dojo_class
+    dojo = dojo_class(output=SINKS[opt['--output']](sys.stdout),
+                      office_strategy=office_strategy,
+                      living_space_strategy=living_space_strategy,
+                      waitlist=opt['--waitlist'])
+    if opt['--journal']:
+        from src.journal import Journal
+
+        Journal(opt['--journal']).recover(dojo)
+    return dojo
+
+
+def main(argv=None):
+    """Runs the command line application"""
+
+    opt = docopt(__doc__, sys.argv[1:] if argv is None else argv)
+
+    if opt['--interactive'] or opt['serve'] or opt['--script']:
+        import colorful
+
+        dojo = make_dojo(opt)
+        if dojo is None:
+            exit(1)
+
+    stats = None
+    if opt['--stats']:
+        from src.stats import Stats
+
+        stats = Stats()
+        stats.instrument(dojo)
+
+    if opt['--interactive']:
+        SpaceAllocator(dojo, stats).cmdloop(colorful.bold_green(INTRO))
+
+    if opt['--script']:
+        try:
+            lines = sys.stdin if opt['--script'] == '-' \
+                else open(opt['--script'])
+        except IOError:
+            print('File does not exist! Please specify another file')
+            exit(1)
+        with lines:
+            failures = SpaceAllocator(dojo, stats).run_script(
+                lines, opt['--keep-going'])
+        if hasattr(dojo, 'close'):
+            dojo.close()
+        exit(1 if failures else 0)
+
+    if opt['serve']:
+        from src.service import AllocatorService
+
+        print(colorful.bold_green(
+            'Serving the Space Allocator on ' +
+            (opt['--socket'] or opt['--host'] + ':' + opt['--port'])))
+        AllocatorService(
+            dojo, opt['--db'], float(opt['--checkpoint'])).run(
+                opt['--host'], int(opt['--port']), opt['--socket'])
+        exit()
+
+    print(opt)
 
-if opt['--interactive']:
-    SpaceAllocator().cmdloop()
 
-print(opt)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+"""class ColumnarDojo
+
+Dojo that keeps its people as rows of a ColumnarStore instead of Person
+objects. It offers the same commands as Dojo and runs the same allocation
+code: people are handed to that code as PersonRow views created on demand,
+which read and write the columns of their row, and every room keeps the rows
+of its residents in an array in place of its residents dict. Rooms are the
+usual Office and LivingSpace objects, so the vacancy index and allocation
+strategies work unchanged.
+
+Memory per person on 64-bit CPython 3.11, measured with tracemalloc over
+100,000 fellows given an office and a living space by add_person. Person
+names are shared interned strings, so only the references are counted:
+
+    Dojo, Person object, index and resident entries  ~310 bytes
+    ColumnarDojo, row and resident entries            ~62 bytes
+
+Of the Dojo figure, ~128 bytes are the Person object itself, as listed in
+src/columnar.py, and about half of the rest are its entries in the
+residents dicts of its two rooms.
+
+Only people who are unallocated or waiting for a room are also held as a
+PersonRow view, in the unallocated index and the waitlists. When NumPy is
+installed the unallocated people, utilisation and full rooms are computed
+by an OccupancyMatrix over the columns instead of by Python loops.
+
+Example:
+    To create a dojo kept in columns, use
+        dojo = ColumnarDojo()
+
+Attributes:
+    store (ColumnarStore): Columns holding every room and person
+    people (ColumnarPeople): Every person as a PersonRow, read on demand
+    people_by_id (PeopleById): Index of people keyed by person id
+"""
+
+import collections.abc
+from array import array
+
+from .columnar import ColumnarStore, NO_ROOM, PERSON_TYPES
+from .dojo import Dojo
+from .person import Person
+
+
+class PersonRow(object):
+    """A person stored as a row of the columns of a ColumnarDojo
+
+    It has the attributes of Person. Setting office or living_space writes
+    the room index of the row, so views of the same row always agree.
+
+    Args:
+        dojo (ColumnarDojo): Dojo holding the row
+        row (int): Row of the person in dojo.store
+    """
+
+    __slots__ = ("dojo", "row")
+
+    def __init__(self, dojo, row):
+        self.dojo = dojo
+        self.row = row
+
+    def __eq__(self, other):
+        return isinstance(other, PersonRow) and self.row == other.row and \
+            self.dojo is other.dojo
+
+    def __hash__(self):
+        return hash(self.row)
+
+    @property
+    def id_(self):
+        return self.dojo.store.person_ids[self.row]
+
+    @property
+    def first_name(self):
+        return self.dojo.store.first_names[self.row]
+
+    @property
+    def last_name(self):
+        return self.dojo.store.last_names[self.row]
+
+    @property
+    def _type(self):
+        return PERSON_TYPES[self.dojo.store.person_types[self.row]]
+
+    @property
+    def wants_accommodation(self):
+        return "Y" if self.dojo.store.wants_accommodation[self.row] else "N"
+
+    def _room(self, rooms):
+        index = rooms[self.row]
+        return self.dojo.rooms[index] if index != NO_ROOM else None
+
+    def _set_room(self, rooms, room):
+        rooms[self.row] = self.dojo.store.room_index[room.name] \
+            if room is not None else NO_ROOM
+
+    @property
+    def office(self):
+        return self._room(self.dojo.store.offices)
+
+    @office.setter
+    def office(self, room):
+        self._set_room(self.dojo.store.offices, room)
+
+    @property
+    def living_space(self):
+        return self._room(self.dojo.store.living_spaces)
+
+    @living_space.setter
+    def living_space(self, room):
+        self._set_room(self.dojo.store.living_spaces, room)
+
+    has_office = Person.has_office
+    has_living_space = Person.has_living_space
+    rooms_occupied = Person.rooms_occupied
+    get_fullname = Person.get_fullname
+
+
+class Residents(object):
+    """Residents of a room, kept as the rows of the people in an array
+
+    It behaves as the residents dict of a Room, handing out PersonRow views.
+    A room holds at most six rows, so scanning the array is as quick as
+    hashing.
+
+    Args:
+        dojo (ColumnarDojo): Dojo holding the rows
+    """
+
+    __slots__ = ("dojo", "rows")
+
+    def __init__(self, dojo):
+        self.dojo = dojo
+        self.rows = array("q")
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        for row in self.rows:
+            yield PersonRow(self.dojo, row)
+
+    def __contains__(self, person):
+        return isinstance(person, PersonRow) and person.row in self.rows
+
+    def __setitem__(self, person, value):
+        if person not in self:
+            self.rows.append(person.row)
+
+    def __delitem__(self, person):
+        try:
+            self.rows.remove(person.row)
+        except ValueError:
+            raise KeyError(person)
+
+
+class ColumnarPeople(collections.abc.Sequence):
+    """Read only list of the people of a ColumnarDojo, in the order added"""
+
+    def __init__(self, dojo):
+        self.dojo = dojo
+
+    def __len__(self):
+        return len(self.dojo.store)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("person index out of range")
+        return PersonRow(self.dojo, index)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield PersonRow(self.dojo, row)
+
+
+class PeopleById(collections.abc.Mapping):
+    """Index of the people of a ColumnarDojo keyed by person id
+
+    People added by the dojo get id row + 1, so their row is found without
+    any index. Only people loaded with other ids are kept in a dict.
+
+    Args:
+        dojo (ColumnarDojo): Dojo holding the rows
+    """
+
+    def __init__(self, dojo):
+        self.dojo = dojo
+        self.rows = {}
+
+    def add(self, person_id, row):
+        """Indexes the row of a person whose id is not row + 1"""
+
+        if person_id != row + 1:
+            self.rows[person_id] = row
+
+    def __getitem__(self, person_id):
+        person_ids = self.dojo.store.person_ids
+        row = person_id - 1 if isinstance(person_id, int) else -1
+        if not (0 <= row < len(person_ids) and person_ids[row] == person_id):
+            row = self.rows[person_id]
+        return PersonRow(self.dojo, row)
+
+    def __iter__(self):
+        return iter(self.dojo.store.person_ids)
+
+    def __len__(self):
+        return len(self.dojo.store)
+
+
+class DirtyRows(object):
+    """Set of the people changed since the last save, one byte per row"""
+
+    def __init__(self, dojo):
+        self.dojo = dojo
+        self.flags = bytearray()
+
+    def add(self, person):
+        if len(self.flags) <= person.row:
+            self.flags.extend(bytes(person.row + 1 - len(self.flags)))
+        self.flags[person.row] = 1
+
+    def clear(self):
+        self.flags = bytearray()
+
+    def __len__(self):
+        return self.flags.count(1)
+
+    def __iter__(self):
+        for row, flag in enumerate(self.flags):
+            if flag:
+                yield PersonRow(self.dojo, row)
+
+
+class ColumnarDojo(Dojo):
+    """ This class is responsible for managing people kept in columns
+
+    Takes the same arguments as Dojo.
+    """
+
+    def __init__(self, **kwargs):
+        super(ColumnarDojo, self).__init__(**kwargs)
+        self.store = ColumnarStore()
+        self.people = ColumnarPeople(self)
+        self.people_by_id = PeopleById(self)
+        self._dirty_people = DirtyRows(self)
+
+    def _register_room(self, room):
+        """Adds a room to the columns, see Dojo._register_room"""
+
+        self.store.add_room(room.name, room._type)
+        room.residents = Residents(self)
+        super(ColumnarDojo, self)._register_room(room)
+
+    def _register_person(self, person):
+        """Adds a row for a person, see Dojo._register_person
+
+        The person's rooms are not copied, they are added with _add_to_room.
+        """
+
+        row = len(self.store)
+        self.store.add_person(
+            person.id_, person.first_name, person.last_name, person._type,
+            person.wants_accommodation)
+        self.people_by_id.add(person.id_, row)
+        person = PersonRow(self, row)
+        self._dirty_people.add(person)
+        self._refresh_unallocated(person)
+        if self.journal is not None:
+            self.journal.append(
+                ["P", person.id_, person.first_name, person.last_name,
+                 person._type, person.wants_accommodation])
+
+    def _refresh_unallocated(self, person):
+        """Refreshes the unallocated index from the row of a person
+
+        Dojo.load_state passes the Person it registered, which never holds
+        rooms, so the row is always read.
+        """
+
+        super(ColumnarDojo, self)._refresh_unallocated(
+            self.people_by_id[person.id_])
+
+    def _create_person(
+            self, first_name, last_name, person_type, wants_accommodation):
+        """Creates a row for a person, see Dojo._create_person"""
+
+        person = super(ColumnarDojo, self)._create_person(
+            first_name, last_name, person_type, wants_accommodation)
+        return self.people_by_id[person.id_]
+
+    def _occupancy(self):
+        """Returns an OccupancyMatrix over the columns, None without NumPy
+
+        The matrix reads the columns in place, so it is dropped before any
+        row is added.
+        """
+
+        from .occupancy import OccupancyMatrix, numpy
+
+        return OccupancyMatrix(self.store) if numpy is not None else None
+
+    def _unallocated_rows(self):
+        """Yields the unallocated people found with an OccupancyMatrix, see
+        Dojo._unallocated_rows
+        """
+
+        from .occupancy import MISSING
+
+        occupancy = self._occupancy()
+        if occupancy is None:
+            yield from super(ColumnarDojo, self)._unallocated_rows()
+            return
+        rows, codes = occupancy.unallocated_rows()
+        del occupancy
+        store = self.store
+        for row, code in zip(rows, codes):
+            yield {"Name": store.first_names[row] + " " +
+                   store.last_names[row],
+                   "Person id": store.person_ids[row],
+                   "Missing": MISSING[code]}
+
+    def utilisation(self):
+        """Computes the utilisation with an OccupancyMatrix, see
+        Dojo.utilisation
+        """
+
+        occupancy = self._occupancy()
+        if occupancy is None:
+            return super(ColumnarDojo, self).utilisation()
+        return occupancy.utilisation(), occupancy.full_rooms()
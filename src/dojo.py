@@ -10,30 +10,136 @@ Example:
 Attributes:
     rooms (Room[]): Contains a list of all rooms in the dojo
     people (Person[]) Contains a list of all people in the system
+    rooms_by_name (dict): Index of rooms keyed by room name
+    people_by_id (dict): Index of people keyed by person id
+    vacancies (dict): VacancyIndex of rooms with free slots keyed by room type
+    output (OutputSink): Sink that receives every message shown to the user
+    strategies (dict): AllocationStrategy used for each room type
+    unallocated (dict): People missing a room they need keyed by person id
+    waitlists (dict): FIFO queues of people waiting for a room keyed by room
+        type, None unless the dojo was created with waitlist=True
+    journal (Journal): Journal every change is appended to, None unless
+        one has been attached with Journal.recover()
 """
 
-import random
-import sqlite3
+import collections
+import heapq
+import itertools
+import sys
 import os.path
 
-import colorful
-from prettytable import PrettyTable
-
+from .columnar import ColumnarStore
 from .living_space import LivingSpace
 from .office import Office
 from .fellow import Fellow
 from .staff import Staff
 from .helpers import get_residents, remove_person, \
-    find_room, find_person, add_person_to_room
-
+    find_room, find_person, add_person_to_room, parse_people, \
+    validate_person_data, validate_room_data, make_table, missing_rooms, \
+    plan_moves, write_unallocated, REJECTIONS
+from .output import ColorSink
+from .strategies import RandomStrategy, FirstFitStrategy
+from .schema import create_schema, UPSERT_ROOM, UPSERT_PERSON, \
+    UPSERT_ROOM_PERSON, DELETE_ROOM_PERSON
+from .vacancy import VacancyIndex
 
 class Dojo(object):
     """Dojo
     """
 
-    def __init__(self):
+    def __init__(self, output=None, office_strategy=None,
+                 living_space_strategy=None, waitlist=False):
+        self.output = output if output is not None else ColorSink()
+        self.strategies = {
+            "office": office_strategy or RandomStrategy(),
+            "living_space": living_space_strategy or FirstFitStrategy()}
+        self.waitlists = {
+            "office": collections.deque(),
+            "living_space": collections.deque()} if waitlist else None
         self.rooms = []
         self.people = []
+        self.rooms_by_name = {}
+        self.people_by_id = {}
+        self.unallocated = {}
+        self.vacancies = {
+            "office": VacancyIndex(), "living_space": VacancyIndex()}
+        # Objects changed since the last save to the database in _saved_to
+        self._dirty_rooms = set()
+        self._dirty_people = set()
+        self._saved_to = None
+        self.journal = None
+
+    @classmethod
+    def from_columns(cls, store, **kwargs):
+        """Creates a dojo holding the rooms and people of a ColumnarStore
+
+        Args:
+            store (ColumnarStore): Store to load
+            kwargs: Passed on to the Dojo constructor
+        """
+
+        dojo = cls(**kwargs)
+        store.load_into(dojo)
+        return dojo
+
+    def to_columns(self):
+        """Copies every room and person into a compact ColumnarStore"""
+
+        return ColumnarStore.from_dojo(self)
+
+    def _register_room(self, room):
+        """Adds a room to the dojo keeping the name index in sync"""
+
+        self.rooms.append(room)
+        self.rooms_by_name[room.name] = room
+        self.vacancies[room._type].add(room)
+        self._dirty_rooms.add(room)
+        if self.journal is not None:
+            self.journal.append(["R", room.name, room._type])
+
+    def _register_person(self, person):
+        """Adds a person to the dojo keeping the id index in sync"""
+
+        self.people.append(person)
+        self.people_by_id[person.id_] = person
+        self._dirty_people.add(person)
+        self._refresh_unallocated(person)
+        if self.journal is not None:
+            self.journal.append(
+                ["P", person.id_, person.first_name, person.last_name,
+                 person._type, person.wants_accommodation])
+
+    def _refresh_unallocated(self, person):
+        """Adds or removes a person from the unallocated index"""
+
+        if missing_rooms(person):
+            self.unallocated[person.id_] = person
+        else:
+            self.unallocated.pop(person.id_, None)
+
+    def _add_to_room(self, person, room):
+        """Adds a person to a room and refreshes the room's vacancy"""
+
+        added = add_person_to_room(person, room)
+        self.vacancies[room._type].update(room)
+        self._dirty_rooms.add(room)
+        self._dirty_people.add(person)
+        self._refresh_unallocated(person)
+        if added and self.journal is not None:
+            self.journal.append(["A", person.id_, room.name])
+        return added
+
+    def _remove_from_room(self, person, room):
+        """Removes a person from a room and refreshes the room's vacancy"""
+
+        removed = remove_person(person, room)
+        self.vacancies[room._type].update(room)
+        self._dirty_rooms.add(room)
+        self._dirty_people.add(person)
+        self._refresh_unallocated(person)
+        if removed and self.journal is not None:
+            self.journal.append(["U", person.id_, room.name])
+        return removed
 
     def create_room(self, room_type, *room_names):
         """ Used to create new rooms.
@@ -48,31 +154,117 @@ class Dojo(object):
 
         """
 
-        created_rooms = []
+        created_rooms = self.create_rooms(
+            (room_type, room_name) for room_name in room_names)
+        return created_rooms[0] if len(created_rooms) == 1 else created_rooms
+
+    def create_rooms(self, rooms):
+        """Creates many rooms at once
+
+        Every name is checked before any room is created, so a bad name only
+        rejects that room. Rooms are created in the order given and waitlists
+        are drained once the whole batch is in.
 
-        for room_name in room_names:
-            # Check if room_name exists in the already created rooms
-            if room_name not in [room.name for room in self.rooms]:
-                # Check that room_name contains only alphabetic characters
-                if not room_name.isalpha():
-                    print("room name input must be string alphabet type")
-                    return
+        Args:
+            rooms: Iterable of (room_type, room_name) pairs
+
+        Returns:
+            Room[]: The rooms created
+        """
+
+        return [room for room, _ in self._create_rooms(rooms) if room]
+
+    def _create_rooms(self, rooms):
+        """Creates rooms, returning a (room, rejection) pair for each one"""
+
+        taken = set(self.rooms_by_name)
+        outcomes = []
+        for room_type, room_name in rooms:
+            if room_name in taken:
+                outcomes.append((room_type, room_name, "duplicate_room"))
+            elif not room_name.isalpha():
+                outcomes.append((room_type, room_name, "invalid_room_name"))
+            else:
+                taken.add(room_name)
+                outcomes.append((room_type, room_name, None))
+
+        created_rooms, results = [], []
+        for room_type, room_name, rejection in outcomes:
+            room = None
+            if rejection == "duplicate_room":
+                self.output.emit(
+                    "red", "duplicate_room",
+                    "Room with name: {room_name} already exists. "
+                    "Please try using another name",
+                    room_name=room_name)
+            elif rejection == "invalid_room_name":
+                self.output.emit(
+                    None, "invalid_room_name",
+                    "room name input must be string alphabet type",
+                    room_name=room_name)
+            else:
                 room = Office(room_name) if room_type.lower(
                 ) == "office" else LivingSpace(room_name)
-                self.rooms.append(room)
+                self._register_room(room)
+                created_rooms.append(room)
+                self.output.emit(
+                    "green", "room_created",
+                    "{room_type} called {room_name} has been successfully "
+                    "created!",
+                    room_type=room_type.capitalize(), room_name=room_name)
+            results.append((room, rejection))
+        for room_type in {room._type for room in created_rooms}:
+            self._drain_waitlist(room_type)
+        return results
+
+    def load_rooms(self, file):
+        """Creates the rooms listed in a text file
+
+        Each line holds a room type and a room name, e.g. "office orange".
+
+        Args:
+            file (str): Path of the rooms file, or "-" to read from stdin.
+
+        Returns:
+            dict: Rooms created and (line, error) pairs of rejected lines
+        """
+
+        if file != "-" and not os.path.isfile(file):
+            self.output.emit(
+                "red", "missing_file",
+                "File does not exist! Please specify another file",
+                file_name=file)
+            return
+        lines = sys.stdin if file == "-" else open(file, "r")
+        rooms, line_numbers, rejected = [], [], []
+        try:
+            for line_no, room_data in parse_people(lines):
+                error = validate_room_data(room_data)
+                if error:
+                    rejected.append((line_no, error))
+                else:
+                    rooms.append((room_data[0], room_data[1]))
+                    line_numbers.append(line_no)
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+        created_rooms = []
+        for line_no, (room, rejection) in zip(
+                line_numbers, self._create_rooms(rooms)):
+            if room:
                 created_rooms.append(room)
-                print(
-                    colorful.green(
-                        "{0} called {1} has been successfully created!"
-                        .format(room_type.capitalize(), room_name)))
             else:
-                print(
-                    colorful.red(
-                        "Room with name: {0} already exists. "
-                        "Please try using another name"
-                        .format(room_name)))
-                break
-        return created_rooms[0] if len(created_rooms) == 1 else created_rooms
+                rejected.append((line_no, REJECTIONS[rejection]))
+        rejected.sort()
+        self.output.emit(
+            "blue", "rooms_loaded",
+            "{created} rooms created, {rejected_count} rejected",
+            created=len(created_rooms), rejected_count=len(rejected))
+        for line_no, error in rejected:
+            self.output.emit(
+                "orange", "line_rejected", "  line {line}: {error}",
+                line=line_no, error=error)
+        return {"created": created_rooms, "rejected": rejected}
 
     def add_person(
             self, first_name,
@@ -94,193 +286,461 @@ class Dojo(object):
 
         rooms = []
 
-        person_id = len(self.people) + 1  # Generate person_id
         if not first_name.isalpha() or not last_name.isalpha():
-            print(colorful.orange("Name should only contain alphabetic characters.\
-                Please rectify and try again"))
+            self.output.emit(
+                "orange", "invalid_person_name",
+                "Name should only contain alphabetic characters.\
+                Please rectify and try again",
+                first_name=first_name, last_name=last_name)
             return
-        person = Staff(first_name, last_name, person_id) \
-            if person_type.lower() == "staff" else Fellow(
-                first_name, last_name, wants_accommodation, person_id)
-        print(colorful.green(
-            "{0} {1} {2} has been successfully added"
-            .format(person_type, first_name, last_name)))
-        self.people.append(person)
+        person = self._create_person(
+            first_name, last_name, person_type, wants_accommodation)
+        self.output.emit(
+            "green", "person_added",
+            "{person_type} {first_name} {last_name} has been successfully "
+            "added", person_type=person_type, first_name=first_name,
+            last_name=last_name, person_id=person.id_)
         # Assign office to person
-        office_rooms = \
-            [room for room in self.rooms if room._type.lower() == "office"
-                and not room.fully_occupied]
-        # chosen_room = random.choice(office_rooms)
-        if office_rooms:
-            chosen_room = random.choice(office_rooms)
-            add_person_to_room(person, chosen_room)
-            person.has_office = True
+        chosen_room = self._allocate_office(person)
+        if chosen_room:
             rooms.append({"office": chosen_room.name})
-            print(
-                colorful.green(
-                    "{0} has been allocated the office {1}".format(
-                        first_name,
-                        chosen_room.name)))
+            self.output.emit(
+                "green", "office_allocated",
+                "{first_name} has been allocated the office {room_name}",
+                first_name=first_name, person_id=person.id_,
+                room_name=chosen_room.name)
         else:
-            print(
-                colorful.red(
-                    "Sorry, No more office rooms for {0} to occupy."
-                    .format(first_name)))
+            self.output.emit(
+                "red", "no_office",
+                "Sorry, No more office rooms for {first_name} to occupy.",
+                first_name=first_name, person_id=person.id_)
+            if self.waitlists is not None:
+                self.output.emit(
+                    "orange", "waitlisted",
+                    "{first_name} has been added to the office waitlist",
+                    first_name=first_name, person_id=person.id_,
+                    room_type="office")
 
-        if wants_accommodation is "Y" and person_type.lower() == "staff":
-            print(colorful.red(
+        if wants_accommodation == "Y" and person_type.lower() == "staff":
+            self.output.emit(
+                "red", "living_space_denied",
                 "Sorry, No living space has been allocated to you as these"
-                " are only meant for fellows."))
+                " are only meant for fellows.", person_id=person.id_)
 
         # Assign person living_space
-        if wants_accommodation is "Y" and person_type.lower() == "fellow":
-            accommodation_rooms = [
-                room for room in self.rooms if room._type is "living_space"]
-            for living_room in accommodation_rooms:
-                if not living_room.fully_occupied:
-                    add_person_to_room(person, living_room)
-                    person.has_living_space = True
-                    rooms.append({"living_space": living_room.name})
-                    print(
-                        colorful.green(
-                            "{0} has been allocated the living space {1}"
-                            .format(
-                                first_name,
-                                living_room.name)))
-                    break
-            if not person.has_living_space:
-                print(
-                    colorful.red(
-                        "Sorry, there are no more free accommodation rooms"
-                        "for {0} to occupy."
-                        .format(first_name)))
-        person.rooms_occupied = rooms
+        if wants_accommodation == "Y" and person_type.lower() == "fellow":
+            living_room = self._allocate_living_space(person)
+            if living_room:
+                rooms.append({"living_space": living_room.name})
+                self.output.emit(
+                    "green", "living_space_allocated",
+                    "{first_name} has been allocated the living space "
+                    "{room_name}", first_name=first_name,
+                    person_id=person.id_, room_name=living_room.name)
+            else:
+                self.output.emit(
+                    "red", "no_living_space",
+                    "Sorry, there are no more free accommodation rooms"
+                    "for {first_name} to occupy.",
+                    first_name=first_name, person_id=person.id_)
+                if self.waitlists is not None:
+                    self.output.emit(
+                        "orange", "waitlisted",
+                        "{first_name} has been added to the living space "
+                        "waitlist", first_name=first_name,
+                        person_id=person.id_, room_type="living_space")
         return {
             "Person": person.first_name +
             " " +
             person.last_name,
             "Rooms": rooms}
 
+    def _new_person_id(self):
+        """Generates the id of the next person added"""
+
+        return len(self.people) + 1
+
+    def _create_person(
+            self, first_name, last_name, person_type, wants_accommodation):
+        """Creates and registers a person without allocating any room"""
+
+        person_id = self._new_person_id()
+        person = Staff(first_name, last_name, person_id) \
+            if person_type.lower() == "staff" else Fellow(
+                first_name, last_name, wants_accommodation, person_id)
+        self._register_person(person)
+        return person
+
+    def _allocate_office(self, person):
+        """Allocates a vacant office picked by the office strategy
+
+        Returns:
+            Room: The allocated office or None if all offices are full
+        """
+
+        return self._reserve(person, "office")
+
+    def _allocate_living_space(self, person):
+        """Allocates a vacant living space picked by its strategy
+
+        Returns:
+            Room: The allocated living space or None if all of them are full
+        """
+
+        return self._reserve(person, "living_space")
+
+    def _reserve(self, person, room_type):
+        """Picks a vacant room of a type and moves a person into it
+
+        People who get no room join the waitlist of the room type, if there
+        is one.
+
+        Returns:
+            Room: The room taken or None if every room of the type is full
+        """
+
+        room = self._pick_room(room_type)
+        if room:
+            self._add_to_room(person, room)
+        elif self.waitlists is not None:
+            self.waitlists[room_type].append(person)
+        return room
+
+    def _drain_waitlist(self, room_type):
+        """Allocates waiting people while rooms of a type have free slots
+
+        People who got a room of the type some other way since joining the
+        waitlist are skipped, so the cost is one step per freed slot plus
+        one per such person.
+
+        Returns:
+            int: Number of people allocated from the waitlist
+        """
+
+        if not self.waitlists:
+            return 0
+        waitlist = self.waitlists[room_type]
+        allocated = 0
+        while waitlist:
+            room = self._pick_room(room_type)
+            if room is None:
+                break
+            person = waitlist.popleft()
+            if getattr(person, room_type) is not None:
+                continue
+            self._add_to_room(person, room)
+            allocated += 1
+            self.output.emit(
+                "green", "waitlist_allocated",
+                "{full_name} has been allocated the {room_type_name} "
+                "{room_name} from the waitlist",
+                full_name=person.get_fullname(), person_id=person.id_,
+                room_type_name=room_type.replace("_", " "),
+                room_name=room.name)
+        return allocated
+
+    def _pick_room(self, room_type, excluded_room=None):
+        """Picks a vacant room of a type using the strategy for that type
+
+        Args:
+            room_type (str): office or living_space
+            excluded_room (Room): Room that must not be picked
+
+        Returns:
+            Room: The chosen room or None if no room is available
+        """
+
+        vacancies = self.vacancies[room_type]
+        if excluded_room is not None:
+            vacancies.discard(excluded_room)
+        room = self.strategies[room_type].pick(vacancies)
+        if excluded_room is not None:
+            vacancies.update(excluded_room)
+        return room
+
+    def allocate_batch(self, people):
+        """Adds a whole cohort of people and allocates them together
+
+        Every office slot is open to every person, so as many people as
+        there are free slots get an office (and living space for fellows who
+        want one). Each slot goes to the least occupied vacant room so the
+        cohort is spread evenly over the rooms instead of at random.
+
+        Args:
+            people: Iterable of (first_name, last_name, person_type) or
+                (first_name, last_name, person_type, wants_accommodation)
+
+        Returns:
+            dict[]: Person and Rooms of everyone added, as add_person returns
+        """
+
+        cohort, rejected = [], []
+        for entry_no, person_data in enumerate(people, 1):
+            person_data = list(person_data)
+            error = validate_person_data(person_data)
+            if error:
+                rejected.append((entry_no, error))
+                continue
+            wants_accommodation = person_data[3].upper() \
+                if len(person_data) == 4 else "N"
+            cohort.append(self._create_person(
+                person_data[0], person_data[1], person_data[2],
+                wants_accommodation))
+
+        needs_living_space = [
+            person for person in cohort
+            if person.wants_accommodation == "Y" and person._type == "fellow"]
+        offices = self._fill_evenly("office", cohort)
+        living_spaces = self._fill_evenly("living_space", needs_living_space)
+
+        results = [{"Person": person.get_fullname(),
+                    "Rooms": person.rooms_occupied} for person in cohort]
+
+        self.output.emit(
+            "blue", "batch_allocated",
+            "{added} people added: {offices} allocated offices, "
+            "{living_spaces} of {wanted} allocated living spaces, "
+            "{rejected_count} rejected", added=len(cohort),
+            offices=len(offices), living_spaces=len(living_spaces),
+            wanted=len(needs_living_space), rejected_count=len(rejected),
+            rejected=rejected)
+        for entry_no, error in rejected:
+            self.output.emit(
+                "orange", "entry_rejected", "  entry {entry}: {error}",
+                entry=entry_no, error=error)
+        return results
+
+    def _fill_evenly(self, room_type, people):
+        """Assigns people to the least occupied vacant rooms of a type
+
+        People left without a room join the waitlist of the type, if there
+        is one.
+
+        Returns:
+            dict: Room assigned to each person that could be placed
+        """
+
+        heap = [(len(room.residents), order, room)
+                for order, room in enumerate(self.vacancies[room_type])]
+        heapq.heapify(heap)
+        assigned = {}
+        for person in people:
+            if not heap:
+                if self.waitlists is not None:
+                    self.waitlists[room_type].append(person)
+                continue
+            occupants, order, room = heapq.heappop(heap)
+            self._add_to_room(person, room)
+            assigned[person] = room
+            if occupants + 1 < room.maximum_no_of_people:
+                heapq.heappush(heap, (occupants + 1, order, room))
+        return assigned
+
     def print_room(self, room_name):
         """Prints all the people in a room """
 
-        if room_name in [room.name for room in self.rooms]:
-            # output = "\n".join(get_residents
-            # (find_room(self.rooms, room_name)))
-            print(
-                colorful.blue(
-                    "People in Room: " +
-                    room_name +
-                    "\n -----------------------------------"
-                    "---------------------------------"))
-            print(
-                colorful.blue(
-                    ", ".join(
-                        get_residents(find_room(self.rooms, room_name)))))
-            return get_residents(find_room(self.rooms, room_name))
+        if room_name in self.rooms_by_name:
+            room = find_room(self.rooms_by_name, room_name)
+            residents = get_residents(room)
+            self.output.emit(
+                "blue", "room_header",
+                "People in Room: {room_name}"
+                "\n -----------------------------------"
+                "---------------------------------", room_name=room_name)
+            self.output.emit(
+                "blue", "room_residents", lambda: ", ".join(residents),
+                room_name=room_name, residents=residents)
+            return residents
         else:
-            print(
-                colorful.red(
-                    room_name +
-                    " does not exist in the system."
-                    "Please change name and try again!"))
+            self.output.emit(
+                "red", "unknown_room",
+                "{room_name} does not exist in the system."
+                "Please change name and try again!", room_name=room_name)
             return []
 
-    def print_allocations(self, file_name=None, print_table="N"):
-        """Prints the people and respective rooms"""
+    def print_allocations(self, file_name=None, print_table="N",
+                          output_format=None, compress=None):
+        """Prints the people and respective rooms
+
+        Rooms are printed, or written to resources/<file_name>, one at a
+        time as they are read so the report is never built up in memory.
+
+        Args:
+            file_name (str): File to write the report to
+            print_table (str): Y prints a table of people and their rooms
+            output_format (str): Format of the file, text, csv or jsonl.
+                Guessed from the file extension when left out.
+            compress (bool): Gzip the file, the default for names ending .gz
 
-        if print_table is "N":
-            rooms_people = []
-            printed_output = ""
+        Returns:
+            list: Names of the residents keyed by room name, one dict per
+            room, when printed on the screen. Name, type, office and living
+            space of every allocated person when printed as a table. None
+            when written to a file, which is never held in memory.
+        """
+
+        from .reports import allocation_text, write_allocations
+
+        if print_table == "N":
+            if file_name:
+                try:
+                    write_allocations(
+                        self.rooms, "resources/" + file_name, output_format,
+                        compress)
+                except ValueError as exception:
+                    self.output.emit(
+                        "red", "unknown_format", str(exception),
+                        file_name=file_name)
+                return None
+            if not self.rooms:
+                self.output.emit(
+                    "orange", "no_allocations",
+                    "There are no people allocated to "
+                    "any rooms at the moment")
             for room in self.rooms:
-                people = [(person.get_fullname()).upper()
-                          for person in room.residents]
-                rooms_people.append({room.name: people})
-                output = "Room: {0} \n ------\n{1}\n\n".format(
-                    room.name, ",".join(people))
-                printed_output += output
-            if not file_name:
-                if printed_output:
-                    print(colorful.blue(printed_output))
-                else:
-                    print(
-                        colorful.orange("There are "
-                                        "no people allocated to "
-                                        "any rooms at the moment"))
-            else:
-                file = open("resources/" + file_name, "w")
-                file.write(str(printed_output))
-                file.close()
-            return rooms_people
+                self.output.emit(
+                    "blue", "allocation",
+                    lambda room=room: allocation_text(room).rstrip("\n")
+                    + "\n", room_name=room.name)
+            return [{room.name: [person.get_fullname().upper()
+                                 for person in room.residents]}
+                    for room in self.rooms]
         else:
-            allocated_people = \
-                [person for person in self.people if person.rooms_occupied]
-            if allocated_people:
-                table = PrettyTable(['Name', 'Type', 'Office', 'Living Space'])
-                for person in allocated_people:
-                    office_name, living_space_name \
-                     = "Not Assigned", "Not Assigned"
-                    for room_occupied in range(0, len(person.rooms_occupied)):
-                        if "office" in person.rooms_occupied[room_occupied]:
-                            office_name = \
-                                person.rooms_occupied[room_occupied]['office']
-                        if "living_space" in\
-                                person.rooms_occupied[room_occupied]:
-                            living_space_name \
-                                = person.rooms_occupied[room_occupied]['living_space']
-                    table.add_row(
-                        [person.get_fullname(),
-                         person._type, office_name, living_space_name])
-                print(
-                    colorful.blue(
-                        "List showing people with space "
-                        "and their respective rooms"))
-                print(colorful.blue(table))
+            rows = []
+            for person in self.people:
+                if person.office is None and person.living_space is None:
+                    continue
+                office_name = person.office.name \
+                    if person.office is not None else "Not Assigned"
+                living_space_name = person.living_space.name \
+                    if person.living_space is not None else "Not Assigned"
+                rows.append(
+                    [person.get_fullname(),
+                     person._type, office_name, living_space_name])
+            if rows:
+                self.output.emit(
+                    "blue", "allocations_header",
+                    "List showing people with space "
+                    "and their respective rooms")
+                self.output.emit(
+                    "blue", "allocations_table",
+                    lambda: make_table(
+                        ['Name', 'Type', 'Office', 'Living Space'], rows),
+                    rows=rows)
             else:
-                print(
-                    colorful.orange("There are no people allocated"
-                                    " to any rooms at the moment"))
-
-    def print_unallocated(self):
-        """Prints unallocated people along with the missing room type"""
-
-        unallocated_people = []
-        unallocated_table = PrettyTable(['Name', 'Person id', 'Missing'])
-        for person in self.people:
-            if person.wants_accommodation is "N":
-                if not person.has_office:
-                    unallocated_people.append(
-                        {"Name": person.get_fullname(), "Missing": "Office"})
-                    unallocated_table.add_row(
-                        [person.get_fullname(), person.id_, "Office"])
-            else:
-                if not person.has_office and not person.has_living_space:
-                    unallocated_people.append(
-                        {"Name": person.get_fullname(),
-                         "Missing": "Office and Living Space"})
-                    unallocated_table.add_row(
-                        [person.get_fullname(), person.id_,
-                         "Office and Living Space"])
-                elif not person.has_office and person.has_living_space:
-                    unallocated_people.append(
-                        {"Name": person.get_fullname(), "Missing": "Office"})
-                    unallocated_table.add_row(
-                        [person.get_fullname(), person.id_, "Office"])
-                elif person.has_office and not person.has_living_space:
-                    unallocated_people.append(
-                        {"Name": person.get_fullname(),
-                         "Missing": "Living Space"})
-                    unallocated_table.add_row(
-                        [person.get_fullname(), person.id_, "Living Space"])
-        print(colorful.blue("Table showing people along with missing rooms"))
-        print(colorful.blue(unallocated_table))
-
-    def load_people(self, file):
-        """Loads the people from the text file to the system"""
-
-        if os.path.isfile(file):
-            file = open(file, "r")
-            for line in file:
+                self.output.emit(
+                    "orange", "no_allocations",
+                    "There are no people allocated"
+                    " to any rooms at the moment")
+            return rows
+
+    def print_unallocated(self, file_name=None):
+        """Prints unallocated people along with the missing room type
+
+        People are read from the unallocated index, so the cost depends on
+        the number of unallocated people only.
+
+        Args:
+            file_name (str): When given the list is streamed to
+                resources/<file_name> a line at a time instead of printed
+                on the screen
+
+        Returns:
+            dict[]: Name, Person id and Missing room of every person listed,
+            None when written to a file
+        """
+
+        rows = self._unallocated_rows()
+        if file_name:
+            write_unallocated(rows, "resources/" + file_name)
+            return None
+        unallocated_people = list(rows)
+        self.output.emit(
+            "blue", "unallocated_header",
+            "Table showing people along with missing rooms")
+        self.output.emit(
+            "blue", "unallocated_table",
+            lambda: make_table(
+                ['Name', 'Person id', 'Missing'],
+                [[row["Name"], row["Person id"], row["Missing"]]
+                 for row in unallocated_people]),
+            unallocated=unallocated_people)
+        return unallocated_people
+
+    def _unallocated_rows(self):
+        """Yields Name, Person id and Missing of every unallocated person"""
+
+        for person_id in sorted(self.unallocated):
+            person = self.unallocated[person_id]
+            yield {"Name": person.get_fullname(), "Person id": person_id,
+                   "Missing": missing_rooms(person)}
+
+    def print_utilisation(self):
+        """Prints how full each room type is along with the full rooms
+
+        Returns:
+            dict: Utilisation of each room type
+        """
+
+        usage, full_rooms = self.utilisation()
+        for room_type, figures in usage.items():
+            self.output.emit(
+                "blue", "utilisation",
+                "{room_type}: {residents} of {capacity} slots in use "
+                "({percent:.0%})", room_type=room_type,
+                percent=figures["ratio"], **figures)
+        self.output.emit(
+            "blue", "full_rooms", lambda: "Full rooms: " + (
+                ", ".join(full_rooms) if full_rooms else "none"),
+            full_rooms=full_rooms)
+        return usage
+
+    def utilisation(self):
+        """Counts the residents and capacity of each room type in one pass
+
+        Returns:
+            (dict, str[]): residents, capacity and ratio of occupied slots
+            keyed by room type, and the names of the full rooms
+        """
+
+        usage = {room_type: {"residents": 0, "capacity": 0}
+                 for room_type in ("office", "living_space")}
+        full_rooms = []
+        for room in self.rooms:
+            figures = usage[room._type]
+            figures["residents"] += len(room.residents)
+            figures["capacity"] += room.maximum_no_of_people
+            if room.fully_occupied:
+                full_rooms.append(room.name)
+        for figures in usage.values():
+            figures["ratio"] = figures["residents"] / figures["capacity"] \
+                if figures["capacity"] else 0.0
+        return usage, full_rooms
+
+    def load_people(self, file, batch_size=None):
+        """Loads the people from the text file to the system
+
+        Args:
+            file (str): Path of the people file, or "-" to read from stdin.
+            batch_size (int): When given, people are streamed from the file
+                and allocated in batches of this size. One summary is printed
+                per batch instead of messages for every person.
+
+        Returns:
+            dict: Totals of the streaming import, None otherwise.
+        """
+
+        if file != "-" and not os.path.isfile(file):
+            self.output.emit(
+                "red", "missing_file",
+                "File does not exist! Please specify another file",
+                file_name=file)
+            return
+        lines = sys.stdin if file == "-" else open(file, "r")
+        try:
+            if batch_size:
+                return self._stream_people(lines, int(batch_size))
+            for line in lines:
                 person_data = line.split()
                 if len(person_data) == 4:
                     self.add_person(
@@ -291,239 +751,452 @@ class Dojo(object):
                 else:
                     self.add_person(
                         person_data[0], person_data[1], person_data[2])
-            file.close()
-        else:
-            print(colorful.red("File does not exist! "
-                               "Please specify another file"))
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+
+    def _stream_people(self, lines, batch_size):
+        """Validates and allocates people from lines in batches
+
+        People who could not get every room they need are counted as
+        waitlisted when the dojo keeps a waitlist and unallocated otherwise.
+        """
+
+        pending = "waitlisted" if self.waitlists is not None \
+            else "unallocated"
+        totals = {"added": 0, "allocated": 0, pending: 0, "rejected": []}
+        records = parse_people(lines)
+        batch_no = 0
+        while True:
+            batch = list(itertools.islice(records, batch_size))
+            if not batch:
+                break
+            batch_no += 1
+            summary = {"added": 0, "allocated": 0, pending: 0,
+                       "rejected": []}
+            for line_no, person_data in batch:
+                error = validate_person_data(person_data)
+                if error:
+                    summary["rejected"].append((line_no, error))
+                    continue
+                first_name, last_name, person_type = person_data[:3]
+                wants_accommodation = person_data[3].upper() \
+                    if len(person_data) == 4 else "N"
+                person = self._create_person(
+                    first_name, last_name, person_type, wants_accommodation)
+                summary["added"] += 1
+                office = self._allocate_office(person)
+                needs_living_space = wants_accommodation == "Y" and \
+                    person._type == "fellow"
+                living_space = self._allocate_living_space(person) \
+                    if needs_living_space else None
+                if office and (living_space or not needs_living_space):
+                    summary["allocated"] += 1
+                else:
+                    summary[pending] += 1
+            self.output.emit(
+                "blue", "batch_loaded",
+                "Batch {batch} (lines {first_line}-{last_line}): {added} "
+                "added, {allocated} allocated, {" + pending + "} " + pending +
+                ", {rejected_count} rejected", batch=batch_no,
+                first_line=batch[0][0], last_line=batch[-1][0],
+                rejected_count=len(summary["rejected"]), **summary)
+            for line_no, error in summary["rejected"]:
+                self.output.emit(
+                    "orange", "line_rejected", "  line {line}: {error}",
+                    line=line_no, error=error)
+            for key in ("added", "allocated", pending):
+                totals[key] += summary[key]
+            totals["rejected"].extend(summary["rejected"])
+        return totals
 
-    def reallocate_person(self, person_id, new_room_name):
-        """Reallocates person from one room to another"""
+    def reallocate_person(self, person_id, new_room_name=None,
+                          room_type="office"):
+        """Reallocates person from one room to another
 
-        if person_id in [person.id_ for person in self.people]:
-            person = find_person(self.people, person_id)
-            new_room = find_room(self.rooms, new_room_name)
+        Args:
+            person_id (int): Id of the person to move
+            new_room_name (str): Room to move the person to. When left out
+                the strategy for room_type picks a room other than the
+                person's current one.
+            room_type (str): Type of room picked when new_room_name is None
+        """
+
+        if person_id in self.people_by_id and new_room_name is None:
+            person = find_person(self.people_by_id, person_id)
+            new_room = self._pick_room(
+                room_type, getattr(person, room_type))
+            if new_room is None:
+                self.output.emit(
+                    "red", "no_vacant_room",
+                    "There is no other {room_type} with free space to move "
+                    "person {person_id} to", room_type=room_type,
+                    person_id=person_id)
+                return
+            new_room_name = new_room.name
+        if person_id in self.people_by_id and \
+                new_room_name not in self.rooms_by_name:
+            self.output.emit(
+                "red", "unknown_room",
+                "{room_name} does not exist in the system."
+                "Please change name and try again!", room_name=new_room_name)
+            return
+        if person_id in self.people_by_id:
+            person = find_person(self.people_by_id, person_id)
+            new_room = find_room(self.rooms_by_name, new_room_name)
             if not new_room.fully_occupied:
-                if new_room._type is "office":
-                    old_office = [elem['office']
-                                  for elem in person.rooms_occupied
-                                  if 'office' in elem]
-                    if not old_office:
-                        add_person_to_room(person, new_room)
-                        person.rooms_occupied.append({'office': new_room_name})
-                        person.has_office = True
-                        print(colorful.green(
-                            person.get_fullname().capitalize() +
-                            " has been assigned to room " +
-                            new_room.name))
+                if new_room._type == "office":
+                    current_room = person.office
+                    if current_room is None:
+                        self._add_to_room(person, new_room)
+                        self.output.emit(
+                            "green", "person_assigned",
+                            "{full_name} has been assigned to room "
+                            "{room_name}",
+                            full_name=person.get_fullname().capitalize(),
+                            person_id=person_id, room_name=new_room.name)
                     else:
-                        current_room = find_room(self.rooms, old_office[0])
                         if current_room.name == new_room_name:
-                            print(colorful.red(
+                            self.output.emit(
+                                "red", "same_room",
                                 "Can not reallocate to the same room. "
                                 "Please specify another room name and "
-                                "try again!"))
+                                "try again!", person_id=person_id,
+                                room_name=new_room_name)
                             return
                         if new_room._type != current_room._type:
-                            print(colorful.red(
+                            self.output.emit(
+                                "red", "different_room_type",
                                 "Can not reallocate to different room type. \
-                                Please specify another type and try again!"))
+                                Please specify another type and try again!",
+                                person_id=person_id, room_name=new_room_name)
                             return
-                        remove_person(person, current_room)
-                        add_person_to_room(person, new_room)
-                        for elem in person.rooms_occupied:
-                            if 'office' in elem:
-                                elem['office'] = new_room_name
-                        print(
-                            colorful.green(
-                                "{0} {1} has been successfully reallocated "
-                                "to room {2}".format(
-                                    person.first_name,
-                                    person.last_name,
-                                    new_room_name)))
+                        self._remove_from_room(person, current_room)
+                        self._add_to_room(person, new_room)
+                        self._drain_waitlist(current_room._type)
+                        self.output.emit(
+                            "green", "person_reallocated",
+                            "{first_name} {last_name} has been successfully "
+                            "reallocated to room {room_name}",
+                            first_name=person.first_name,
+                            last_name=person.last_name,
+                            person_id=person_id, room_name=new_room_name)
                 else:
-                    old_living_space = [
-                        elem['living_space']
-                        for elem in person.rooms_occupied
-                        if 'living_space' in elem]
-                    if not old_living_space:
-                        add_person_to_room(person, new_room)
-                        person.rooms_occupied.append(
-                            {'living_space': new_room_name})
-                        person.has_living_space = True
-                        print(
-                            colorful.green(
-                                person.get_fullname().capitalize() +
-                                " has been assigned to room " +
-                                new_room.name))
+                    current_room = person.living_space
+                    if current_room is None:
+                        self._add_to_room(person, new_room)
+                        self.output.emit(
+                            "green", "person_assigned",
+                            "{full_name} has been assigned to room "
+                            "{room_name}",
+                            full_name=person.get_fullname().capitalize(),
+                            person_id=person_id, room_name=new_room.name)
                     else:
-                        current_room = find_room(
-                            self.rooms, old_living_space[0])
                         if current_room.name == new_room_name:
-                            print(colorful.red(
+                            self.output.emit(
+                                "red", "same_room",
                                 "Can not reallocate to the same room. \
-                                Please specify room name and try again."))
+                                Please specify room name and try again.",
+                                person_id=person_id, room_name=new_room_name)
                             return
                         if new_room._type != current_room._type:
-                            print(colorful.red(
+                            self.output.emit(
+                                "red", "different_room_type",
                                 "Can not reallocate to different room type. \
-                                Please specify another type and try again."))
+                                Please specify another type and try again.",
+                                person_id=person_id, room_name=new_room_name)
                             return
-                        remove_person(person, current_room)
-                        add_person_to_room(person, new_room)
-                        for elem in person.rooms_occupied:
-                            if 'living_space' in elem:
-                                elem['living_space'] = new_room_name
-                        print(
-                            colorful.green(
-                                "{0} {1} has been successfully reallocated"
-                                " to room {2}".format(
-                                    person.first_name,
-                                    person.last_name,
-                                    new_room_name)))
+                        self._remove_from_room(person, current_room)
+                        self._add_to_room(person, new_room)
+                        self._drain_waitlist(current_room._type)
+                        self.output.emit(
+                            "green", "person_reallocated",
+                            "{first_name} {last_name} has been successfully "
+                            "reallocated to room {room_name}",
+                            first_name=person.first_name,
+                            last_name=person.last_name,
+                            person_id=person_id, room_name=new_room_name)
             else:
-                print(
-                    colorful.red(
-                        "Room: " +
-                        new_room.name +
-                        "is fully occupied. Please change room and try again"))
+                self.output.emit(
+                    "red", "room_full",
+                    "Room: {room_name}is fully occupied. "
+                    "Please change room and try again",
+                    person_id=person_id, room_name=new_room.name)
         else:
-            print(
-                colorful.red(
-                    "Person with person id " +
-                    person_id +
-                    " does not exist in the system."
-                    "Please change id and try again"))
+            self.output.emit(
+                "red", "unknown_person",
+                "Person with person id {person_id} does not exist in the "
+                "system.Please change id and try again", person_id=person_id)
+
+    def reallocate_many(self, moves):
+        """Reallocates many people at once, either all of them or none
+
+        The whole plan is checked before anyone moves, see plan_moves, so
+        people can swap between full rooms or move round a cycle of them.
+        When any move is invalid nobody is moved and every invalid move is
+        reported. Otherwise everyone moving leaves their room and then
+        everyone moves in, and should a move still fail every step taken
+        is undone. Rooms and people are found through rooms_by_name and
+        people_by_id, so the cost is O(moves).
+
+        Args:
+            moves: Iterable of (person_id, room_name)
+
+        Returns:
+            dict: Number of people moved and (entry_no, error) of every
+            invalid move
+        """
+
+        moves = list(moves)
+        plan, rejected = self._plan_moves(
+            (entry_no, person_id, room_name)
+            for entry_no, (person_id, room_name) in enumerate(moves, 1))
+        if rejected:
+            self.output.emit(
+                "red", "reallocation_rejected",
+                "Nobody has been reallocated, {rejected_count} of {moves} "
+                "moves are invalid", rejected_count=len(rejected),
+                moves=len(moves), rejected=rejected)
+            for entry_no, error in rejected:
+                self.output.emit(
+                    "orange", "move_rejected", "  move {entry}: {error}",
+                    entry=entry_no, error=error)
+            return {"moved": 0, "rejected": rejected}
+
+        steps = []
+        try:
+            for _, person_id, current, _, _ in plan:
+                if current is not None:
+                    person = self.people_by_id[person_id]
+                    room = self.rooms_by_name[current]
+                    self._remove_from_room(person, room)
+                    steps.append((person, room, False))
+            for _, person_id, _, room_name, _ in plan:
+                person = self.people_by_id[person_id]
+                room = self.rooms_by_name[room_name]
+                if not self._add_to_room(person, room):
+                    self._undo_moves(steps)
+                    self.output.emit(
+                        "red", "reallocation_failed",
+                        "Nobody has been reallocated, {room_name} filled up "
+                        "while moving people", room_name=room_name)
+                    return {"moved": 0, "rejected": []}
+                steps.append((person, room, True))
+        except BaseException:
+            self._undo_moves(steps)
+            raise
+
+        for room_type in {move[4] for move in plan}:
+            self._drain_waitlist(room_type)
+        self.output.emit(
+            "green", "people_reallocated",
+            "{moved} people have been successfully reallocated",
+            moved=len(plan))
+        return {"moved": len(plan), "rejected": []}
+
+    def _plan_moves(self, moves):
+        """Checks (entry_no, person_id, room_name) moves, see plan_moves"""
+
+        def room_type_of(room_name):
+            room = self.rooms_by_name.get(room_name)
+            return room._type if room is not None else None
+
+        def current_room(person_id, room_type):
+            room = getattr(self.people_by_id[person_id], room_type)
+            return room.name if room is not None else None
+
+        def free_slots(room_name):
+            room = self.rooms_by_name[room_name]
+            return room.maximum_no_of_people - len(room.residents)
+
+        return plan_moves(moves, self.people_by_id.__contains__,
+                          room_type_of, current_room, free_slots)
+
+    def _undo_moves(self, steps):
+        """Reverts (person, room, added) steps, the latest first"""
+
+        for person, room, added in reversed(steps):
+            if added:
+                self._remove_from_room(person, room)
+            else:
+                self._add_to_room(person, room)
 
     def save_state(self, db_file=None):
-        """Saves all the data in the system to a file specified"""
+        """Saves all the data in the system to a file specified
 
-        connection = sqlite3.connect(
-            ":memory:") \
-            if not db_file else sqlite3.connect("resources/" + db_file)
+        Only the rooms and people that changed since the last save to the
+        same file are written. Saving to any other file rewrites it with the
+        full state of the dojo.
+        """
+
+        import sqlite3
+
+        path = "resources/" + db_file if db_file else ":memory:"
+        connection = sqlite3.connect(path)
+        create_schema(connection)
         cursor = connection.cursor()
 
-        # Create Room table
-        cursor.execute('''CREATE TABLE IF NOT EXISTS room
-                     (room_name text, room_type text,
-                      occupation_status text)''')
+        full_save = path == ":memory:" or \
+            os.path.abspath(path) != self._saved_to
+        rooms = self.rooms if full_save else list(self._dirty_rooms)
+        people = self.people if full_save else list(self._dirty_people)
 
-        # Save room data
-        room_data = []
-        for room in self.rooms:
-            room_data.append(
-                (room.name, room._type, room.fully_occupied))
-        cursor.executemany("INSERT INTO room VALUES (?,?,?)", room_data)
-
-        # Create Person table
-        cursor.execute('''CREATE TABLE IF NOT EXISTS person
-                     (person_id INTEGER, first_name text,
-                     last_name text, person_type text,
-                     has_living_space text, has_office text,
-                     wants_accommodation text
-                     )''')
-
-        # Save person data
-        person_data = []
-        for person in self.people:
-            person_data.append(
-                (person.id_,
-                 person.first_name,
-                 person.last_name,
-                 person._type,
-                 person.has_living_space,
-                 person.has_office,
-                 person.wants_accommodation))
-        cursor.executemany(
-            "INSERT INTO person VALUES (?,?,?,?,?,?,?)",
-            person_data)
-
-        # Create room_person relationship table table
-        cursor.execute('''CREATE TABLE IF NOT EXISTS room_person
-                     (person_id INTEGER, room_name text, room_type text)''')
-
-        # Save room_person data
-        room_person_data = []
-        for person in self.people:
-            for room_occupied in range(0, len(person.rooms_occupied)):
-                if "office" in person.rooms_occupied[room_occupied]:
-                    room_person_data.append(
-                        (person.id_,
-                         person.rooms_occupied[room_occupied]['office'],
-                         "office"))
-                if "living_space" in person.rooms_occupied[room_occupied]:
-                    room_person_data.append(
-                        (person.id_,
-                         person.rooms_occupied[room_occupied]['living_space'],
-                         "living_space"))
-
-        cursor.executemany(
-            "INSERT INTO room_person VALUES (?,?,?)",
-            room_person_data)
-
-        # Save (commit) the changes
-        connection.commit()
+        with connection:
+            if full_save:
+                for table in ("room_person", "person", "room"):
+                    cursor.execute("DELETE FROM " + table)
+
+            # Save room data
+            cursor.executemany(
+                UPSERT_ROOM,
+                [(room.name, room._type, room.fully_occupied)
+                 for room in rooms])
+
+            # Save person data
+            cursor.executemany(
+                UPSERT_PERSON,
+                [(person.id_,
+                  person.first_name,
+                  person.last_name,
+                  person._type,
+                  person.has_living_space,
+                  person.has_office,
+                  person.wants_accommodation) for person in people])
+
+            # Save room_person data
+            room_person_data = []
+            vacated_data = []
+            for person in people:
+                for room_type in ("office", "living_space"):
+                    room = getattr(person, room_type)
+                    if room is not None:
+                        room_person_data.append(
+                            (person.id_, room.name, room_type))
+                    elif not full_save:
+                        vacated_data.append((person.id_, room_type))
+            cursor.executemany(DELETE_ROOM_PERSON, vacated_data)
+            cursor.executemany(UPSERT_ROOM_PERSON, room_person_data)
         connection.close()
 
+        self._saved_to = None if path == ":memory:" \
+            else os.path.abspath(path)
+        self._dirty_rooms.clear()
+        self._dirty_people.clear()
+
     def load_state(self, db_file=None):
-        """Loads application data from a db file to the application"""
+        """Loads application data from a db file to the application
+
+        Rooms and people are rebuilt directly from their rows and residents
+        are resolved through the name and id indexes, so loading is linear in
+        the size of the database. Rooms or people already in the dojo are
+        kept as they are, and people of the database whose id is already in
+        use are reported with a duplicate_person message.
+        """
+
+        import sqlite3
 
         connection = sqlite3.connect(
             ":memory:") if not db_file else sqlite3.connect(db_file)
         cursor = connection.cursor()
+        # A dojo loaded from scratch matches the file until it changes
+        in_sync = bool(db_file) and not self.rooms and not self.people
+        loaded_rooms, loaded_people, loaded_residents = [], [], 0
+        skipped_ids = []
+        restored_rooms = set()
 
         try:
             # Load Rooms
-            cursor.execute('''SELECT * FROM room''')
-            rooms = cursor.fetchall()
-            for room in rooms:
-                room_name, room_type = room[0], room[1]
-                self.create_room(room_type, room_name)
+            for room_name, room_type, _ in cursor.execute(
+                    '''SELECT * FROM room'''):
+                if room_name in self.rooms_by_name:
+                    continue
+                room = Office(room_name) if room_type.lower() == "office" \
+                    else LivingSpace(room_name)
+                self._register_room(room)
+                loaded_rooms.append(room)
         except BaseException:
-            print(colorful.red(
+            in_sync = False
+            self.output.emit(
+                "red", "load_failed",
                 "The application has failed to load room data, \
-                please contact a senior developer for help."))
+                please contact a senior developer for help.", table="room")
 
         try:
             # Load People
-            cursor.execute('''SELECT * FROM person''')
-            people = cursor.fetchall()
-            for person in people:
-                person_id, first_name, last_name, person_type,\
-                    has_living_space, \
-                    has_office, wants_accommodation \
-                    = person[0], person[1], person[2], person[3],\
-                    person[4], person[5], person[6]
-
+            for person_id, first_name, last_name, person_type, _, _, \
+                    wants_accommodation in cursor.execute(
+                        '''SELECT * FROM person'''):
+                if person_id in self.people_by_id:
+                    skipped_ids.append(person_id)
+                    continue
                 loaded_person = Staff(
                     first_name,
                     last_name,
-                    person_id,
-                    has_living_space,
-                    has_office) if person_type is "Staff" else Fellow(
+                    person_id) if person_type.lower() == "staff" else Fellow(
                         first_name,
                         last_name,
                         wants_accommodation,
-                        person_id,
-                        has_living_space,
-                        has_office)
-                self.people.append(loaded_person)
+                        person_id)
+                self._register_person(loaded_person)
+                loaded_people.append(loaded_person)
         except BaseException:
-            print(colorful.red(
+            in_sync = False
+            self.output.emit(
+                "red", "load_failed",
                 "The application has failed to load person data, \
-                please contact a senior developer for help."))
+                please contact a senior developer for help.", table="person")
 
         try:
             # Load Residents
-            cursor.execute('''SELECT * FROM room_person''')
-            room_person_data = cursor.fetchall()
-            for room_person in room_person_data:
-                person_id, room_name, room_type = int(
-                    room_person[0]), room_person[1], room_person[2]
-                related_room = find_room(self.rooms, room_name)
-                related_person = find_person(self.people, person_id)
-                related_room.residents.append(related_person)
-                related_person.rooms_occupied.append({room_type: room_name})
+            new_people = {person.id_ for person in loaded_people}
+            restored_rooms = set(loaded_rooms)
+            for person_id, room_name, room_type in cursor.execute(
+                    '''SELECT * FROM room_person ORDER BY rowid'''):
+                person_id = int(person_id)
+                if person_id not in new_people:
+                    continue
+                related_room = find_room(self.rooms_by_name, room_name)
+                related_person = find_person(self.people_by_id, person_id)
+                # Databases saved before room_person had a key may list a
+                # person in several rooms of a type, or a room more than once
+                if not add_person_to_room(related_person, related_room):
+                    in_sync = False
+                    continue
+                restored_rooms.add(related_room)
+                if self.journal is not None:
+                    self.journal.append(
+                        ["A", person_id, room_name])
+                loaded_residents += 1
         except BaseException:
-            print(colorful.red(
-                "The application has failed to load relationship between person and room, \
-                Please contact a senior developer for help."))
+            in_sync = False
+            self.output.emit(
+                "red", "load_failed",
+                "The application has failed to load relationship between "
+                "person and room, Please contact a senior developer for "
+                "help.",
+                table="room_person")
+        connection.close()
+
+        # Occupancy follows the residents actually restored
+        for person in loaded_people:
+            self._refresh_unallocated(person)
+        for room in restored_rooms:
+            self.vacancies[room._type].update(room)
+
+        self.output.emit(
+            "green", "state_loaded",
+            "Loaded {rooms} rooms, {people} people and {residents} "
+            "allocations", rooms=len(loaded_rooms), people=len(loaded_people),
+            residents=loaded_residents, db_file=db_file)
+        if skipped_ids:
+            self.output.emit(
+                "orange", "duplicate_person",
+                "{skipped} people were not loaded as their ids are already "
+                "in use: {ids}", skipped=len(skipped_ids),
+                ids=", ".join(str(person_id) for person_id in skipped_ids),
+                person_ids=skipped_ids)
+
+        if in_sync:
+            self._saved_to = os.path.abspath(db_file)
+            self._dirty_rooms.clear()
+            self._dirty_people.clear()
@@ -12,17 +12,17 @@ class Fellow(Person):
 
     """
 
+    __slots__ = ()
+
     def __init__(self, first_name, last_name, wants_accommodation,
-                 person_id, has_living_space=None, has_office=None):
+                 person_id):
         super(
             Fellow,
             self).__init__(
             first_name,
             last_name,
             wants_accommodation,
-            person_id,
-            has_living_space,
-            has_office)
+            person_id)
         self.set_type()
 
     def set_type(self):
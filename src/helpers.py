@@ -1,3 +1,12 @@
+import collections.abc
+
+# Reasons given by load_rooms for names that create_rooms rejected
+REJECTIONS = {
+    "duplicate_room": "room name already exists",
+    "invalid_room_name": "room name must only contain letters",
+}
+
+
 def get_residents(room):
     """Get people in room
 
@@ -22,40 +31,244 @@ def remove_person(person, room):
         True if successful, False otherwise.
     """
 
-    if person in room.residents:
-        room.residents.remove(person)
-        if room.fully_occupied:
-            room.fully_occupied = None
+    # Person.office or Person.living_space, named after the room type
+    if getattr(person, room._type) is room:
+        del room.residents[person]
+        setattr(person, room._type, None)
         return True
     else:
         return False
 
 
 def find_room(rooms, room_name):
-    """Takes in the room name and returns the room"""
+    """Takes in the room name and returns the room
+
+    Args:
+        rooms (dict || Room[]): Index of rooms keyed by name, as kept by
+            Dojo.rooms_by_name, or a plain list of rooms.
+        room_name (str): Name of the room to look up
 
+    """
+
+    if isinstance(rooms, dict):
+        return rooms[room_name]
     return [room for room in rooms if room_name == room.name][0]
 
 
 def find_person(people, person_id):
-    """Takes in the person_id and returns the person"""
+    """Takes in the person_id and returns the person
+
+    Args:
+        people (dict || Person[]): Index of people keyed by id, as kept by
+            Dojo.people_by_id, or a plain list of people.
+        person_id (int): Id of the person to look up
 
+    """
+
+    if isinstance(people, collections.abc.Mapping):
+        return people[person_id]
     return [person for person in people if person_id == person.id_][0]
 
 
 def add_person_to_room(person, room):
     """ Add person to room
 
+    The person's reference to the room and the room's residents are always
+    changed together, so either can answer who lives where.
+
     Args:
         person (Person): Person to be added to room
         room (Room): Room to which person is to be added
 
+    Returns:
+        True if successful, False if the room is full or the person already
+        has a room of its type.
     """
 
-    if len(room.residents) < room.maximum_no_of_people:
-        room.residents.append(person)
-        if len(room.residents) == room.maximum_no_of_people:
-            room.fully_occupied = True
+    # Person.office or Person.living_space, named after the room type
+    if getattr(person, room._type) is None and \
+            len(room.residents) < room.maximum_no_of_people:
+        room.residents[person] = None
+        setattr(person, room._type, room)
         return True
     else:
         return False
+
+
+def missing_rooms(person):
+    """Describes the rooms a person still needs
+
+    Fellows who want accommodation need a living space on top of an office.
+
+    Returns:
+        str: Office, Living Space or Office and Living Space, None if the
+        person has every room they need
+    """
+
+    needs_office = person.office is None
+    needs_living_space = person.wants_accommodation == "Y" and \
+        person.living_space is None
+    if needs_office and needs_living_space:
+        return "Office and Living Space"
+    if needs_office:
+        return "Office"
+    if needs_living_space:
+        return "Living Space"
+    return None
+
+
+def parse_people(lines):
+    """Lazily splits lines of a people file into fields
+
+    Args:
+        lines: Iterable of lines such as an open file or sys.stdin
+
+    Yields:
+        (int, str[]): Line number and fields of every non blank line
+    """
+
+    for line_no, line in enumerate(lines, 1):
+        person_data = line.split()
+        if person_data:
+            yield line_no, person_data
+
+
+def validate_person_data(person_data):
+    """Checks the fields of a line of a people file
+
+    Args:
+        person_data (str[]): first_name last_name person_type
+            [wants_accommodation]
+
+    Returns:
+        str: Reason for rejecting the line, None if it is valid
+    """
+
+    if len(person_data) not in (3, 4):
+        return "expected <first_name> <last_name> <person_type> " \
+            "[<wants_accommodation>]"
+    if not person_data[0].isalpha() or not person_data[1].isalpha():
+        return "name should only contain alphabetic characters"
+    if person_data[2].lower() not in ("fellow", "staff"):
+        return "person type must be fellow or staff"
+    if len(person_data) == 4 and person_data[3].upper() not in ("Y", "N"):
+        return "wants accommodation must be Y or N"
+    return None
+
+
+def validate_room_data(room_data):
+    """Checks the fields of a line of a rooms file
+
+    Args:
+        room_data (str[]): room_type room_name
+
+    Returns:
+        str: Reason for rejecting the line, None if it is valid
+    """
+
+    if len(room_data) != 2:
+        return "expected a room type and a room name"
+    if room_data[0].lower() not in ("office", "living_space"):
+        return "unknown room type " + room_data[0]
+    return None
+
+
+def plan_moves(moves, person_exists, room_type_of, current_room,
+               free_slots):
+    """Checks a plan of moves as a whole
+
+    The moves are taken to happen at once, so a room only has to fit the
+    people left in it once everyone moving out has gone. Two people can
+    therefore swap between full rooms and people can move round a cycle
+    of full rooms. Each lookup is done once per move, so checking a plan
+    costs O(moves) however big the dojo is.
+
+    Args:
+        moves: Iterable of (entry_no, person_id, room_name)
+        person_exists (callable): Tells whether there is a person with an id
+        room_type_of (callable): Type of the room with a name, None if
+            there is no such room
+        current_room (callable): Name of the room of a type a person is in,
+            None if they have none
+        free_slots (callable): Free slots of the room with a name
+
+    Returns:
+        (list, list): (entry_no, person_id, current_room, room_name,
+        room_type) of every valid move and (entry_no, error) of every
+        invalid one
+    """
+
+    plan, rejected, seen, balance = [], [], set(), {}
+    for entry_no, person_id, room_name in moves:
+        if not person_exists(person_id):
+            rejected.append(
+                (entry_no, "person {0} does not exist".format(person_id)))
+            continue
+        room_type = room_type_of(room_name)
+        if room_type is None:
+            rejected.append(
+                (entry_no, "room {0} does not exist".format(room_name)))
+            continue
+        if (person_id, room_type) in seen:
+            rejected.append((entry_no, "person {0} is moved to more than "
+                             "one {1}".format(person_id,
+                                              room_type.replace("_", " "))))
+            continue
+        seen.add((person_id, room_type))
+        current = current_room(person_id, room_type)
+        if current == room_name:
+            rejected.append((entry_no, "person {0} is already in {1}".format(
+                person_id, room_name)))
+            continue
+        plan.append((entry_no, person_id, current, room_name, room_type))
+        balance[room_name] = balance.get(room_name, 0) + 1
+        if current is not None:
+            balance[current] = balance.get(current, 0) - 1
+
+    overfull = {}
+    for room_name, arrivals in balance.items():
+        if arrivals > 0:
+            slots = free_slots(room_name)
+            if arrivals > slots:
+                overfull[room_name] = (arrivals, slots)
+    for entry_no, person_id, current, room_name, room_type in plan:
+        if room_name in overfull:
+            rejected.append((entry_no, "{0} has {2} free slots for {1} more "
+                             "people".format(room_name,
+                                             *overfull[room_name])))
+    rejected.sort()
+    return plan, rejected
+
+
+def write_unallocated(rows, path):
+    """Writes the unallocated people report a line at a time
+
+    Args:
+        rows: Iterable of dicts with the Name, Person id and Missing room of
+            a person, read once
+        path (str): File to write
+    """
+
+    with open(path, "w") as file:
+        file.write("Name, Person id, Missing\n")
+        for row in rows:
+            file.write("{Name}, {Person id}, {Missing}\n".format(**row))
+
+
+def make_table(field_names, rows):
+    """Renders rows as a table
+
+    Args:
+        field_names (str[]): Column headings
+        rows (list[]): Values of each row
+
+    Returns:
+        str: The table ready to be printed
+    """
+
+    from prettytable import PrettyTable
+
+    table = PrettyTable(field_names)
+    for row in rows:
+        table.add_row(row)
+    return table.get_string()
@@ -0,0 +1,223 @@
+"""class Journal
+
+Append-only write-ahead journal of the changes made to a Dojo. Every room
+created, person added and move in or out of a room is appended as a compact
+JSON array tagged with a log sequence number (LSN). Records describe
+outcomes rather than commands, so replaying them gives the same rooms no
+matter which allocation strategy picked them the first time.
+
+Records are buffered and written in groups with a single fsync per commit.
+Once enough records have been committed the journal is compacted: the state
+of the dojo is written to a snapshot file, which is atomically swapped in,
+and the journal is truncated. Recovery loads the snapshot and replays only
+the journal records newer than it, so its cost is bounded by the size of
+the tail.
+
+Example:
+    To recover a dojo and journal every change made to it, use
+        dojo = Dojo()
+        Journal("resources/dojo.journal").recover(dojo)
+
+Records:
+    ["R", room_name, room_type]             room created
+    ["P", person_id, first_name, last_name, person_type, wants_accommodation]
+                                            person added
+    ["A", person_id, room_name]             person moved into a room
+    ["U", person_id, room_name]             person moved out of a room
+
+Journal lines are [lsn, *record]. A snapshot starts with ["S", lsn], the LSN
+of the last record it includes, followed by the records of the state.
+"""
+
+import json
+import os
+
+from .fellow import Fellow
+from .living_space import LivingSpace
+from .office import Office
+from .staff import Staff
+
+
+def apply(dojo, record):
+    """Replays a single record against a dojo
+
+    Records already reflected in the dojo are ignored.
+    """
+
+    kind = record[0]
+    if kind == "R":
+        _, room_name, room_type = record
+        if room_name not in dojo.rooms_by_name:
+            dojo._register_room(Office(room_name) if room_type == "office"
+                                else LivingSpace(room_name))
+    elif kind == "P":
+        _, person_id, first_name, last_name, person_type, \
+            wants_accommodation = record
+        if person_id not in dojo.people_by_id:
+            dojo._register_person(
+                Staff(first_name, last_name, person_id)
+                if person_type == "staff" else Fellow(
+                    first_name, last_name, wants_accommodation, person_id))
+    else:
+        _, person_id, room_name = record
+        person = dojo.people_by_id[person_id]
+        room = dojo.rooms_by_name[room_name]
+        if kind == "A" and getattr(person, room._type) is None:
+            dojo._add_to_room(person, room)
+        elif kind == "U" and getattr(person, room._type) is room:
+            dojo._remove_from_room(person, room)
+
+
+def state_records(dojo):
+    """Yields the records that rebuild the current state of a dojo"""
+
+    for room in dojo.rooms:
+        yield ["R", room.name, room._type]
+    for person in dojo.people:
+        yield ["P", person.id_, person.first_name, person.last_name,
+               person._type, person.wants_accommodation]
+    for room in dojo.rooms:
+        # A copy, as other threads may move people while a snapshot is taken
+        for person in tuple(room.residents):
+            yield ["A", person.id_, room.name]
+
+
+def _dumps(record):
+    return json.dumps(record, separators=(",", ":")) + "\n"
+
+
+class Journal(object):
+    """ This class is responsible for journaling the changes to a Dojo
+
+    Args:
+        path (str): Journal file. The snapshot is kept in path + ".snapshot"
+        group_size (int): Buffered records that force a commit
+        snapshot_every (int): Committed records after which the journal is
+            compacted into a new snapshot. Recovery never replays more.
+    """
+
+    def __init__(self, path, group_size=1000, snapshot_every=100000):
+        self.path = path
+        self.snapshot_path = path + ".snapshot"
+        self.group_size = group_size
+        self.snapshot_every = snapshot_every
+        self.dojo = None
+        self.lsn = 0
+        self.since_snapshot = 0
+        self._buffer = []
+        self._file = None
+
+    def append(self, record):
+        """Buffers a record, committing once group_size records are waiting
+        """
+
+        self.lsn += 1
+        self._buffer.append(_dumps([self.lsn] + record))
+        if len(self._buffer) >= self.group_size:
+            self.commit()
+
+    def commit(self):
+        """Writes the buffered records with one fsync
+
+        Returns:
+            int: Number of records written
+        """
+
+        count = self._write()
+        self.since_snapshot += count
+        if self.since_snapshot >= self.snapshot_every:
+            self.snapshot()
+        return count
+
+    def snapshot(self):
+        """Compacts the journal into a snapshot of the attached dojo
+
+        The snapshot is written to a temporary file and renamed over the
+        previous one before the journal is truncated, so a crash at any
+        point leaves a snapshot and journal that recover the same state.
+        """
+
+        self._write()
+        temporary_path = self.snapshot_path + ".tmp"
+        with open(temporary_path, "w") as file:
+            file.write(_dumps(["S", self.lsn]))
+            file.writelines(_dumps(record)
+                            for record in state_records(self.dojo))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self.snapshot_path)
+        self._file.close()
+        self._file = open(self.path, "w")
+        self.since_snapshot = 0
+
+    def _write(self):
+        if not self._buffer:
+            return 0
+        count = len(self._buffer)
+        self._file.write("".join(self._buffer))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._buffer = []
+        return count
+
+    def recover(self, dojo):
+        """Rebuilds a dojo from the snapshot and journal, then attaches it
+
+        A partly written last line, left by a crash during a write, is
+        dropped from the journal.
+
+        Args:
+            dojo (Dojo): An empty dojo
+
+        Returns:
+            int: Number of journal records replayed on top of the snapshot
+        """
+
+        snapshot_lsn = 0
+        if os.path.isfile(self.snapshot_path):
+            with open(self.snapshot_path) as file:
+                snapshot_lsn = json.loads(file.readline())[1]
+                for line in file:
+                    apply(dojo, json.loads(line))
+        self.lsn = snapshot_lsn
+        replayed = 0
+        good_size = 0
+        if os.path.isfile(self.path):
+            with open(self.path) as file:
+                for line in iter(file.readline, ""):
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    if not line.endswith("\n"):
+                        break
+                    good_size = file.tell()
+                    if entry[0] > snapshot_lsn:
+                        apply(dojo, entry[1:])
+                        replayed += 1
+                    self.lsn = max(self.lsn, entry[0])
+        self._file = open(self.path, "a")
+        self._file.truncate(good_size)
+        self.since_snapshot = replayed
+
+        # Waitlists are not journaled, queue unallocated people again
+        if dojo.waitlists is not None:
+            for person_id in sorted(dojo.unallocated):
+                person = dojo.unallocated[person_id]
+                if person.office is None:
+                    dojo.waitlists["office"].append(person)
+                if person.living_space is None and \
+                        person.wants_accommodation == "Y" and \
+                        person._type == "fellow":
+                    dojo.waitlists["living_space"].append(person)
+        self.dojo = dojo
+        dojo.journal = self
+        return replayed
+
+    def close(self):
+        """Commits the buffered records and closes the journal"""
+
+        if self._file is not None:
+            self.commit()
+            self._file.close()
+            self._file = None
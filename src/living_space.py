@@ -6,9 +6,12 @@ from .room import Room
 class LivingSpace(Room):
     """LivingSpace"""
 
+    __slots__ = ()
+
+    maximum_no_of_people = 4
+
     def __init__(self, name):
         super(LivingSpace, self).__init__(name)
-        self.maximum_no_of_people = 4
         self.set_type()
 
     def set_type(self):
@@ -0,0 +1,128 @@
+"""class OccupancyMatrix
+
+Vectorized view of who occupies which room, built on NumPy over the columns
+of a ColumnarStore without copying them. Every person has an integer room
+index per room type and every room a resident count, so reports over
+millions of people are computed with array operations instead of Python
+loops. ColumnarDojo computes its reports with a matrix over its own columns.
+A matrix for any other dojo needs a copy of the dojo in columns first, which
+costs more than the loops of Dojo, so from_dojo is meant for snapshots.
+
+NumPy is optional. It is only needed when an OccupancyMatrix is created:
+    pip install numpy
+
+Example:
+    To get the rooms of a ColumnarDojo that are full, use
+        OccupancyMatrix(dojo.store).full_rooms()
+
+Attributes:
+    MISSING (dict): Description of each missing room code
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .columnar import ColumnarStore, NO_ROOM, ROOM_TYPES
+from .living_space import LivingSpace
+from .office import Office
+
+MISSING = {1: "Office", 2: "Living Space", 3: "Office and Living Space"}
+
+
+class OccupancyMatrix(object):
+    """ This class is responsible for vectorized occupancy reports
+
+    Args:
+        store (ColumnarStore): Columns the matrix is built from
+
+    Raises:
+        ImportError: If NumPy is not installed
+    """
+
+    def __init__(self, store):
+        if numpy is None:
+            raise ImportError(
+                "OccupancyMatrix needs NumPy, install it with "
+                "pip install numpy")
+        self.store = store
+        self.room_names = numpy.array(store.room_names, dtype=object)
+        self.room_types = numpy.frombuffer(store.room_types, dtype=numpy.int8)
+        self.capacities = numpy.where(
+            self.room_types == ROOM_TYPES.index("office"),
+            Office.maximum_no_of_people, LivingSpace.maximum_no_of_people)
+        self.person_ids = numpy.frombuffer(store.person_ids, dtype=numpy.int64)
+        self.wants_accommodation = numpy.frombuffer(
+            store.wants_accommodation, dtype=numpy.int8).astype(bool)
+        self.offices = numpy.frombuffer(store.offices, dtype=numpy.int64)
+        self.living_spaces = numpy.frombuffer(
+            store.living_spaces, dtype=numpy.int64)
+        rooms = len(store.room_names)
+        self.counts = \
+            numpy.bincount(
+                self.offices[self.offices != NO_ROOM], minlength=rooms) + \
+            numpy.bincount(
+                self.living_spaces[self.living_spaces != NO_ROOM],
+                minlength=rooms)
+
+    @classmethod
+    def from_dojo(cls, dojo):
+        """Builds the matrix over a copy of a dojo in columns"""
+
+        return cls(ColumnarStore.from_dojo(dojo))
+
+    def unallocated_rows(self):
+        """Finds the rows of the people missing a room they need
+
+        Returns:
+            (list, list): Rows ordered by person id and the MISSING code of
+            each row
+        """
+
+        missing = (self.offices == NO_ROOM).astype(numpy.int8) + \
+            2 * ((self.living_spaces == NO_ROOM) &
+                 self.wants_accommodation).astype(numpy.int8)
+        rows = numpy.flatnonzero(missing)
+        rows = rows[numpy.argsort(self.person_ids[rows], kind="stable")]
+        return rows.tolist(), missing[rows].tolist()
+
+    def unallocated(self):
+        """Finds people missing a room they need
+
+        Returns:
+            list: (person_id, missing) pairs ordered by person id, where
+            missing is Office, Living Space or Office and Living Space
+        """
+
+        rows, codes = self.unallocated_rows()
+        return [(self.store.person_ids[row], MISSING[code])
+                for row, code in zip(rows, codes)]
+
+    def room_counts(self):
+        """Returns the number of residents of every room keyed by room name"""
+
+        return dict(zip(self.room_names.tolist(), self.counts.tolist()))
+
+    def full_rooms(self):
+        """Returns the names of the rooms occupied to capacity"""
+
+        return self.room_names[self.counts >= self.capacities].tolist()
+
+    def utilisation(self):
+        """Computes how much of each room type is in use
+
+        Returns:
+            dict: residents, capacity and ratio of occupied slots keyed by
+            room type
+        """
+
+        usage = {}
+        for code, room_type in enumerate(ROOM_TYPES):
+            of_type = self.room_types == code
+            residents = int(self.counts[of_type].sum())
+            capacity = int(self.capacities[of_type].sum())
+            usage[room_type] = {
+                "residents": residents, "capacity": capacity,
+                "ratio": residents / capacity if capacity else 0.0}
+        return usage
@@ -9,9 +9,12 @@ class Office(Room):
     Office inherits from the Room class
     """
 
+    __slots__ = ()
+
+    maximum_no_of_people = 6
+
     def __init__(self, name):
         super(Office, self).__init__(name)
-        self.maximum_no_of_people = 6
         self.set_type()
 
     def set_type(self):
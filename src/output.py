@@ -0,0 +1,173 @@
+"""Output sinks
+
+A sink receives every message the Dojo wants to show. Messages are passed as a
+template plus the fields used to fill it in, and are only formatted by sinks
+that actually write them, so a silent sink costs nothing beyond the call.
+
+Example:
+    To create a Dojo that keeps quiet, use
+        dojo = Dojo(output=SilentSink())
+
+Attributes:
+    SINKS (dict): Sink classes keyed by the name used on the command line
+    ERROR_EVENTS (frozenset): Events reporting that a command failed
+"""
+
+import sys
+from abc import ABCMeta, abstractmethod
+
+# Counted as errors whatever their style, so a failed command is never
+# mistaken for a success because its message is not shown in red. People
+# left without a room are still added, so no_office, no_living_space and
+# living_space_denied are not errors.
+ERROR_EVENTS = frozenset([
+    "different_campus", "different_room_type", "duplicate_room",
+    "invalid_batch", "invalid_person_name", "invalid_room_name",
+    "load_failed", "missing_file", "no_campus", "no_campuses",
+    "no_vacant_room", "reallocation_failed", "reallocation_rejected",
+    "room_full", "same_room", "shard_down", "shard_error", "stats_off",
+    "unknown_campus", "unknown_format", "unknown_person", "unknown_room",
+])
+
+
+class OutputSink(metaclass=ABCMeta):
+    """Base class of all sinks
+
+    Subclasses implement write() which receives the message once it has to
+    be shown.
+
+    Args:
+        stream: File like object to write to, defaults to stdout.
+    """
+
+    enabled = True
+
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.errors = 0
+
+    def emit(self, style, event, message, **fields):
+        """Sends a message to the sink
+
+        Args:
+            style (str): colorful style of the message ie green, red, blue
+            event (str): Name of the event being reported ie room_created.
+                Events in ERROR_EVENTS are counted as errors.
+            message (str || callable): Template filled in with fields, or a
+                callable returning the text. Only used if the text is needed.
+            fields: Values used to fill in the template
+        """
+
+        if event in ERROR_EVENTS:
+            self.errors += 1
+        if self.enabled:
+            self.write(style, event, message, fields)
+
+    @abstractmethod
+    def write(self, style, event, message, fields):
+        pass
+
+    def flush(self):
+        """Writes out anything the sink has buffered"""
+
+        pass
+
+    @staticmethod
+    def render(message, fields):
+        """Formats a message template or calls a message callable"""
+
+        return message() if callable(message) else message.format(**fields)
+
+
+class SilentSink(OutputSink):
+    """Drops every message without formatting it"""
+
+    enabled = False
+
+    def write(self, style, event, message, fields):
+        pass
+
+
+class TextSink(OutputSink):
+    """Buffers messages as plain text
+
+    Args:
+        stream: File like object the buffer is written to on flush().
+            The buffer is only kept in memory if none is given.
+    """
+
+    def __init__(self, stream=None):
+        super(TextSink, self).__init__(stream)
+        self.lines = []
+
+    def write(self, style, event, message, fields):
+        self.lines.append(self.render(message, fields))
+
+    def getvalue(self):
+        """Returns the buffered text"""
+
+        return "\n".join(self.lines)
+
+    def flush(self):
+        """Writes the buffered text to the stream and clears the buffer"""
+
+        if self.stream is not None and self.lines:
+            self.stream.write(self.getvalue() + "\n")
+            self.stream.flush()
+            self.lines = []
+
+
+class ColorSink(OutputSink):
+    """Prints messages to the terminal in color"""
+
+    def write(self, style, event, message, fields):
+        import colorful
+
+        text = self.render(message, fields)
+        print(getattr(colorful, style)(text) if style else text,
+              file=self.stream if self.stream is not None else sys.stdout)
+
+
+class JSONLinesSink(OutputSink):
+    """Writes one JSON object per message"""
+
+    def write(self, style, event, message, fields):
+        import json
+
+        stream = self.stream if self.stream is not None else sys.stdout
+        stream.write(json.dumps(
+            self.record(style, event, message, fields), default=str) + "\n")
+
+    @classmethod
+    def record(cls, style, event, message, fields):
+        """Builds the JSON object written for a message"""
+
+        record = {"event": event,
+                  "level": "error" if event in ERROR_EVENTS else "info",
+                  "message": cls.render(message, fields)}
+        record.update(fields)
+        return record
+
+
+class RecordSink(OutputSink):
+    """Keeps the JSON object of every message in memory
+
+    Used to collect the messages of a single request to the allocator
+    service so they can be sent back with the response.
+    """
+
+    def __init__(self, stream=None):
+        super(RecordSink, self).__init__(stream)
+        self.records = []
+
+    def write(self, style, event, message, fields):
+        self.records.append(
+            JSONLinesSink.record(style, event, message, fields))
+
+
+SINKS = {
+    "silent": SilentSink,
+    "text": TextSink,
+    "color": ColorSink,
+    "json": JSONLinesSink,
+}
@@ -4,25 +4,57 @@ from abc import ABCMeta, abstractmethod
 
 
 class Person(object):
-    """ This class is responsible for managing people's data """
-
-    def __init__(
-            self,
-            first_name,
-            last_name,
-            wants_accommodation,
-            id_,
-            has_living_space=None,
-            has_office=None):
+    """ This class is responsible for managing people's data
+
+    People are created in large numbers, so attributes are kept in slots
+    and the rooms a person occupies are direct references instead of a list
+    of dicts. The rooms hold the other side of each reference in their
+    residents, and both sides are only changed together by
+    add_person_to_room and remove_person.
+
+    Attributes:
+        office (Office): Office allocated to the person, None if unallocated
+        living_space (LivingSpace): Living space allocated to the person
+        has_office (bool): True if the person has an office, None otherwise
+        has_living_space (bool): True if the person has a living space, None
+            otherwise
+    """
+
+    __slots__ = ("first_name", "last_name", "id_", "_type", "office",
+                 "living_space", "wants_accommodation")
+
+    def __init__(self, first_name, last_name, wants_accommodation, id_):
         self.first_name = first_name
         self.last_name = last_name
         self.id_ = id_
         self._type = None
-        self.has_living_space = None if has_living_space is None else True
-        self.has_office = None if has_office is None else True
-        self.rooms_occupied = []
+        self.office = None
+        self.living_space = None
         self.wants_accommodation = wants_accommodation
 
+    @property
+    def has_office(self):
+        """Derived from office, so it can never disagree with it"""
+
+        return True if self.office is not None else None
+
+    @property
+    def has_living_space(self):
+        """Derived from living_space, so it can never disagree with it"""
+
+        return True if self.living_space is not None else None
+
+    @property
+    def rooms_occupied(self):
+        """Rooms occupied by the person as a list of {room_type: room_name}"""
+
+        rooms = []
+        if self.office is not None:
+            rooms.append({"office": self.office.name})
+        if self.living_space is not None:
+            rooms.append({"living_space": self.living_space.name})
+        return rooms
+
     def get_fullname(self):
         """get_fullname()
 
@@ -0,0 +1,109 @@
+"""Allocation report writers
+
+Writers take an iterable of rooms and write the report one room at a time
+through a buffered file handle, so the report is never built up in memory.
+
+Example:
+    To write a gzipped CSV report, use
+        write_allocations(dojo.rooms, "allocations.csv.gz")
+
+Attributes:
+    FORMATS (dict): Writer function of each report format
+    EXTENSIONS (dict): Report format implied by each file extension
+"""
+
+import csv
+import gzip
+import json
+import os.path
+
+BUFFER_SIZE = 1 << 16
+
+
+def allocation_text(room):
+    """Formats the residents of a room as they appear in the text report"""
+
+    return "Room: {0} \n ------\n{1}\n\n".format(
+        room.name,
+        ",".join(person.get_fullname().upper() for person in room.residents))
+
+
+def write_text(rooms, file):
+    """Writes a block per room listing its residents"""
+
+    for room in rooms:
+        file.write(allocation_text(room))
+
+
+def write_csv(rooms, file):
+    """Writes a row per resident, and a row without a person for empty rooms
+    """
+
+    writer = csv.writer(file)
+    writer.writerow(["room_name", "room_type", "person_id", "name"])
+    for room in rooms:
+        if not room.residents:
+            writer.writerow([room.name, room._type, "", ""])
+        for person in room.residents:
+            writer.writerow(
+                [room.name, room._type, person.id_, person.get_fullname()])
+
+
+def write_jsonl(rooms, file):
+    """Writes a JSON object per room"""
+
+    for room in rooms:
+        file.write(json.dumps({
+            "room_name": room.name, "room_type": room._type,
+            "people": [{"person_id": person.id_,
+                        "name": person.get_fullname()}
+                       for person in room.residents]}) + "\n")
+
+
+FORMATS = {"text": write_text, "csv": write_csv, "jsonl": write_jsonl}
+
+EXTENSIONS = {".txt": "text", ".csv": "csv", ".jsonl": "jsonl",
+              ".json": "jsonl"}
+
+
+def report_format(path, output_format=None, compress=None):
+    """Works out the format of a report from its path unless given
+
+    Returns:
+        (str, bool): Report format and whether the file is gzipped
+
+    Raises:
+        ValueError: If the format is not one of FORMATS
+    """
+
+    root, extension = os.path.splitext(path)
+    if compress is None:
+        compress = extension == ".gz"
+    if extension == ".gz":
+        extension = os.path.splitext(root)[1]
+    output_format = output_format or EXTENSIONS.get(extension, "text")
+    if output_format not in FORMATS:
+        raise ValueError(
+            "Unknown report format {0}, choose one of {1}".format(
+                output_format, ", ".join(sorted(FORMATS))))
+    return output_format, compress
+
+
+def write_allocations(rooms, path, output_format=None, compress=None):
+    """Streams the allocations report of rooms to a file
+
+    Args:
+        rooms: Iterable of rooms, read once
+        path (str): File to write
+        output_format (str): text, csv or jsonl. Guessed from the extension
+            of path when left out, text by default.
+        compress (bool): Gzip the file. Defaults to whether path ends in .gz
+    """
+
+    output_format, compress = report_format(path, output_format, compress)
+    if compress:
+        file = gzip.open(path, "wt", newline="")
+    else:
+        file = open(path, "w", buffering=BUFFER_SIZE, newline="")
+    with file:
+        FORMATS[output_format](rooms, file)
@@ -6,10 +6,13 @@ Example:
         room = Room()
 
 Attributes:
-    residents (Person[]): People currently leaving in the room
+    residents (dict): People currently living in the room as the keys of a
+        dict, so membership and removal take constant time while reports
+        keep the order people moved in
     name (str): Name of room.
     _type (str): Type of room ie Office / LivingSpace
-    fully_occupied : True indicates that the room is occupied to capacity
+    fully_occupied : True indicates that the room is occupied to capacity,
+        derived from residents
 """
 
 from abc import ABCMeta, abstractmethod
@@ -18,11 +21,19 @@ from abc import ABCMeta, abstractmethod
 class Room(metaclass=ABCMeta):
     """ This class is responsible for managing the people in a room """
 
+    __slots__ = ("residents", "name", "_type")
+
+    maximum_no_of_people = None
+
     def __init__(self, name):
-        self.residents = []
+        self.residents = {}
         self.name = name
         self._type = None
-        self.fully_occupied = None
+
+    @property
+    def fully_occupied(self):
+        return True \
+            if len(self.residents) >= self.maximum_no_of_people else None
 
     @abstractmethod
     def set_type(self):
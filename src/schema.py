@@ -0,0 +1,109 @@
+"""Database schema
+
+Tables used to persist the state of a Dojo. Every table has a primary key so
+that rows can be updated in place with INSERT ... ON CONFLICT instead of being
+appended on every save.
+
+The room_vacancy table holds the free slots of every room so that SQLiteDojo
+can find vacant rooms with an index instead of counting residents. It is
+filled and kept up to date by SQLiteDojo alone, see sqlite_dojo.py, so Dojo
+never has to know about it.
+
+Attributes:
+    SCHEMA_VERSION (int): Stored in PRAGMA user_version of every database
+    TABLES (dict): CREATE TABLE statement of each table keyed by table name
+"""
+
+from .living_space import LivingSpace
+from .office import Office
+
+SCHEMA_VERSION = 1
+
+TABLES = {
+    "room": '''CREATE TABLE IF NOT EXISTS room
+                     (room_name text PRIMARY KEY, room_type text NOT NULL,
+                      occupation_status text)''',
+    "person": '''CREATE TABLE IF NOT EXISTS person
+                     (person_id INTEGER PRIMARY KEY, first_name text,
+                     last_name text, person_type text,
+                     has_living_space text, has_office text,
+                     wants_accommodation text
+                     )''',
+    "room_person": '''CREATE TABLE IF NOT EXISTS room_person
+                     (person_id INTEGER NOT NULL, room_name text NOT NULL,
+                      room_type text NOT NULL,
+                      PRIMARY KEY (person_id, room_type))''',
+    "room_vacancy": '''CREATE TABLE IF NOT EXISTS room_vacancy
+                     (room_name text PRIMARY KEY, room_type text NOT NULL,
+                      free_slots INTEGER NOT NULL)''',
+}
+
+CAPACITY = "CASE {0} WHEN 'office' THEN {1} ELSE {2} END".format(
+    "{0}", Office.maximum_no_of_people, LivingSpace.maximum_no_of_people)
+
+INDEXES = [
+    '''CREATE INDEX IF NOT EXISTS room_person_room_name
+       ON room_person (room_name)''',
+    # Vacant rooms of a type in creation order, and by free slots
+    '''CREATE INDEX IF NOT EXISTS room_vacancy_vacant
+       ON room_vacancy (room_type) WHERE free_slots > 0''',
+    '''CREATE INDEX IF NOT EXISTS room_vacancy_free_slots
+       ON room_vacancy (room_type, free_slots) WHERE free_slots > 0''',
+    '''CREATE INDEX IF NOT EXISTS room_vacancy_most_free_slots
+       ON room_vacancy (room_type, free_slots DESC) WHERE free_slots > 0''',
+]
+
+UPSERT_ROOM = '''INSERT INTO room VALUES (?,?,?)
+    ON CONFLICT (room_name) DO UPDATE SET
+    room_type = excluded.room_type,
+    occupation_status = excluded.occupation_status'''
+
+UPSERT_PERSON = '''INSERT INTO person VALUES (?,?,?,?,?,?,?)
+    ON CONFLICT (person_id) DO UPDATE SET
+    first_name = excluded.first_name, last_name = excluded.last_name,
+    person_type = excluded.person_type,
+    has_living_space = excluded.has_living_space,
+    has_office = excluded.has_office,
+    wants_accommodation = excluded.wants_accommodation'''
+
+UPSERT_ROOM_PERSON = '''INSERT INTO room_person VALUES (?,?,?)
+    ON CONFLICT (person_id, room_type) DO UPDATE SET
+    room_name = excluded.room_name'''
+
+DELETE_ROOM_PERSON = \
+    "DELETE FROM room_person WHERE person_id = ? AND room_type = ?"
+
+
+def create_schema(connection):
+    """Creates the tables, migrating databases written without keys
+
+    Databases saved before the tables had primary keys may hold the same row
+    several times. Those rows are copied into keyed tables with the last copy
+    of every row winning.
+
+    Args:
+        connection (sqlite3.Connection): Open connection to the database
+    """
+
+    cursor = connection.cursor()
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    existing = [row[0] for row in cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'")]
+    with connection:
+        if version < SCHEMA_VERSION:
+            for table in TABLES:
+                if table in existing:
+                    cursor.execute(
+                        "ALTER TABLE {0} RENAME TO {0}_unkeyed".format(table))
+        for table, statement in TABLES.items():
+            cursor.execute(statement)
+        for statement in INDEXES:
+            cursor.execute(statement)
+        if version < SCHEMA_VERSION:
+            for table in TABLES:
+                if table in existing:
+                    cursor.execute(
+                        "INSERT OR REPLACE INTO {0} SELECT * FROM {0}_unkeyed "
+                        "ORDER BY rowid".format(table))
+                    cursor.execute("DROP TABLE {0}_unkeyed".format(table))
+            cursor.execute("PRAGMA user_version = {0}".format(SCHEMA_VERSION))
@@ -0,0 +1,393 @@
+"""class AllocatorService
+
+Long running allocator that keeps a single Dojo in memory and serves it over
+a small HTTP/JSON API on a TCP port or a Unix socket. Connections are handled
+by asyncio, so many clients can be connected at once. Every operation runs to
+completion on the event loop before the next one starts. Changes are
+checkpointed to SQLite with the delta saves of Dojo.save_state in a worker
+thread, so the event loop keeps accepting connections while a checkpoint is
+written. Operations wait on a lock until the checkpoint is done, which keeps
+the Dojo from changing while it is being saved. When the dojo has
+a Journal, each response is only sent once its changes are committed, and
+requests handled together share one commit.
+
+Example:
+    To serve a dojo on port 8000 and checkpoint it every 30 seconds, use
+        AllocatorService(Dojo(), db_file="service.db").run(port=8000)
+
+Endpoints (request and response bodies are JSON):
+    POST /rooms           {"room_type": ..., "room_names": [...]}
+    POST /people          {"first_name": ..., "last_name": ...,
+                           "person_type": ..., "wants_accommodation": "Y"}
+    POST /reallocations   {"person_id": ..., "room_name": ...,
+                           "room_type": "office"}
+    POST /checkpoint      Saves the dojo straight away
+    GET  /rooms/<name>    Residents of a room
+    GET  /allocations     Residents of every room
+    GET  /unallocated     People missing a room
+    GET  /utilisation     Occupancy of each room type and the full rooms
+
+Every response holds the result of the operation along with the messages
+the Dojo emitted while running it, and ok is false if any was an error.
+Requests with missing fields, fields of the wrong type or unknown room and
+person types are answered with 400, and an operation that fails in any other
+way with 500, so a bad request never drops the connection.
+
+Attributes:
+    REASONS (dict): Reason phrase of each HTTP status code used
+    MAX_BODY_SIZE (int): Largest request body accepted, in bytes
+"""
+
+import asyncio
+import json
+import os.path
+import signal
+
+from .columnar import PERSON_TYPES, ROOM_TYPES
+from .output import RecordSink
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+MAX_BODY_SIZE = 1 << 20
+
+
+def internal_error(exception):
+    """Response body of a request that failed unexpectedly"""
+
+    return {"ok": False, "error": "Internal error: {0}: {1}".format(
+        type(exception).__name__, exception)}
+
+
+class RequestError(Exception):
+    """Raised for a request the service can not run
+
+    Args:
+        status (int): HTTP status code of the response
+        message (str): Description sent back to the client
+    """
+
+    def __init__(self, status, message):
+        super(RequestError, self).__init__(message)
+        self.status = status
+
+
+class AllocatorService(object):
+    """ This class is responsible for serving a Dojo over HTTP
+
+    Args:
+        dojo (Dojo): Dojo kept in memory by the service
+        db_file (str): Database in resources/ the dojo is checkpointed to.
+            Nothing is saved when left out.
+        checkpoint_interval (float): Seconds between background checkpoints
+    """
+
+    def __init__(self, dojo, db_file=None, checkpoint_interval=30.0):
+        self.dojo = dojo
+        self.db_file = db_file
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoints = 0
+        self._journal_commit = None
+        # Held by every operation and by checkpoints in the worker thread
+        self._lock = asyncio.Lock()
+        self.routes = {
+            ("POST", "/rooms"): self.create_rooms,
+            ("POST", "/people"): self.add_person,
+            ("POST", "/reallocations"): self.reallocate_person,
+            ("POST", "/checkpoint"): self.checkpoint,
+            ("GET", "/allocations"): self.allocations,
+            ("GET", "/unallocated"): self.unallocated,
+            ("GET", "/utilisation"): self.utilisation,
+        }
+
+    def load(self):
+        """Restores the dojo from its database if it has been saved before"""
+
+        path = os.path.join("resources", self.db_file or "")
+        if self.db_file and os.path.isfile(path):
+            self.dojo.load_state(path)
+
+    def handle(self, method, path, body=None):
+        """Runs the operation behind a request
+
+        Args:
+            method (str): HTTP method ie GET or POST
+            path (str): Path of the request
+            body (dict): Decoded JSON body of the request
+
+        Returns:
+            (int, dict): HTTP status and the response body
+        """
+
+        if path.startswith("/rooms/") and method == "GET":
+            operation, args = self.print_room, [path[len("/rooms/"):]]
+        elif (method, path) in self.routes:
+            if body is not None and not isinstance(body, dict):
+                return 400, {"ok": False,
+                             "error": "Body must be a JSON object"}
+            operation, args = self.routes[(method, path)], [body or {}]
+        elif any(route_path == path for _, route_path in self.routes):
+            return 405, {"ok": False, "error": "Method not allowed"}
+        else:
+            return 404, {"ok": False, "error": "No such endpoint"}
+
+        # Operations run one at a time, so the sink only sees their messages
+        sink, output = RecordSink(), self.dojo.output
+        self.dojo.output = sink
+        try:
+            result = operation(*args)
+        except RequestError as exception:
+            return exception.status, {"ok": False, "error": str(exception)}
+        except Exception as exception:
+            return 500, internal_error(exception)
+        finally:
+            self.dojo.output = output
+        return 200, {"ok": sink.errors == 0, "result": result,
+                     "messages": sink.records}
+
+    @staticmethod
+    def _field(body, name, default=None, choices=None, kind=str):
+        """Reads a field of a request body
+
+        Args:
+            choices (tuple): Allowed values, compared ignoring case
+            kind (type): Type, or tuple of types, the value must have
+
+        Raises:
+            RequestError: If the field is missing, of another type or not
+                one of choices
+        """
+
+        value = body.get(name, default)
+        if value is None:
+            raise RequestError(400, "Missing field " + name)
+        if not isinstance(value, kind) or isinstance(value, bool):
+            raise RequestError(
+                400, "Field {0} has the wrong type".format(name))
+        if choices and value.lower() not in [
+                choice.lower() for choice in choices]:
+            raise RequestError(400, "Field {0} must be one of {1}".format(
+                name, ", ".join(choices)))
+        return value
+
+    def create_rooms(self, body):
+        room_type = self._field(body, "room_type", choices=ROOM_TYPES)
+        room_names = self._field(body, "room_names", kind=(list, str))
+        if not isinstance(room_names, list):
+            room_names = [room_names]
+        if not all(isinstance(room_name, str) for room_name in room_names):
+            raise RequestError(400, "Field room_names must only hold text")
+        rooms = self.dojo.create_rooms(
+            (room_type, room_name) for room_name in room_names)
+        return [room.name for room in rooms]
+
+    def add_person(self, body):
+        return self.dojo.add_person(
+            self._field(body, "first_name"), self._field(body, "last_name"),
+            self._field(body, "person_type", choices=PERSON_TYPES),
+            self._field(body, "wants_accommodation", "N",
+                        choices=("Y", "N")).upper())
+
+    def reallocate_person(self, body):
+        person_id = self._field(body, "person_id", kind=(int, str))
+        try:
+            person_id = int(person_id)
+        except ValueError:
+            raise RequestError(400, "person_id must be a number")
+        room_name = body.get("room_name")
+        if room_name is not None:
+            room_name = self._field(body, "room_name")
+        self.dojo.reallocate_person(
+            person_id, room_name,
+            self._field(body, "room_type", "office", choices=ROOM_TYPES))
+        person = self.dojo.people_by_id.get(person_id)
+        if person is None:
+            return None
+        return {"office": person.office.name if person.office else None,
+                "living_space": person.living_space.name
+                if person.living_space else None}
+
+    def print_room(self, room_name):
+        return self.dojo.print_room(room_name)
+
+    def allocations(self, body):
+        return [{"room_name": room.name, "room_type": room._type,
+                 "people": [person.id_ for person in room.residents]}
+                for room in self.dojo.rooms]
+
+    def unallocated(self, body):
+        return self.dojo.print_unallocated()
+
+    def utilisation(self, body):
+        return self.dojo.print_utilisation()
+
+    def checkpoint(self, body=None):
+        """Saves the changes made since the last checkpoint
+
+        Returns:
+            bool: Whether anything was saved
+        """
+
+        if not self.db_file:
+            raise RequestError(400, "The service has no database to save to")
+        path = os.path.abspath(os.path.join("resources", self.db_file))
+        if self.dojo._saved_to == path and not self.dojo._dirty_rooms and \
+                not self.dojo._dirty_people:
+            return False
+        self.dojo.save_state(self.db_file)
+        self.checkpoints += 1
+        return True
+
+    async def checkpoint_periodically(self):
+        """Checkpoints the dojo every checkpoint_interval seconds
+
+        The dojo is saved in a worker thread while the lock keeps operations
+        from changing it. A save in progress when the task is cancelled is
+        finished before the lock is released.
+        """
+
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            async with self._lock:
+                save = loop.run_in_executor(None, self.checkpoint)
+                try:
+                    await asyncio.shield(save)
+                except asyncio.CancelledError:
+                    await save
+                    raise
+
+    async def commit_journal(self):
+        """Waits until the changes made so far are durable in the journal
+
+        Requests handled in the same pass of the event loop share a single
+        journal commit, and with it a single fsync.
+        """
+
+        if self.dojo.journal is None:
+            return
+        if self._journal_commit is None:
+            loop = asyncio.get_running_loop()
+            self._journal_commit = loop.create_future()
+            loop.call_soon(self._commit_journal)
+        await asyncio.shield(self._journal_commit)
+
+    def _commit_journal(self):
+        commit, self._journal_commit = self._journal_commit, None
+        try:
+            self.dojo.journal.commit()
+        except OSError as exception:
+            commit.set_exception(exception)
+        else:
+            commit.set_result(None)
+
+    async def handle_connection(self, reader, writer):
+        """Serves the requests of one client connection until it closes"""
+
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, version = \
+                    request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_SIZE:
+                    status, response = 413, {
+                        "ok": False, "error": "Request body is too large"}
+                    keep_alive = False
+                else:
+                    payload = await reader.readexactly(length)
+                    keep_alive = headers.get("connection", "").lower() != \
+                        "close" and version.strip() == "HTTP/1.1"
+                    try:
+                        body = json.loads(payload) if payload else None
+                    except ValueError:
+                        status, response = 400, {
+                            "ok": False, "error": "Body is not valid JSON"}
+                    else:
+                        try:
+                            async with self._lock:
+                                status, response = self.handle(
+                                    method, path.split("?", 1)[0], body)
+                            await self.commit_journal()
+                        except Exception as exception:
+                            status, response = 500, internal_error(exception)
+                data = json.dumps(response, default=str).encode("utf-8")
+                writer.write(
+                    "HTTP/1.1 {0} {1}\r\nContent-Type: application/json\r\n"
+                    "Content-Length: {2}\r\nConnection: {3}\r\n\r\n".format(
+                        status, REASONS[status], len(data),
+                        "keep-alive" if keep_alive else "close"
+                    ).encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8000, unix_socket=None):
+        """Starts listening and checkpointing
+
+        Returns:
+            asyncio.AbstractServer: The listening server
+        """
+
+        if unix_socket:
+            server = await asyncio.start_unix_server(
+                self.handle_connection, path=unix_socket)
+        else:
+            server = await asyncio.start_server(
+                self.handle_connection, host, port)
+        if self.db_file:
+            self._checkpointer = asyncio.ensure_future(
+                self.checkpoint_periodically())
+        return server
+
+    async def stop(self, server):
+        """Stops listening and saves any outstanding changes"""
+
+        server.close()
+        await server.wait_closed()
+        if self.db_file:
+            self._checkpointer.cancel()
+            try:
+                await self._checkpointer
+            except asyncio.CancelledError:
+                pass
+            async with self._lock:
+                self.checkpoint()
+        if self.dojo.journal is not None:
+            self.dojo.journal.close()
+
+    async def serve(self, host="127.0.0.1", port=8000, unix_socket=None):
+        """Serves requests until the task is cancelled or SIGTERM arrives"""
+
+        server = await self.start(host, port, unix_socket)
+        # Stopping with SIGTERM still saves the last changes
+        if hasattr(signal, "SIGTERM"):
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGTERM, asyncio.current_task().cancel)
+        try:
+            await server.serve_forever()
+        finally:
+            await self.stop(server)
+
+    def run(self, host="127.0.0.1", port=8000, unix_socket=None):
+        """Loads the dojo and serves it until interrupted"""
+
+        self.load()
+        try:
+            asyncio.run(self.serve(host, port, unix_socket))
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            pass
@@ -0,0 +1,967 @@
+"""class ShardedDojo
+
+Dojo split over several campuses, each kept by a Dojo of its own in a
+separate worker process. A coordinator in the calling process knows which
+campus every room and person is on and routes each command to it, so the
+campuses work in parallel and a campus that stops responding only takes
+its own rooms and people with it.
+
+A person is added to the campus asked for when it has vacant rooms, and
+otherwise to any campus that has them. Whole dojo reports are merged from
+the reports of every campus, with rooms streamed from each campus in
+chunks so no process holds the full report.
+
+Example:
+    To split a dojo over two campuses, use
+        dojo = ShardedDojo(["nairobi", "lagos"])
+        dojo.create_room("office", "orange", campus="nairobi")
+        dojo.add_person("Dele", "Ali", "fellow", campus="lagos")
+        dojo.close()
+
+Attributes:
+    campuses (str[]): Name of the campus kept by each shard
+    room_campus (dict): Index of the shard holding each room by room name
+    person_campus (dict): Index of the shard holding each person by id
+    vacant (dict[]): Whether each shard has a vacant room of each room type
+    CHUNK_SIZE (int): Rooms sent per message when streaming a report
+"""
+
+import collections
+import heapq
+import itertools
+import multiprocessing
+import os.path
+
+from .dojo import Dojo
+from .fellow import Fellow
+from .helpers import make_table, parse_people, validate_person_data, \
+    validate_room_data, write_unallocated, REJECTIONS
+from .living_space import LivingSpace
+from .office import Office
+from .output import ColorSink, OutputSink, ERROR_EVENTS
+from .staff import Staff
+
+CHUNK_SIZE = 500
+
+
+def campus_file(db_file, campus):
+    """Names the database a campus is saved to, e.g. dojo_lagos.db"""
+
+    root, extension = os.path.splitext(db_file)
+    return "{0}_{1}{2}".format(root, campus, extension or ".db")
+
+
+class ShardDojo(Dojo):
+    """Dojo of one campus, whose person ids are given by the coordinator
+
+    Attributes:
+        person_ids (deque): Ids of the next people added, in order
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ShardDojo, self).__init__(*args, **kwargs)
+        self.person_ids = collections.deque()
+
+    def _new_person_id(self):
+        return self.person_ids.popleft()
+
+
+class ShardSink(OutputSink):
+    """Keeps the messages of a shard until they are sent to the coordinator
+
+    Args:
+        render (bool): Format the text of messages. Only the style, event
+            and fields are kept otherwise.
+    """
+
+    def __init__(self, render=True):
+        super(ShardSink, self).__init__()
+        self.render_text = render
+        self.messages = []
+
+    def write(self, style, event, message, fields):
+        self.messages.append((
+            style, event,
+            self.render(message, fields) if self.render_text else "", fields))
+
+
+class Shard(object):
+    """ This class is responsible for running commands on one campus
+
+    Args:
+        dojo (ShardDojo): Dojo of the campus
+    """
+
+    def __init__(self, dojo):
+        self.dojo = dojo
+
+    @staticmethod
+    def room_entry(room):
+        """Flattens a room and its residents for sending to the coordinator
+
+        Rooms and people refer to each other, so pickling them directly
+        would follow every room anyone in the room is linked to.
+        """
+
+        return (room.name, room._type,
+                [(person.id_, person.first_name, person.last_name,
+                  person._type, person.wants_accommodation)
+                 for person in room.residents])
+
+    def vacancy(self):
+        return {room_type: len(vacancies) > 0
+                for room_type, vacancies in self.dojo.vacancies.items()}
+
+    def free_slots(self):
+        return {room_type: sum(room.maximum_no_of_people -
+                               len(room.residents) for room in vacancies)
+                for room_type, vacancies in self.dojo.vacancies.items()}
+
+    def create_rooms(self, rooms):
+        return [room.name for room in self.dojo.create_rooms(rooms)]
+
+    def add_people(self, people):
+        """Adds (person_id, first_name, last_name, person_type,
+        wants_accommodation) tuples, returning what add_person returns"""
+
+        results = []
+        for person_id, *person_data in people:
+            self.dojo.person_ids = collections.deque([person_id])
+            results.append(self.dojo.add_person(*person_data))
+        return results
+
+    def allocate_batch(self, people):
+        """Adds (person_id, first_name, last_name, person_type,
+        wants_accommodation) tuples as one cohort, see Dojo.allocate_batch
+        """
+
+        self.dojo.person_ids = collections.deque(
+            person_id for person_id, *_ in people)
+        return self.dojo.allocate_batch(
+            person_data for _, *person_data in people)
+
+    def reallocate_person(self, person_id, new_room_name, room_type):
+        self.dojo.reallocate_person(person_id, new_room_name, room_type)
+
+    def check_moves(self, moves):
+        """Checks (entry_no, person_id, room_name) moves without making
+        them, returning (entry_no, error) of every invalid one"""
+
+        return self.dojo._plan_moves(moves)[1]
+
+    def reallocate_many(self, moves):
+        return self.dojo.reallocate_many(
+            (person_id, room_name) for _, person_id, room_name in moves)
+
+    def print_room(self, room_name):
+        return self.dojo.print_room(room_name)
+
+    def allocation_rows(self):
+        return [[person.get_fullname(), person._type,
+                 person.office.name if person.office else "Not Assigned",
+                 person.living_space.name if person.living_space
+                 else "Not Assigned"]
+                for person in self.dojo.people
+                if person.office is not None or
+                person.living_space is not None]
+
+    def unallocated(self):
+        return self.dojo.print_unallocated()
+
+    def utilisation(self):
+        return self.dojo.utilisation()
+
+    def save_state(self, db_file):
+        self.dojo.save_state(db_file)
+
+    def load_state(self, path):
+        """Loads a saved campus, returning its room names and person ids"""
+
+        if os.path.isfile(path):
+            self.dojo.load_state(path)
+        return ([room.name for room in self.dojo.rooms],
+                [person.id_ for person in self.dojo.people])
+
+
+def run_shard(connection, dojo_options, render):
+    """Serves the commands of the coordinator until told to close
+
+    Each command is a (name, args) pair answered with (result, messages,
+    vacancy), or with ("error", description) if it raised. The rooms
+    command is answered with chunks of rooms and then None.
+    """
+
+    sink = ShardSink(render)
+    shard = Shard(ShardDojo(output=sink, **dojo_options))
+    while True:
+        try:
+            command, args = connection.recv()
+        except EOFError:
+            break
+        if command == "close":
+            break
+        if command == "rooms":
+            rooms = (shard.room_entry(room) for room in shard.dojo.rooms)
+            while True:
+                chunk = list(itertools.islice(rooms, CHUNK_SIZE))
+                if not chunk:
+                    break
+                connection.send(chunk)
+            connection.send(None)
+            continue
+        sink.messages = []
+        try:
+            result = getattr(shard, command)(*args)
+        except Exception as exception:
+            connection.send(("error", "{0}: {1}".format(
+                type(exception).__name__, exception)))
+        else:
+            connection.send((result, sink.messages, shard.vacancy()))
+    connection.close()
+
+
+class ShardedDojo(object):
+    """ This class is responsible for coordinating the campuses of a dojo
+
+    Args:
+        campuses (str[]): Names of the campuses, one worker process each
+        output (OutputSink): Sink receiving the messages of every campus
+        office_strategy (AllocationStrategy): Used by every campus
+        living_space_strategy (AllocationStrategy): Used by every campus
+        waitlist (bool): Keep a waitlist on every campus
+    """
+
+    def __init__(self, campuses, output=None, office_strategy=None,
+                 living_space_strategy=None, waitlist=False):
+        self.output = output if output is not None else ColorSink()
+        self.campuses = list(campuses)
+        self.journal = None
+        self.room_campus = {}
+        self.person_campus = {}
+        self.vacant = [{"office": False, "living_space": False}
+                       for _ in self.campuses]
+        self.up = [True] * len(self.campuses)
+        self.next_person_id = 1
+        self._turn = itertools.cycle(range(len(self.campuses)))
+        dojo_options = {"office_strategy": office_strategy,
+                        "living_space_strategy": living_space_strategy,
+                        "waitlist": waitlist}
+        self.connections, self.processes = [], []
+        for campus in self.campuses:
+            connection, shard_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=run_shard, name="shard-" + campus, daemon=True,
+                args=(shard_connection, dojo_options, self.output.enabled))
+            process.start()
+            shard_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def close(self):
+        """Stops every worker process"""
+
+        for index, connection in enumerate(self.connections):
+            if self.up[index]:
+                try:
+                    connection.send(("close", ()))
+                except OSError:
+                    pass
+            connection.close()
+        for process in self.processes:
+            process.join(5)
+        self.up = [False] * len(self.campuses)
+
+    def _send(self, index, command, *args):
+        if not self.up[index]:
+            return False
+        try:
+            self.connections[index].send((command, args))
+        except OSError:
+            self._shard_down(index)
+            return False
+        return True
+
+    def _receive(self, index, replay=True):
+        """Waits for the answer of a shard and shows its messages
+
+        Returns:
+            The result of the command, None if the shard failed
+        """
+
+        try:
+            answer = self.connections[index].recv()
+        except (EOFError, OSError):
+            self._shard_down(index)
+            return None
+        if answer[0] == "error" and len(answer) == 2:
+            self.output.emit(
+                "red", "shard_error", "Campus {campus} failed: {error}",
+                campus=self.campuses[index], error=answer[1])
+            return None
+        result, messages, self.vacant[index] = answer
+        for style, event, text, fields in messages:
+            if replay or event in ERROR_EVENTS:
+                self.output.emit(
+                    style, event, lambda text=text: text,
+                    campus=self.campuses[index], **fields)
+        return result
+
+    def _call(self, index, command, *args, replay=True):
+        if not self._send(index, command, *args):
+            return None
+        return self._receive(index, replay)
+
+    def _broadcast(self, command, *args, replay=True):
+        """Runs a command on every campus at once
+
+        Returns:
+            list: Result of each campus, None for campuses that failed
+        """
+
+        sent = [self._send(index, command, *args)
+                for index in range(len(self.campuses))]
+        return [self._receive(index, replay) if sent[index] else None
+                for index in range(len(self.campuses))]
+
+    def _shard_down(self, index):
+        self.up[index] = False
+        self.vacant[index] = {"office": False, "living_space": False}
+        self.output.emit(
+            "red", "shard_down",
+            "Campus {campus} is not responding, its rooms and people are "
+            "unavailable", campus=self.campuses[index])
+
+    def _campus_index(self, campus):
+        """Returns the shard of a campus, None after reporting it unknown"""
+
+        if campus in self.campuses:
+            return self.campuses.index(campus)
+        self.output.emit(
+            "red", "unknown_campus",
+            "There is no campus called {campus}, choose one of {campuses}",
+            campus=campus, campuses=", ".join(self.campuses))
+
+    def create_room(self, room_type, *room_names, campus=None):
+        """Creates rooms on a campus, see Dojo.create_room
+
+        Rooms go to the campus with the fewest rooms when none is given.
+
+        Returns:
+            str || str[]: Name of the room created, or names if several
+        """
+
+        created_rooms = self.create_rooms(
+            ((room_type, room_name) for room_name in room_names), campus)
+        return created_rooms[0] if len(created_rooms) == 1 else created_rooms
+
+    def create_rooms(self, rooms, campus=None):
+        """Creates many rooms at once, see Dojo.create_rooms
+
+        Returns:
+            str[]: Names of the rooms created
+        """
+
+        target = None
+        if campus is not None:
+            target = self._campus_index(campus)
+            if target is None:
+                return []
+        room_counts = [0] * len(self.campuses)
+        for index in self.room_campus.values():
+            room_counts[index] += 1
+        batches = [[] for _ in self.campuses]
+        for room_type, room_name in rooms:
+            if room_name in self.room_campus:
+                self.output.emit(
+                    "red", "duplicate_room",
+                    "Room with name: {room_name} already exists. "
+                    "Please try using another name", room_name=room_name)
+                continue
+            index = target
+            if index is None:
+                index = min((index for index in range(len(self.campuses))
+                             if self.up[index]),
+                            key=room_counts.__getitem__, default=None)
+                if index is None:
+                    self.output.emit(
+                        "red", "no_campus", "No campus is responding")
+                    return []
+            room_counts[index] += 1
+            self.room_campus[room_name] = index
+            batches[index].append((room_type, room_name))
+        sent = [bool(batch) and self._send(index, "create_rooms", batch)
+                for index, batch in enumerate(batches)]
+        created_rooms = []
+        for index, batch in enumerate(batches):
+            created = self._receive(index) if sent[index] else None
+            created_rooms.extend(created or [])
+            for _, room_name in batch:
+                if not created or room_name not in created:
+                    self.room_campus.pop(room_name, None)
+        return created_rooms
+
+    def load_rooms(self, file):
+        """Creates the rooms listed in a text file, see Dojo.load_rooms
+
+        Rooms are spread over the campuses as create_rooms spreads them and
+        every campus creates its share at once.
+
+        Returns:
+            dict: Names of the rooms created and (line, error) pairs of
+            rejected lines
+        """
+
+        import sys
+
+        if file != "-" and not os.path.isfile(file):
+            self.output.emit(
+                "red", "missing_file",
+                "File does not exist! Please specify another file",
+                file_name=file)
+            return
+        lines = sys.stdin if file == "-" else open(file, "r")
+        rooms, line_numbers, rejected = [], [], []
+        try:
+            for line_no, room_data in parse_people(lines):
+                error = validate_room_data(room_data)
+                if error:
+                    rejected.append((line_no, error))
+                else:
+                    rooms.append((room_data[0], room_data[1]))
+                    line_numbers.append(line_no)
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+        taken = set(self.room_campus)
+        created = set(self.create_rooms(rooms))
+        created_rooms = []
+        for line_no, (_, room_name) in zip(line_numbers, rooms):
+            if room_name in taken:
+                rejected.append((line_no, REJECTIONS["duplicate_room"]))
+            elif room_name in created:
+                taken.add(room_name)
+                created_rooms.append(room_name)
+            elif not room_name.isalpha():
+                rejected.append((line_no, REJECTIONS["invalid_room_name"]))
+            else:
+                rejected.append((line_no, "campus is not responding"))
+        rejected.sort()
+        self.output.emit(
+            "blue", "rooms_loaded",
+            "{created} rooms created, {rejected_count} rejected",
+            created=len(created_rooms), rejected_count=len(rejected))
+        for line_no, error in rejected:
+            self.output.emit(
+                "orange", "line_rejected", "  line {line}: {error}",
+                line=line_no, error=error)
+        return {"created": created_rooms, "rejected": rejected}
+
+    def _choose_campus(self, needs_living_space, preferred=None, slots=None):
+        """Picks the campus a new person is added to
+
+        The preferred campus is used if it can allocate every room the
+        person needs, then any other campus that can, taken in turn, then
+        any that can allocate an office and lastly a living space.
+
+        Args:
+            needs_living_space (bool): The person is a fellow wanting one
+            preferred (int): Shard of the campus asked for
+            slots (dict[]): Free slots of each shard, used instead of the
+                vacancy of the shards when given
+
+        Returns:
+            int: Shard index, None if every campus is down
+        """
+
+        up = [index for index in range(len(self.campuses)) if self.up[index]]
+        if not up:
+            return None
+        start = next(self._turn)
+        order = sorted(up, key=lambda index: (
+            index != preferred, (index - start) % len(self.campuses)))
+        vacancy = slots or self.vacant
+
+        def fits(index, room_types):
+            return all(vacancy[index][room_type] for room_type in room_types)
+
+        wanted = [("office", "living_space"), ("office",),
+                  ("living_space",)] if needs_living_space else [("office",)]
+        for room_types in wanted:
+            for index in order:
+                if fits(index, room_types):
+                    return index
+        return order[0]
+
+    def add_person(self, first_name, last_name, person_type,
+                   wants_accommodation="N", campus=None):
+        """Adds a person to a campus, see Dojo.add_person
+
+        When the campus asked for has no vacant rooms the person is added to
+        another campus that has.
+        """
+
+        preferred = None
+        if campus is not None:
+            preferred = self._campus_index(campus)
+            if preferred is None:
+                return
+        # A campus found down on the way is skipped and another one tried
+        results, index = None, None
+        while results is None:
+            index = self._choose_campus(
+                wants_accommodation == "Y" and
+                person_type.lower() == "fellow", preferred)
+            if index is None:
+                self.output.emit(
+                    "red", "no_campus", "No campus is responding")
+                return
+            if preferred is not None and index != preferred:
+                self.output.emit(
+                    "orange", "campus_fallback",
+                    "{campus} has no room for {first_name}, who is going to "
+                    "{other} instead",
+                    campus=campus, first_name=first_name,
+                    other=self.campuses[index])
+            results = self._call(
+                index, "add_people", [(self.next_person_id, first_name,
+                                       last_name, person_type,
+                                       wants_accommodation)])
+            if results is None and self.up[index]:
+                return
+        if results[0] is None:
+            return
+        self.person_campus[self.next_person_id] = index
+        self.next_person_id += 1
+        return results[0]
+
+    def load_people(self, file, batch_size=None):
+        """Loads the people of a text file, see Dojo.load_people
+
+        People are spread over the campuses by their free slots and each
+        batch is added on every campus at once.
+
+        Returns:
+            dict: Number of people added and the rejected lines
+        """
+
+        import sys
+
+        if file != "-" and not os.path.isfile(file):
+            self.output.emit(
+                "red", "missing_file",
+                "File does not exist! Please specify another file",
+                file_name=file)
+            return
+        totals = {"added": 0, "rejected": []}
+        lines = sys.stdin if file == "-" else open(file, "r")
+        try:
+            records = parse_people(lines)
+            while True:
+                batch = list(itertools.islice(
+                    records, int(batch_size or 1000)))
+                if not batch:
+                    break
+                self._load_batch(batch, totals)
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+        self.output.emit(
+            "blue", "people_loaded",
+            "{added} people added, {rejected_count} rejected",
+            added=totals["added"], rejected_count=len(totals["rejected"]))
+        return totals
+
+    def _free_slots(self):
+        """Free slots of each room type on every campus, none if down"""
+
+        return [free or {"office": 0, "living_space": 0}
+                for free in self._broadcast("free_slots", replay=False)]
+
+    def _place(self, person_data, slots, batches):
+        """Queues a valid person for the campus with room for them
+
+        The person gets the next id and the slots they need are taken from
+        slots, so the next person sees what is left.
+
+        Returns:
+            bool: False if every campus is down
+        """
+
+        wants_accommodation = person_data[3].upper() \
+            if len(person_data) == 4 else "N"
+        needs_living_space = wants_accommodation == "Y" and \
+            person_data[2].lower() == "fellow"
+        index = self._choose_campus(needs_living_space, slots=slots)
+        if index is None:
+            self.output.emit("red", "no_campus", "No campus is responding")
+            return False
+        slots[index]["office"] -= slots[index]["office"] > 0
+        if needs_living_space:
+            slots[index]["living_space"] -= slots[index]["living_space"] > 0
+        batches[index].append(
+            (self.next_person_id,) + tuple(person_data[:3]) +
+            (wants_accommodation,))
+        self.next_person_id += 1
+        return True
+
+    def allocate_batch(self, people):
+        """Adds a whole cohort of people at once, see Dojo.allocate_batch
+
+        The cohort is split over the campuses by their free slots and every
+        campus allocates its share as one batch, all at the same time.
+
+        Returns:
+            dict[]: Person and Rooms of everyone added, as add_person returns
+        """
+
+        slots = self._free_slots()
+        batches = [[] for _ in self.campuses]
+        rejected = []
+        for entry_no, person_data in enumerate(people, 1):
+            person_data = list(person_data)
+            error = validate_person_data(person_data)
+            if error:
+                rejected.append((entry_no, error))
+            elif not self._place(person_data, slots, batches):
+                return
+        sent = [bool(batch) and self._send(index, "allocate_batch", batch)
+                for index, batch in enumerate(batches)]
+        results = {}
+        for index, batch in enumerate(batches):
+            allocated = self._receive(index, replay=False) \
+                if sent[index] else None
+            for person, result in zip(batch, allocated or []):
+                self.person_campus[person[0]] = index
+                results[person[0]] = result
+        results = [results[person_id] for person_id in sorted(results)]
+        rooms = [room_type for result in results
+                 for room in result["Rooms"] for room_type in room]
+        self.output.emit(
+            "blue", "batch_allocated",
+            "{added} people added: {offices} allocated offices, "
+            "{living_spaces} of {wanted} allocated living spaces, "
+            "{rejected_count} rejected", added=len(results),
+            offices=rooms.count("office"),
+            living_spaces=rooms.count("living_space"),
+            wanted=sum(person[4] == "Y" and person[3].lower() == "fellow"
+                       for batch in batches for person in batch),
+            rejected_count=len(rejected), rejected=rejected)
+        for entry_no, error in rejected:
+            self.output.emit(
+                "orange", "entry_rejected", "  entry {entry}: {error}",
+                entry=entry_no, error=error)
+        return results
+
+    def _load_batch(self, batch, totals):
+        slots = self._free_slots()
+        batches = [[] for _ in self.campuses]
+        for line_no, person_data in batch:
+            error = validate_person_data(person_data)
+            if error:
+                totals["rejected"].append((line_no, error))
+                self.output.emit(
+                    "orange", "line_rejected", "  line {line}: {error}",
+                    line=line_no, error=error)
+                continue
+            if not self._place(person_data, slots, batches):
+                return
+        sent = [bool(people) and self._send(index, "add_people", people)
+                for index, people in enumerate(batches)]
+        for index, people in enumerate(batches):
+            if sent[index] and self._receive(index) is not None:
+                for person in people:
+                    self.person_campus[person[0]] = index
+                totals["added"] += len(people)
+
+    def reallocate_person(self, person_id, new_room_name=None,
+                          room_type="office"):
+        """Reallocates a person within their campus, see
+        Dojo.reallocate_person
+        """
+
+        index = self.person_campus.get(person_id)
+        if index is None:
+            self.output.emit(
+                "red", "unknown_person",
+                "Person with person id {person_id} does not exist in the "
+                "system.Please change id and try again", person_id=person_id)
+            return
+        if new_room_name is not None:
+            room_index = self.room_campus.get(new_room_name)
+            if room_index is None:
+                self.output.emit(
+                    "red", "unknown_room",
+                    "{room_name} does not exist in the system."
+                    "Please change name and try again!",
+                    room_name=new_room_name)
+                return
+            if room_index != index:
+                self.output.emit(
+                    "red", "different_campus",
+                    "Can not reallocate person {person_id} to {room_name} "
+                    "on campus {other}, people only move within their "
+                    "campus {campus}", person_id=person_id,
+                    room_name=new_room_name,
+                    other=self.campuses[room_index],
+                    campus=self.campuses[index])
+                return
+        self._call(index, "reallocate_person", person_id, new_room_name,
+                   room_type)
+
+    def reallocate_many(self, moves):
+        """Reallocates many people within their campuses, see
+        Dojo.reallocate_many
+
+        Every campus checks its part of the plan before any campus moves
+        anyone, so nobody is moved unless every move is valid. Each campus
+        then moves its people in one atomic step. Only a campus going down
+        between the check and the moves can leave a plan partly applied.
+
+        Returns:
+            dict: Number of people moved and (entry_no, error) of every
+            invalid move
+        """
+
+        moves = list(moves)
+        rejected = []
+        plans = [[] for _ in self.campuses]
+        for entry_no, (person_id, room_name) in enumerate(moves, 1):
+            index = self.person_campus.get(person_id)
+            room_index = self.room_campus.get(room_name)
+            if index is None:
+                rejected.append(
+                    (entry_no, "person {0} does not exist".format(person_id)))
+            elif room_index is None:
+                rejected.append(
+                    (entry_no, "room {0} does not exist".format(room_name)))
+            elif room_index != index:
+                rejected.append(
+                    (entry_no, "person {0} is on campus {1} and {2} on "
+                     "campus {3}".format(person_id, self.campuses[index],
+                                         room_name,
+                                         self.campuses[room_index])))
+            else:
+                plans[index].append((entry_no, person_id, room_name))
+
+        sent = [bool(plan) and self._send(index, "check_moves", plan)
+                for index, plan in enumerate(plans)]
+        for index, plan in enumerate(plans):
+            if not plan:
+                continue
+            found = self._receive(index) if sent[index] else None
+            if found is None:
+                rejected.extend(
+                    (entry_no, "campus {0} is not responding".format(
+                        self.campuses[index])) for entry_no, _, _ in plan)
+            else:
+                rejected.extend(found)
+        if rejected:
+            rejected.sort()
+            self.output.emit(
+                "red", "reallocation_rejected",
+                "Nobody has been reallocated, {rejected_count} of {moves} "
+                "moves are invalid", rejected_count=len(rejected),
+                moves=len(moves), rejected=rejected)
+            for entry_no, error in rejected:
+                self.output.emit(
+                    "orange", "move_rejected", "  move {entry}: {error}",
+                    entry=entry_no, error=error)
+            return {"moved": 0, "rejected": rejected}
+
+        sent = [bool(plan) and self._send(index, "reallocate_many", plan)
+                for index, plan in enumerate(plans)]
+        moved = 0
+        for index, plan in enumerate(plans):
+            if sent[index]:
+                result = self._receive(index, replay=False)
+                moved += result["moved"] if result else 0
+        self.output.emit(
+            "green", "people_reallocated",
+            "{moved} people have been successfully reallocated",
+            moved=moved)
+        return {"moved": moved, "rejected": []}
+
+    def print_room(self, room_name):
+        """Prints all the people in a room """
+
+        index = self.room_campus.get(room_name)
+        if index is None:
+            self.output.emit(
+                "red", "unknown_room",
+                "{room_name} does not exist in the system."
+                "Please change name and try again!", room_name=room_name)
+            return []
+        return self._call(index, "print_room", room_name) or []
+
+    def rooms(self):
+        """Yields the rooms of every campus in turn, with their residents
+
+        Each campus sends its rooms in chunks of CHUNK_SIZE as they are
+        read, so only one chunk is held in memory at a time.
+        """
+
+        for index in range(len(self.campuses)):
+            if not self._send(index, "rooms"):
+                continue
+            while True:
+                try:
+                    chunk = self.connections[index].recv()
+                except (EOFError, OSError):
+                    self._shard_down(index)
+                    break
+                if chunk is None:
+                    break
+                for room_name, room_type, residents in chunk:
+                    room = Office(room_name) if room_type == "office" \
+                        else LivingSpace(room_name)
+                    room.residents = {
+                        Staff(first_name, last_name, person_id)
+                        if person_type == "staff" else Fellow(
+                            first_name, last_name, wants_accommodation,
+                            person_id): None
+                        for person_id, first_name, last_name, person_type,
+                        wants_accommodation in residents}
+                    yield room
+
+    def print_allocations(self, file_name=None, print_table="N",
+                          output_format=None, compress=None):
+        """Prints the rooms of every campus, see Dojo.print_allocations
+
+        Returns:
+            list: Room dicts on the screen, person rows as a table and None
+            when written to a file, as Dojo.print_allocations returns
+        """
+
+        from .reports import allocation_text, write_allocations
+
+        if print_table != "N":
+            rows = [row for rows in self._broadcast(
+                "allocation_rows", replay=False) for row in rows or []]
+            if rows:
+                self.output.emit(
+                    "blue", "allocations_header",
+                    "List showing people with space "
+                    "and their respective rooms")
+                self.output.emit(
+                    "blue", "allocations_table",
+                    lambda: make_table(
+                        ['Name', 'Type', 'Office', 'Living Space'], rows),
+                    rows=rows)
+            else:
+                self.output.emit(
+                    "orange", "no_allocations",
+                    "There are no people allocated"
+                    " to any rooms at the moment")
+            return rows
+        if file_name:
+            try:
+                write_allocations(self.rooms(), "resources/" + file_name,
+                                  output_format, compress)
+            except ValueError as exception:
+                self.output.emit(
+                    "red", "unknown_format", str(exception),
+                    file_name=file_name)
+            return
+        allocations = []
+        for room in self.rooms():
+            self.output.emit(
+                "blue", "allocation",
+                lambda room=room: allocation_text(room).rstrip("\n") + "\n",
+                room_name=room.name)
+            allocations.append({room.name: [
+                person.get_fullname().upper() for person in room.residents]})
+        if not allocations:
+            self.output.emit(
+                "orange", "no_allocations",
+                "There are no people allocated to "
+                "any rooms at the moment")
+        return allocations
+
+    def print_unallocated(self, file_name=None):
+        """Prints the unallocated people of every campus, see
+        Dojo.print_unallocated
+        """
+
+        # Each campus lists its people by id, so the lists only need merging
+        rows = heapq.merge(
+            *[rows or [] for rows in self._broadcast(
+                "unallocated", replay=False)],
+            key=lambda row: row["Person id"])
+        if file_name:
+            write_unallocated(rows, "resources/" + file_name)
+            return None
+        unallocated_people = list(rows)
+        self.output.emit(
+            "blue", "unallocated_header",
+            "Table showing people along with missing rooms")
+        self.output.emit(
+            "blue", "unallocated_table",
+            lambda: make_table(
+                ['Name', 'Person id', 'Missing'],
+                [[row["Name"], row["Person id"], row["Missing"]]
+                 for row in unallocated_people]),
+            unallocated=unallocated_people)
+        return unallocated_people
+
+    def print_utilisation(self):
+        """Prints how full each room type is over every campus, see
+        Dojo.print_utilisation
+        """
+
+        results = [result for result in self._broadcast("utilisation")
+                   if result is not None]
+        usage, full_rooms = {}, []
+        for campus_usage, campus_full_rooms in results:
+            full_rooms.extend(campus_full_rooms)
+            for room_type, figures in campus_usage.items():
+                totals = usage.setdefault(
+                    room_type, {"residents": 0, "capacity": 0})
+                totals["residents"] += figures["residents"]
+                totals["capacity"] += figures["capacity"]
+        for room_type, figures in usage.items():
+            figures["ratio"] = figures["residents"] / figures["capacity"] \
+                if figures["capacity"] else 0.0
+            self.output.emit(
+                "blue", "utilisation",
+                "{room_type}: {residents} of {capacity} slots in use "
+                "({percent:.0%})", room_type=room_type,
+                percent=figures["ratio"], **figures)
+        self.output.emit(
+            "blue", "full_rooms", lambda: "Full rooms: " + (
+                ", ".join(full_rooms) if full_rooms else "none"),
+            full_rooms=full_rooms)
+        return usage
+
+    def save_state(self, db_file=None):
+        """Saves every campus to its own database in resources/, named by
+        campus_file()
+        """
+
+        if not db_file:
+            return
+        sent = [self._send(index, "save_state", campus_file(db_file, campus))
+                for index, campus in enumerate(self.campuses)]
+        for index in range(len(self.campuses)):
+            if sent[index]:
+                self._receive(index)
+
+    def load_state(self, db_file=None):
+        """Loads every campus from the databases written by save_state
+
+        Campuses that were never saved are left as they are.
+        """
+
+        if not db_file:
+            return
+        sent = [self._send(index, "load_state", campus_file(db_file, campus))
+                for index, campus in enumerate(self.campuses)]
+        for index in range(len(self.campuses)):
+            loaded = self._receive(index) if sent[index] else None
+            if loaded is None:
+                continue
+            room_names, person_ids = loaded
+            for room_name in room_names:
+                self.room_campus[room_name] = index
+            for person_id in person_ids:
+                self.person_campus[person_id] = index
+        self.next_person_id = max(self.person_campus, default=0) + 1
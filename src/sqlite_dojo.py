@@ -0,0 +1,988 @@
+"""class SQLiteDojo
+
+Dojo that keeps its rooms and people in an SQLite database instead of in
+memory. It offers the same commands as Dojo but every command reads and
+writes the database directly, so the dojo can be larger than RAM and opening
+it does not load anything. The database uses the schema written by
+Dojo.save_state, so either can open a database written by the other.
+
+Vacant rooms are found through the free slots kept in the room_vacancy table
+and its partial indexes, so allocating a room costs a few index lookups
+however many rooms and people there are. The table is filled the first time
+a database is opened and then kept up to date by triggers on the room and
+room_person tables, which also catch the writes of Dojo.save_state. The
+database runs in WAL mode and statements are written once as constants so
+that the statement cache of sqlite3 reuses their prepared form.
+
+Example:
+    To open or create a dojo stored in campus.db, use
+        dojo = SQLiteDojo("campus.db")
+
+Attributes:
+    connection (sqlite3.Connection): Connection to the database
+    rooms (SQLiteRooms): Every room with its residents, read on demand
+    output (OutputSink): Sink that receives every message shown to the user
+    strategies (dict): AllocationStrategy used for each room type
+    vacancies (dict): SQLiteVacancies of each room type
+"""
+
+import collections.abc
+import contextlib
+import itertools
+import random
+import sqlite3
+
+from .fellow import Fellow
+from .helpers import make_table, missing_rooms, parse_people, \
+    plan_moves, validate_person_data, validate_room_data, \
+    write_unallocated, REJECTIONS
+from .living_space import LivingSpace
+from .office import Office
+from .output import ColorSink
+from .schema import create_schema, CAPACITY, DELETE_ROOM_PERSON, \
+    UPSERT_ROOM_PERSON
+from .staff import Staff
+from .strategies import RandomStrategy, FirstFitStrategy
+
+ROOM_EXISTS = "SELECT 1 FROM room WHERE room_name = ?"
+INSERT_ROOM = "INSERT INTO room VALUES (?, ?, NULL)"
+ROOM_FREE_SLOTS = CAPACITY.format("{0}.room_type") + """ - (
+    SELECT COUNT(*) FROM room_person
+    WHERE room_person.room_name = {0}.room_name)"""
+CLEAR_ROOM_VACANCY = "DELETE FROM room_vacancy"
+FILL_ROOM_VACANCY = """INSERT INTO room_vacancy
+    SELECT room_name, room_type, """ + ROOM_FREE_SLOTS.format("room") + """
+    FROM room ORDER BY rowid"""
+# Keep room_vacancy in step with every write to room and room_person,
+# whether it comes from SQLiteDojo or from Dojo.save_state
+VACANCY_TRIGGERS = [
+    """CREATE TRIGGER room_vacancy_room_insert AFTER INSERT ON room
+    BEGIN
+        INSERT OR REPLACE INTO room_vacancy VALUES (
+            new.room_name, new.room_type, """ +
+    ROOM_FREE_SLOTS.format("new") + """);
+    END""",
+    """CREATE TRIGGER room_vacancy_room_update
+    AFTER UPDATE OF room_type ON room
+    BEGIN
+        UPDATE room_vacancy SET room_type = new.room_type,
+            free_slots = """ + ROOM_FREE_SLOTS.format("new") + """
+        WHERE room_name = new.room_name;
+    END""",
+    """CREATE TRIGGER room_vacancy_room_delete AFTER DELETE ON room
+    BEGIN
+        DELETE FROM room_vacancy WHERE room_name = old.room_name;
+    END""",
+    """CREATE TRIGGER room_vacancy_take_slot AFTER INSERT ON room_person
+    BEGIN
+        UPDATE room_vacancy SET free_slots = free_slots - 1
+        WHERE room_name = new.room_name;
+    END""",
+    """CREATE TRIGGER room_vacancy_move_slot
+    AFTER UPDATE OF room_name ON room_person
+    BEGIN
+        UPDATE room_vacancy SET free_slots = free_slots + 1
+        WHERE room_name = old.room_name;
+        UPDATE room_vacancy SET free_slots = free_slots - 1
+        WHERE room_name = new.room_name;
+    END""",
+    """CREATE TRIGGER room_vacancy_free_slot AFTER DELETE ON room_person
+    BEGIN
+        UPDATE room_vacancy SET free_slots = free_slots + 1
+        WHERE room_name = old.room_name;
+    END""",
+]
+TRIGGERS_MISSING = """SELECT NOT EXISTS (SELECT 1 FROM sqlite_master
+    WHERE type = 'trigger' AND name = 'room_vacancy_room_insert')"""
+SELECT_ROOM_TYPE = "SELECT room_type FROM room WHERE room_name = ?"
+NEXT_PERSON_ID = "SELECT COALESCE(MAX(person_id), 0) + 1 FROM person"
+INSERT_PERSON = "INSERT INTO person VALUES (?, ?, ?, ?, NULL, NULL, ?)"
+SELECT_PERSON = "SELECT * FROM person WHERE person_id = ?"
+SELECT_PERSON_ROOM = """SELECT room_name FROM room_person
+    WHERE person_id = ? AND room_type = ?"""
+SET_HAS_ROOM = """UPDATE person SET has_office = (
+        SELECT 1 FROM room_person
+        WHERE person_id = person.person_id AND room_type = 'office'),
+    has_living_space = (
+        SELECT 1 FROM room_person
+        WHERE person_id = person.person_id AND room_type = 'living_space')
+    WHERE person_id = ?"""
+SET_OCCUPATION_STATUS = """UPDATE room SET occupation_status = (
+        SELECT CASE WHEN free_slots <= 0 THEN 1 END FROM room_vacancy
+        WHERE room_vacancy.room_name = room.room_name)
+    WHERE room_name = ?"""
+FREE_SLOTS = "SELECT free_slots FROM room_vacancy WHERE room_name = ?"
+NEW_RESIDENTS = """SELECT * FROM source.room_person WHERE person_id NOT IN (
+        SELECT person_id FROM main.person)
+    ORDER BY rowid"""
+INSERT_RESIDENT = "INSERT OR IGNORE INTO room_person VALUES (?, ?, ?)"
+RESIDENT_NAMES = """SELECT first_name, last_name FROM room_person
+    JOIN person USING (person_id) WHERE room_name = ?
+    ORDER BY room_person.rowid"""
+COUNT_ROOMS = "SELECT COUNT(*) FROM room"
+ROOM_AT = """SELECT room_name, room_type FROM room ORDER BY rowid
+    LIMIT 1 OFFSET ?"""
+RESIDENTS = """SELECT person.person_id, first_name, last_name, person_type,
+        wants_accommodation
+    FROM room_person JOIN person USING (person_id) WHERE room_name = ?
+    ORDER BY room_person.rowid"""
+ROOMS_WITH_RESIDENTS = """SELECT room.room_name, room.room_type,
+        person.person_id, first_name, last_name, person_type,
+        wants_accommodation
+    FROM room LEFT JOIN room_person USING (room_name)
+    LEFT JOIN person USING (person_id)
+    ORDER BY room.rowid, room_person.rowid"""
+ALLOCATED_PEOPLE = """SELECT first_name, last_name, person_type,
+        office.room_name, living_space.room_name
+    FROM person
+    LEFT JOIN room_person AS office ON office.person_id = person.person_id
+        AND office.room_type = 'office'
+    LEFT JOIN room_person AS living_space
+        ON living_space.person_id = person.person_id
+        AND living_space.room_type = 'living_space'
+    WHERE office.room_name IS NOT NULL
+        OR living_space.room_name IS NOT NULL
+    ORDER BY person.person_id"""
+UNALLOCATED_PEOPLE = """SELECT person_id, first_name, last_name,
+        wants_accommodation,
+        EXISTS (SELECT 1 FROM room_person WHERE person_id = person.person_id
+                AND room_type = 'office'),
+        EXISTS (SELECT 1 FROM room_person WHERE person_id = person.person_id
+                AND room_type = 'living_space')
+    FROM person
+    WHERE NOT EXISTS (
+            SELECT 1 FROM room_person WHERE person_id = person.person_id
+            AND room_type = 'office')
+        OR wants_accommodation = 'Y' AND NOT EXISTS (
+            SELECT 1 FROM room_person WHERE person_id = person.person_id
+            AND room_type = 'living_space')
+    ORDER BY person_id"""
+UTILISATION = """SELECT room_type, COUNT(*), SUM(capacity - free_slots),
+        SUM(capacity)
+    FROM (SELECT room_type, free_slots, """ + CAPACITY.format("room_type") + \
+    """ AS capacity FROM room_vacancy)
+    GROUP BY room_type"""
+# Lines added per transaction by load_people when no batch size is given
+BATCH_SIZE = 1000
+FULL_ROOMS = """SELECT room_name FROM room_vacancy WHERE free_slots <= 0
+    ORDER BY rowid"""
+
+
+class SQLiteVacancies(object):
+    """Answers the picks of an AllocationStrategy with indexed queries
+
+    Offers the pick methods of VacancyIndex for the rooms of one type, and
+    returns room names instead of rooms.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the database
+        room_type (str): office or living_space
+
+    Attributes:
+        excluded (str): Name of a room never picked, None for no room
+    """
+
+    VACANT = """SELECT room_name FROM room_vacancy INDEXED BY {0}
+        WHERE room_type = ? AND free_slots > 0 AND room_name IS NOT ?"""
+    VACANT_ROWID = """SELECT rowid FROM room_vacancy
+        INDEXED BY room_vacancy_vacant
+        WHERE room_type = ? AND free_slots > 0 AND room_name IS NOT ?
+        ORDER BY rowid {0} LIMIT 1"""
+
+    def __init__(self, connection, room_type):
+        self.connection = connection
+        self.room_type = room_type
+        self.excluded = None
+
+    def __len__(self):
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM (" +
+            self.VACANT.format("room_vacancy_vacant") + ")",
+            (self.room_type, self.excluded)).fetchone()[0]
+
+    def _pick(self, index, order, first_rowid=0):
+        row = self.connection.execute(
+            self.VACANT.format(index) + " AND rowid >= ? ORDER BY " + order +
+            " LIMIT 1",
+            (self.room_type, self.excluded, first_rowid)).fetchone()
+        return row[0] if row else None
+
+    def pick_random(self, rng=random):
+        """Picks a vacant room at random
+
+        A rowid is drawn between the first and the last vacant room and the
+        first vacant room from there on is picked, which costs three index
+        seeks however many rooms there are. Rooms that follow a run of full
+        rooms are picked a little more often than the others.
+        """
+
+        bounds = [self.connection.execute(
+            self.VACANT_ROWID.format(order),
+            (self.room_type, self.excluded)).fetchone()
+            for order in ("ASC", "DESC")]
+        if bounds[0] is None:
+            return None
+        return self._pick("room_vacancy_vacant", "rowid",
+                          rng.randint(bounds[0][0], bounds[1][0]))
+
+    def pick_first(self):
+        return self._pick("room_vacancy_vacant", "rowid")
+
+    def pick_least_loaded(self):
+        return self._pick(
+            "room_vacancy_most_free_slots", "free_slots DESC, rowid")
+
+    def pick_most_loaded(self):
+        return self._pick("room_vacancy_free_slots", "free_slots, rowid")
+
+
+def make_room(room_name, room_type):
+    return Office(room_name) if room_type == "office" \
+        else LivingSpace(room_name)
+
+
+def make_person(person_id, first_name, last_name, person_type,
+                wants_accommodation):
+    return Staff(first_name, last_name, person_id) \
+        if person_type == "staff" else Fellow(
+            first_name, last_name, wants_accommodation, person_id)
+
+
+class SQLiteRooms(collections.abc.Sequence):
+    """Read only list of the rooms of an SQLiteDojo
+
+    Rooms are built from the database with their residents whenever they
+    are read, and iterating streams them one room at a time.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the database
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __len__(self):
+        return self.connection.execute(COUNT_ROOMS).fetchone()[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        row = self.connection.execute(ROOM_AT, (index,)).fetchone() \
+            if index >= 0 else None
+        if row is None:
+            raise IndexError("room index out of range")
+        room = make_room(*row)
+        room.residents.update(
+            (make_person(*person_row), None) for person_row in
+            self.connection.execute(RESIDENTS, (room.name,)))
+        return room
+
+    def __iter__(self):
+        rows = self.connection.cursor().execute(ROOMS_WITH_RESIDENTS)
+        for (room_name, room_type), room_rows in itertools.groupby(
+                rows, key=lambda row: row[:2]):
+            room = make_room(room_name, room_type)
+            for row in room_rows:
+                if row[2] is not None:
+                    room.residents[make_person(*row[2:])] = None
+            yield room
+
+
+class SQLiteDojo(object):
+    """ This class is responsible for managing rooms and people in SQLite
+
+    Args:
+        db_file (str): Database to open, created if missing
+        output (OutputSink): Sink for messages, ColorSink by default
+        office_strategy (AllocationStrategy): Picks offices
+        living_space_strategy (AllocationStrategy): Picks living spaces
+    """
+
+    def __init__(self, db_file, output=None, office_strategy=None,
+                 living_space_strategy=None):
+        self.output = output if output is not None else ColorSink()
+        self.strategies = {
+            "office": office_strategy or RandomStrategy(),
+            "living_space": living_space_strategy or FirstFitStrategy()}
+        self.connection = sqlite3.connect(db_file)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        create_schema(self.connection)
+        if self.connection.execute(TRIGGERS_MISSING).fetchone()[0]:
+            with self.connection:
+                self.connection.execute(CLEAR_ROOM_VACANCY)
+                self.connection.execute(FILL_ROOM_VACANCY)
+                for statement in VACANCY_TRIGGERS:
+                    self.connection.execute(statement)
+        self.vacancies = {
+            room_type: SQLiteVacancies(self.connection, room_type)
+            for room_type in ("office", "living_space")}
+        self.rooms = SQLiteRooms(self.connection)
+        self.waitlists = None
+        self.journal = None
+        self._depth = 0
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Runs a block in a transaction, committed by the outermost block"""
+
+        self._depth += 1
+        try:
+            yield self.connection
+        except BaseException:
+            if self._depth == 1:
+                self.connection.rollback()
+            raise
+        else:
+            if self._depth == 1:
+                self.connection.commit()
+        finally:
+            self._depth -= 1
+
+    def close(self):
+        """Closes the database"""
+
+        self.connection.close()
+
+    def _pick_room(self, room_type, excluded_room=None):
+        """Picks the name of a vacant room with the strategy for its type"""
+
+        vacancies = self.vacancies[room_type]
+        vacancies.excluded = excluded_room
+        try:
+            return self.strategies[room_type].pick(vacancies)
+        finally:
+            vacancies.excluded = None
+
+    def _add_to_room(self, person_id, room_name, room_type):
+        self.connection.execute(
+            UPSERT_ROOM_PERSON, (person_id, room_name, room_type))
+        self.connection.execute(SET_HAS_ROOM, (person_id,))
+        self.connection.execute(SET_OCCUPATION_STATUS, (room_name,))
+
+    def _remove_from_room(self, person_id, room_name, room_type):
+        self.connection.execute(DELETE_ROOM_PERSON, (person_id, room_type))
+        self.connection.execute(SET_HAS_ROOM, (person_id,))
+        self.connection.execute(SET_OCCUPATION_STATUS, (room_name,))
+
+    def create_room(self, room_type, *room_names):
+        """Creates new rooms, see Dojo.create_room"""
+
+        created_rooms = self.create_rooms(
+            (room_type, room_name) for room_name in room_names)
+        return created_rooms[0] if len(created_rooms) == 1 else created_rooms
+
+    def create_rooms(self, rooms):
+        """Creates many rooms at once, see Dojo.create_rooms
+
+        Returns:
+            Room[]: The rooms created
+        """
+
+        return [room for room, _ in self._create_rooms(rooms) if room]
+
+    def _create_rooms(self, rooms):
+        """Creates rooms, returning a (room, rejection) pair for each one"""
+
+        results = []
+        taken = set()
+        with self._transaction() as connection:
+            for room_type, room_name in rooms:
+                room = rejection = None
+                if room_name in taken or connection.execute(
+                        ROOM_EXISTS, (room_name,)).fetchone():
+                    rejection = "duplicate_room"
+                    self.output.emit(
+                        "red", "duplicate_room",
+                        "Room with name: {room_name} already exists. "
+                        "Please try using another name",
+                        room_name=room_name)
+                elif not room_name.isalpha():
+                    rejection = "invalid_room_name"
+                    self.output.emit(
+                        None, "invalid_room_name",
+                        "room name input must be string alphabet type",
+                        room_name=room_name)
+                else:
+                    taken.add(room_name)
+                    room = Office(room_name) if room_type.lower(
+                    ) == "office" else LivingSpace(room_name)
+                    connection.execute(INSERT_ROOM, (room.name, room._type))
+                    self.output.emit(
+                        "green", "room_created",
+                        "{room_type} called {room_name} has been "
+                        "successfully created!",
+                        room_type=room_type.capitalize(), room_name=room_name)
+                results.append((room, rejection))
+        return results
+
+    def load_rooms(self, file):
+        """Creates the rooms listed in a text file, see Dojo.load_rooms
+
+        Every room is created in a single transaction.
+
+        Returns:
+            dict: Rooms created and (line, error) pairs of rejected lines
+        """
+
+        import os.path
+        import sys
+
+        if file != "-" and not os.path.isfile(file):
+            self.output.emit(
+                "red", "missing_file",
+                "File does not exist! Please specify another file",
+                file_name=file)
+            return
+        lines = sys.stdin if file == "-" else open(file, "r")
+        rooms, line_numbers, rejected = [], [], []
+        try:
+            for line_no, room_data in parse_people(lines):
+                error = validate_room_data(room_data)
+                if error:
+                    rejected.append((line_no, error))
+                else:
+                    rooms.append((room_data[0], room_data[1]))
+                    line_numbers.append(line_no)
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+        created_rooms = []
+        for line_no, (room, rejection) in zip(
+                line_numbers, self._create_rooms(rooms)):
+            if room:
+                created_rooms.append(room)
+            else:
+                rejected.append((line_no, REJECTIONS[rejection]))
+        rejected.sort()
+        self.output.emit(
+            "blue", "rooms_loaded",
+            "{created} rooms created, {rejected_count} rejected",
+            created=len(created_rooms), rejected_count=len(rejected))
+        for line_no, error in rejected:
+            self.output.emit(
+                "orange", "line_rejected", "  line {line}: {error}",
+                line=line_no, error=error)
+        return {"created": created_rooms, "rejected": rejected}
+
+    def add_person(
+            self, first_name,
+            last_name, person_type, wants_accommodation="N"):
+        """Adds a person and allocates their rooms, see Dojo.add_person"""
+
+        if not first_name.isalpha() or not last_name.isalpha():
+            self.output.emit(
+                "orange", "invalid_person_name",
+                "Name should only contain alphabetic characters.\
+                Please rectify and try again",
+                first_name=first_name, last_name=last_name)
+            return
+        is_fellow = person_type.lower() != "staff"
+        rooms = []
+        with self._transaction() as connection:
+            person_id = connection.execute(NEXT_PERSON_ID).fetchone()[0]
+            connection.execute(
+                INSERT_PERSON,
+                (person_id, first_name, last_name,
+                 "fellow" if is_fellow else "staff",
+                 wants_accommodation if is_fellow else "N"))
+            self.output.emit(
+                "green", "person_added",
+                "{person_type} {first_name} {last_name} has been "
+                "successfully added", person_type=person_type,
+                first_name=first_name, last_name=last_name,
+                person_id=person_id)
+            office = self._pick_room("office")
+            if office:
+                self._add_to_room(person_id, office, "office")
+                rooms.append({"office": office})
+                self.output.emit(
+                    "green", "office_allocated",
+                    "{first_name} has been allocated the office {room_name}",
+                    first_name=first_name, person_id=person_id,
+                    room_name=office)
+            else:
+                self.output.emit(
+                    "red", "no_office",
+                    "Sorry, No more office rooms for {first_name} to occupy.",
+                    first_name=first_name, person_id=person_id)
+
+            if wants_accommodation == "Y" and not is_fellow:
+                self.output.emit(
+                    "red", "living_space_denied",
+                    "Sorry, No living space has been allocated to you as "
+                    "these are only meant for fellows.", person_id=person_id)
+            if wants_accommodation == "Y" and is_fellow:
+                living_space = self._pick_room("living_space")
+                if living_space:
+                    self._add_to_room(
+                        person_id, living_space, "living_space")
+                    rooms.append({"living_space": living_space})
+                    self.output.emit(
+                        "green", "living_space_allocated",
+                        "{first_name} has been allocated the living space "
+                        "{room_name}", first_name=first_name,
+                        person_id=person_id, room_name=living_space)
+                else:
+                    self.output.emit(
+                        "red", "no_living_space",
+                        "Sorry, there are no more free accommodation rooms"
+                        "for {first_name} to occupy.",
+                        first_name=first_name, person_id=person_id)
+        return {"Person": first_name + " " + last_name, "Rooms": rooms}
+
+    def allocate_batch(self, people):
+        """Adds a whole cohort of people at once, see Dojo.allocate_batch
+
+        The cohort is added in a single transaction. Each slot goes to the
+        vacant room with the most free slots, which the room_vacancy
+        indexes find in a few lookups.
+
+        Returns:
+            dict[]: Person and Rooms of everyone added, as add_person returns
+        """
+
+        cohort, rejected = [], []
+        with self._transaction() as connection:
+            person_id = connection.execute(NEXT_PERSON_ID).fetchone()[0]
+            for entry_no, person_data in enumerate(people, 1):
+                person_data = list(person_data)
+                error = validate_person_data(person_data)
+                if error:
+                    rejected.append((entry_no, error))
+                    continue
+                is_fellow = person_data[2].lower() == "fellow"
+                wants_accommodation = person_data[3].upper() \
+                    if len(person_data) == 4 and is_fellow else "N"
+                connection.execute(
+                    INSERT_PERSON,
+                    (person_id, person_data[0], person_data[1],
+                     "fellow" if is_fellow else "staff", wants_accommodation))
+                cohort.append((person_id, person_data[0] + " " +
+                               person_data[1], wants_accommodation, []))
+                person_id += 1
+            needs_living_space = [
+                person for person in cohort if person[2] == "Y"]
+            offices = self._fill_evenly("office", cohort)
+            living_spaces = self._fill_evenly(
+                "living_space", needs_living_space)
+
+        self.output.emit(
+            "blue", "batch_allocated",
+            "{added} people added: {offices} allocated offices, "
+            "{living_spaces} of {wanted} allocated living spaces, "
+            "{rejected_count} rejected", added=len(cohort), offices=offices,
+            living_spaces=living_spaces, wanted=len(needs_living_space),
+            rejected_count=len(rejected), rejected=rejected)
+        for entry_no, error in rejected:
+            self.output.emit(
+                "orange", "entry_rejected", "  entry {entry}: {error}",
+                entry=entry_no, error=error)
+        return [{"Person": full_name, "Rooms": rooms}
+                for _, full_name, _, rooms in cohort]
+
+    def _fill_evenly(self, room_type, people):
+        """Assigns people to the least occupied vacant rooms of a type
+
+        Returns:
+            int: Number of people that could be placed
+        """
+
+        vacancies = self.vacancies[room_type]
+        placed = 0
+        for person_id, _, _, rooms in people:
+            room_name = vacancies.pick_least_loaded()
+            if room_name is None:
+                break
+            self._add_to_room(person_id, room_name, room_type)
+            rooms.append({room_type: room_name})
+            placed += 1
+        return placed
+
+    def print_room(self, room_name):
+        """Prints all the people in a room """
+
+        if not self.connection.execute(ROOM_EXISTS, (room_name,)).fetchone():
+            self.output.emit(
+                "red", "unknown_room",
+                "{room_name} does not exist in the system."
+                "Please change name and try again!", room_name=room_name)
+            return []
+        residents = [first_name + " " + last_name for first_name, last_name
+                     in self.connection.execute(RESIDENT_NAMES, (room_name,))]
+        self.output.emit(
+            "blue", "room_header",
+            "People in Room: {room_name}"
+            "\n -----------------------------------"
+            "---------------------------------", room_name=room_name)
+        self.output.emit(
+            "blue", "room_residents", lambda: ", ".join(residents),
+            room_name=room_name, residents=residents)
+        return residents
+
+    def print_allocations(self, file_name=None, print_table="N",
+                          output_format=None, compress=None):
+        """Prints the people and respective rooms, see Dojo.print_allocations
+
+        Rooms are streamed from the database one at a time.
+
+        Returns:
+            list: Room dicts on the screen, person rows as a table and None
+            when written to a file, as Dojo.print_allocations returns
+        """
+
+        from .reports import allocation_text, write_allocations
+
+        if print_table != "N":
+            rows = [[first_name + " " + last_name, person_type,
+                     office or "Not Assigned", living_space or "Not Assigned"]
+                    for first_name, last_name, person_type, office,
+                    living_space in self.connection.execute(ALLOCATED_PEOPLE)]
+            if rows:
+                self.output.emit(
+                    "blue", "allocations_header",
+                    "List showing people with space "
+                    "and their respective rooms")
+                self.output.emit(
+                    "blue", "allocations_table",
+                    lambda: make_table(
+                        ['Name', 'Type', 'Office', 'Living Space'], rows),
+                    rows=rows)
+            else:
+                self.output.emit(
+                    "orange", "no_allocations",
+                    "There are no people allocated"
+                    " to any rooms at the moment")
+            return rows
+        if file_name:
+            try:
+                write_allocations(
+                    self.rooms, "resources/" + file_name, output_format,
+                    compress)
+            except ValueError as exception:
+                self.output.emit(
+                    "red", "unknown_format", str(exception),
+                    file_name=file_name)
+            return
+        allocations = []
+        for room in self.rooms:
+            self.output.emit(
+                "blue", "allocation",
+                lambda room=room: allocation_text(room).rstrip("\n") + "\n",
+                room_name=room.name)
+            allocations.append({room.name: [
+                person.get_fullname().upper() for person in room.residents]})
+        if not allocations:
+            self.output.emit(
+                "orange", "no_allocations",
+                "There are no people allocated to "
+                "any rooms at the moment")
+        return allocations
+
+    def print_unallocated(self, file_name=None):
+        """Prints unallocated people, see Dojo.print_unallocated
+
+        Rows are streamed from the database to the file one at a time.
+
+        Returns:
+            dict[]: Name, Person id and Missing room of every person listed,
+            None when written to a file
+        """
+
+        if file_name:
+            write_unallocated(self._unallocated_rows(),
+                              "resources/" + file_name)
+            return None
+        unallocated_people = list(self._unallocated_rows())
+        self.output.emit(
+            "blue", "unallocated_header",
+            "Table showing people along with missing rooms")
+        self.output.emit(
+            "blue", "unallocated_table",
+            lambda: make_table(
+                ['Name', 'Person id', 'Missing'],
+                [[row["Name"], row["Person id"], row["Missing"]]
+                 for row in unallocated_people]),
+            unallocated=unallocated_people)
+        return unallocated_people
+
+    def _unallocated_rows(self):
+        for person_id, first_name, last_name, wants_accommodation, \
+                has_office, has_living_space in \
+                self.connection.cursor().execute(UNALLOCATED_PEOPLE):
+            person = Fellow(first_name, last_name, wants_accommodation,
+                            person_id)
+            person.office = True if has_office else None
+            person.living_space = True if has_living_space else None
+            yield {"Name": person.get_fullname(), "Person id": person_id,
+                   "Missing": missing_rooms(person)}
+
+    def print_utilisation(self):
+        """Prints how full each room type is along with the full rooms
+
+        Returns:
+            dict: Utilisation of each room type
+        """
+
+        usage = {room_type: {"residents": 0, "capacity": 0, "ratio": 0.0}
+                 for room_type in ("office", "living_space")}
+        for room_type, _, residents, capacity in self.connection.execute(
+                UTILISATION):
+            usage[room_type] = {
+                "residents": residents, "capacity": capacity,
+                "ratio": residents / capacity if capacity else 0.0}
+        for room_type, figures in usage.items():
+            self.output.emit(
+                "blue", "utilisation",
+                "{room_type}: {residents} of {capacity} slots in use "
+                "({percent:.0%})", room_type=room_type,
+                percent=figures["ratio"], **figures)
+        full_rooms = [row[0] for row in self.connection.execute(FULL_ROOMS)]
+        self.output.emit(
+            "blue", "full_rooms", lambda: "Full rooms: " + (
+                ", ".join(full_rooms) if full_rooms else "none"),
+            full_rooms=full_rooms)
+        return usage
+
+    def reallocate_person(self, person_id, new_room_name=None,
+                          room_type="office"):
+        """Reallocates person from one room to another
+
+        See Dojo.reallocate_person.
+        """
+
+        if not self.connection.execute(SELECT_PERSON, (person_id,)) \
+                .fetchone():
+            self.output.emit(
+                "red", "unknown_person",
+                "Person with person id {person_id} does not exist in the "
+                "system.Please change id and try again", person_id=person_id)
+            return
+        with self._transaction() as connection:
+            if new_room_name is None:
+                current_room = connection.execute(
+                    SELECT_PERSON_ROOM, (person_id, room_type)).fetchone()
+                new_room_name = self._pick_room(
+                    room_type, current_room[0] if current_room else None)
+                if new_room_name is None:
+                    self.output.emit(
+                        "red", "no_vacant_room",
+                        "There is no other {room_type} with free space to "
+                        "move person {person_id} to", room_type=room_type,
+                        person_id=person_id)
+                    return
+            row = connection.execute(
+                SELECT_ROOM_TYPE, (new_room_name,)).fetchone()
+            if row is None:
+                self.output.emit(
+                    "red", "unknown_room",
+                    "{room_name} does not exist in the system."
+                    "Please change name and try again!",
+                    room_name=new_room_name)
+                return
+            new_room_type = row[0]
+            if connection.execute(
+                    FREE_SLOTS, (new_room_name,)).fetchone()[0] <= 0:
+                self.output.emit(
+                    "red", "room_full",
+                    "Room: {room_name}is fully occupied. "
+                    "Please change room and try again",
+                    person_id=person_id, room_name=new_room_name)
+                return
+            current_room = connection.execute(
+                SELECT_PERSON_ROOM, (person_id, new_room_type)).fetchone()
+            if current_room is None:
+                self._add_to_room(person_id, new_room_name, new_room_type)
+                first_name, last_name = connection.execute(
+                    SELECT_PERSON, (person_id,)).fetchone()[1:3]
+                self.output.emit(
+                    "green", "person_assigned",
+                    "{full_name} has been assigned to room {room_name}",
+                    full_name=(first_name + " " + last_name).capitalize(),
+                    person_id=person_id, room_name=new_room_name)
+                return
+            if current_room[0] == new_room_name:
+                self.output.emit(
+                    "red", "same_room",
+                    "Can not reallocate to the same room. Please specify "
+                    "another room name and try again!", person_id=person_id,
+                    room_name=new_room_name)
+                return
+            self._remove_from_room(person_id, current_room[0], new_room_type)
+            self._add_to_room(person_id, new_room_name, new_room_type)
+            first_name, last_name = connection.execute(
+                SELECT_PERSON, (person_id,)).fetchone()[1:3]
+            self.output.emit(
+                "green", "person_reallocated",
+                "{first_name} {last_name} has been successfully "
+                "reallocated to room {room_name}", first_name=first_name,
+                last_name=last_name, person_id=person_id,
+                room_name=new_room_name)
+
+    def reallocate_many(self, moves):
+        """Reallocates many people at once, see Dojo.reallocate_many
+
+        The plan is checked with a few index lookups per move and applied in
+        one transaction, which is rolled back if any move fails.
+
+        Returns:
+            dict: Number of people moved and (entry_no, error) of every
+            invalid move
+        """
+
+        connection = self.connection
+
+        def person_exists(person_id):
+            return connection.execute(
+                SELECT_PERSON, (person_id,)).fetchone() is not None
+
+        def room_type_of(room_name):
+            row = connection.execute(
+                SELECT_ROOM_TYPE, (room_name,)).fetchone()
+            return row[0] if row else None
+
+        def current_room(person_id, room_type):
+            row = connection.execute(
+                SELECT_PERSON_ROOM, (person_id, room_type)).fetchone()
+            return row[0] if row else None
+
+        def free_slots(room_name):
+            return connection.execute(
+                FREE_SLOTS, (room_name,)).fetchone()[0]
+
+        moves = list(moves)
+        plan, rejected = plan_moves(
+            ((entry_no, person_id, room_name)
+             for entry_no, (person_id, room_name) in enumerate(moves, 1)),
+            person_exists, room_type_of, current_room, free_slots)
+        if rejected:
+            self.output.emit(
+                "red", "reallocation_rejected",
+                "Nobody has been reallocated, {rejected_count} of {moves} "
+                "moves are invalid", rejected_count=len(rejected),
+                moves=len(moves), rejected=rejected)
+            for entry_no, error in rejected:
+                self.output.emit(
+                    "orange", "move_rejected", "  move {entry}: {error}",
+                    entry=entry_no, error=error)
+            return {"moved": 0, "rejected": rejected}
+        with self._transaction():
+            for _, person_id, current, _, room_type in plan:
+                if current is not None:
+                    self._remove_from_room(person_id, current, room_type)
+            for _, person_id, _, room_name, room_type in plan:
+                self._add_to_room(person_id, room_name, room_type)
+        self.output.emit(
+            "green", "people_reallocated",
+            "{moved} people have been successfully reallocated",
+            moved=len(plan))
+        return {"moved": len(plan), "rejected": []}
+
+    def load_people(self, file, batch_size=None):
+        """Loads the people from the text file, see Dojo.load_people
+
+        Lines are read as a stream and each batch of batch_size lines,
+        BATCH_SIZE by default, is added in a single transaction.
+
+        Returns:
+            dict: Number of people added and (line, error) pairs of rejected
+            lines
+        """
+
+        import os.path
+        import sys
+
+        if file != "-" and not os.path.isfile(file):
+            self.output.emit(
+                "red", "missing_file",
+                "File does not exist! Please specify another file",
+                file_name=file)
+            return
+        lines = sys.stdin if file == "-" else open(file, "r")
+        totals = {"added": 0, "rejected": []}
+        records = parse_people(lines)
+        try:
+            while True:
+                batch = list(itertools.islice(
+                    records, int(batch_size) if batch_size else BATCH_SIZE))
+                if not batch:
+                    break
+                with self._transaction():
+                    for line_no, person_data in batch:
+                        error = validate_person_data(person_data)
+                        if error:
+                            totals["rejected"].append((line_no, error))
+                            self.output.emit(
+                                "orange", "line_rejected",
+                                "  line {line}: {error}", line=line_no,
+                                error=error)
+                            continue
+                        self.add_person(*person_data[:3], **(
+                            {"wants_accommodation": person_data[3].upper()}
+                            if len(person_data) == 4 else {}))
+                        totals["added"] += 1
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+        return totals
+
+    def save_state(self, db_file=None):
+        """Copies the database to resources/<db_file>
+
+        The dojo is always saved, so this only makes a copy.
+        """
+
+        if db_file:
+            target = sqlite3.connect("resources/" + db_file)
+            with target:
+                self.connection.backup(target)
+            target.close()
+
+    def load_state(self, db_file=None):
+        """Adds the rooms and people of another database to this one
+
+        Rooms and people already in the dojo are kept as they are, and so
+        are the rooms of people already in the dojo. Like Dojo.load_state,
+        residents are only restored into rooms with free slots, so people
+        who would overfill a room are left unallocated.
+        """
+
+        if not db_file:
+            return
+        self.connection.execute("ATTACH DATABASE ? AS source", (db_file,))
+        try:
+            with self._transaction() as connection:
+                residents = connection.execute(NEW_RESIDENTS).fetchall()
+                rooms, people = [
+                    connection.execute(
+                        "INSERT OR IGNORE INTO {0} SELECT * FROM source.{0} "
+                        "ORDER BY rowid".format(table)).rowcount
+                    for table in ("room", "person")]
+                loaded_residents = 0
+                for person_id, room_name, room_type in residents:
+                    free_slots = connection.execute(
+                        FREE_SLOTS, (room_name,)).fetchone()
+                    if free_slots is None or free_slots[0] <= 0:
+                        continue
+                    loaded_residents += connection.execute(
+                        INSERT_RESIDENT,
+                        (person_id, room_name, room_type)).rowcount
+                for person_id in {row[0] for row in residents}:
+                    connection.execute(SET_HAS_ROOM, (person_id,))
+                for room_name in {row[1] for row in residents}:
+                    connection.execute(SET_OCCUPATION_STATUS, (room_name,))
+        except sqlite3.Error:
+            self.output.emit(
+                "red", "load_failed",
+                "The application has failed to load data, \
+                please contact a senior developer for help.")
+            return
+        finally:
+            self.connection.execute("DETACH DATABASE source")
+        self.output.emit(
+            "green", "state_loaded",
+            "Loaded {rooms} rooms, {people} people and {residents} "
+            "allocations", rooms=rooms, people=people,
+            residents=loaded_residents, db_file=db_file)
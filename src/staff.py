@@ -10,17 +10,16 @@ class Staff(Person):
 
     """
 
-    def __init__(self, first_name, last_name, person_id,
-                 has_living_space=None, has_office=None):
+    __slots__ = ()
+
+    def __init__(self, first_name, last_name, person_id):
         super(
             Staff,
             self).__init__(
                 first_name,
                 last_name,
                 "N",
-                person_id,
-                has_living_space,
-                has_office)
+                person_id)
         self.set_type()
 
     def set_type(self):
@@ -0,0 +1,210 @@
+"""class Stats
+
+Opt-in instrumentation of a dojo. Once a dojo is instrumented every command
+it runs is timed into a latency histogram, every message it emits is
+counted by event, and the picks made from its vacancy indexes are counted
+as hits when they find a room and misses when they do not.
+
+Nothing is measured unless Stats.instrument() is called: it wraps the
+methods of that one dojo instance, so dojos that are not instrumented run
+the same code as before.
+
+Example:
+    To time a dojo and write the figures to a file, use
+        stats = Stats()
+        stats.instrument(dojo)
+        dojo.add_person("Dele", "Ali", "fellow")
+        stats.dump("resources/stats.json", dojo)
+
+Attributes:
+    INSTRUMENTED (tuple): Dojo methods timed by instrument()
+"""
+
+import collections
+import functools
+import time
+
+INSTRUMENTED = (
+    "create_room", "create_rooms", "load_rooms", "add_person",
+    "allocate_batch", "print_room", "print_allocations", "print_unallocated",
+    "print_utilisation", "load_people", "reallocate_person",
+    "reallocate_many", "save_state", "load_state")
+
+
+class Histogram(object):
+    """Latency histogram with a bucket for each power of two microseconds
+
+    Keeps a constant amount of memory however many latencies are added.
+    """
+
+    __slots__ = ("count", "total", "minimum", "maximum", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = 0.0
+        self.buckets = collections.Counter()
+
+    def add(self, seconds):
+        """Adds a latency in seconds"""
+
+        self.count += 1
+        self.total += seconds
+        if self.minimum is None or seconds < self.minimum:
+            self.minimum = seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+        self.buckets[int(seconds * 1e6).bit_length()] += 1
+
+    def percentile(self, fraction):
+        """Returns the latency fraction of the calls were at most, in
+        seconds, as the upper bound of its bucket
+        """
+
+        wanted = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= wanted:
+                return min((1 << bucket) / 1e6, self.maximum)
+        return self.maximum
+
+    def summary(self):
+        """Returns count and latencies in milliseconds"""
+
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1e3, 3)
+            if self.count else 0.0,
+            "min_ms": round((self.minimum or 0.0) * 1e3, 3),
+            "p50_ms": round(self.percentile(0.5) * 1e3, 3),
+            "p90_ms": round(self.percentile(0.9) * 1e3, 3),
+            "p99_ms": round(self.percentile(0.99) * 1e3, 3),
+            "max_ms": round(self.maximum * 1e3, 3),
+            "buckets_us": {str(1 << bucket): count for bucket, count
+                           in sorted(self.buckets.items())}}
+
+
+class CountingSink(object):
+    """Counts the events of the messages sent to a sink, then passes them on
+
+    Args:
+        sink (OutputSink): Sink the messages are passed on to
+        counters (collections.Counter): Counts kept by event name
+    """
+
+    def __init__(self, sink, counters):
+        self.sink = sink
+        self.counters = counters
+
+    def emit(self, style, event, message, **fields):
+        self.counters[event] += 1
+        self.sink.emit(style, event, message, **fields)
+
+    def __getattr__(self, name):
+        return getattr(self.sink, name)
+
+
+class Stats(object):
+    """ This class is responsible for collecting the figures of a dojo """
+
+    def __init__(self):
+        self.started = time.time()
+        self.latencies = collections.defaultdict(Histogram)
+        self.counters = collections.Counter()
+        self.caches = collections.defaultdict(collections.Counter)
+
+    def record(self, name, seconds):
+        """Adds the latency of one call of an operation"""
+
+        self.latencies[name].add(seconds)
+
+    def cache(self, name, hit):
+        """Counts a lookup in an index or cache as a hit or a miss"""
+
+        self.caches[name]["hits" if hit else "misses"] += 1
+
+    def timed(self, name, function):
+        """Wraps a function so that every call is recorded under name"""
+
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+        return timed_function
+
+    def instrument(self, dojo):
+        """Starts measuring a dojo
+
+        Its commands are timed, its messages counted and the picks of its
+        allocation strategies counted as vacancy index hits or misses.
+        """
+
+        for name in INSTRUMENTED:
+            method = getattr(dojo, name, None)
+            if method is not None:
+                setattr(dojo, name, self.timed("dojo." + name, method))
+        dojo.output = CountingSink(dojo.output, self.counters)
+        for room_type, strategy in getattr(dojo, "strategies", {}).items():
+            strategy.pick = self._counted_pick(room_type, strategy.pick)
+
+    def _counted_pick(self, room_type, pick):
+        name = "vacancies." + room_type
+
+        @functools.wraps(pick)
+        def counted_pick(vacancies):
+            room = pick(vacancies)
+            self.cache(name, room is not None)
+            return room
+        return counted_pick
+
+    def snapshot(self, dojo=None):
+        """Returns every figure collected so far
+
+        Args:
+            dojo: When given, the occupancy of its rooms is included
+        """
+
+        figures = {
+            "uptime_s": round(time.time() - self.started, 3),
+            "latency": {name: histogram.summary() for name, histogram
+                        in sorted(self.latencies.items())},
+            "events": dict(sorted(self.counters.items())),
+            "caches": {}}
+        for name, counts in sorted(self.caches.items()):
+            lookups = counts["hits"] + counts["misses"]
+            figures["caches"][name] = {
+                "hits": counts["hits"], "misses": counts["misses"],
+                "hit_rate": round(counts["hits"] / lookups, 4)
+                if lookups else 0.0}
+        rooms = getattr(dojo, "rooms", None)
+        if isinstance(rooms, list):
+            occupancy = {}
+            for room in rooms:
+                figures_of_type = occupancy.setdefault(
+                    room._type, {"rooms": 0, "full_rooms": 0,
+                                 "residents": 0, "capacity": 0})
+                figures_of_type["rooms"] += 1
+                figures_of_type["full_rooms"] += bool(room.fully_occupied)
+                figures_of_type["residents"] += len(room.residents)
+                figures_of_type["capacity"] += room.maximum_no_of_people
+            for figures_of_type in occupancy.values():
+                figures_of_type["utilisation"] = round(
+                    figures_of_type["residents"] /
+                    figures_of_type["capacity"], 4)
+            figures["rooms"] = occupancy
+            figures["people"] = len(dojo.people)
+            figures["unallocated"] = len(dojo.unallocated)
+        return figures
+
+    def dump(self, path, dojo=None):
+        """Writes the snapshot as JSON to path"""
+
+        import json
+
+        with open(path, "w") as file:
+            json.dump(self.snapshot(dojo), file, indent=2)
@@ -0,0 +1,100 @@
+"""Allocation strategies
+
+A strategy decides which vacant room a person is allocated. Strategies pick
+from the VacancyIndex of a room type so no strategy scans every room.
+
+Example:
+    To allocate offices reproducibly, use
+        dojo = Dojo(office_strategy=RandomStrategy(seed=42))
+
+Attributes:
+    STRATEGIES (dict): Strategy classes keyed by the name used on the command
+        line
+"""
+
+import random
+from abc import ABCMeta, abstractmethod
+
+
+class AllocationStrategy(metaclass=ABCMeta):
+    """Base class of all strategies"""
+
+    @abstractmethod
+    def pick(self, vacancies):
+        """Picks a room for a person
+
+        Args:
+            vacancies (VacancyIndex): Vacant rooms of the type being allocated
+
+        Returns:
+            Room: The chosen room or None if every room is full
+        """
+
+        pass
+
+
+class RandomStrategy(AllocationStrategy):
+    """Picks any vacant room with equal probability
+
+    Args:
+        seed: Seed of the strategy's own random generator. Runs using the
+            same seed and the same commands allocate the same rooms.
+    """
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def pick(self, vacancies):
+        return vacancies.pick_random(self.rng)
+
+
+class FirstFitStrategy(AllocationStrategy):
+    """Picks the earliest created room that is not full"""
+
+    def pick(self, vacancies):
+        return vacancies.pick_first()
+
+
+class LeastLoadedStrategy(AllocationStrategy):
+    """Picks the room with the most free slots to spread people out"""
+
+    def pick(self, vacancies):
+        return vacancies.pick_least_loaded()
+
+
+class MostLoadedStrategy(AllocationStrategy):
+    """Picks the room with the fewest free slots to pack people together"""
+
+    def pick(self, vacancies):
+        return vacancies.pick_most_loaded()
+
+
+STRATEGIES = {
+    "random": RandomStrategy,
+    "first_fit": FirstFitStrategy,
+    "least_loaded": LeastLoadedStrategy,
+    "most_loaded": MostLoadedStrategy,
+}
+
+
+def make_strategy(name, seed=None):
+    """Creates a strategy from its command line name
+
+    Args:
+        name (str): One of the keys of STRATEGIES
+        seed: Seed used by the random strategy
+
+    Returns:
+        AllocationStrategy: The new strategy
+
+    Raises:
+        ValueError: If there is no strategy called name
+    """
+
+    if name not in STRATEGIES:
+        raise ValueError(
+            "Unknown strategy {0}, choose one of {1}".format(
+                name, ", ".join(sorted(STRATEGIES))))
+    if name == "random":
+        return RandomStrategy(None if seed is None else int(seed))
+    return STRATEGIES[name]()
@@ -0,0 +1,109 @@
+"""class ThreadSafeDojo
+
+Dojo that can be shared by many threads. Each room type has its own lock,
+held while a room of that type is picked and the person moved in, so the
+check for a free slot and taking it are one atomic step and no room is
+ever filled past maximum_no_of_people. Offices and living spaces are
+allocated under different locks, so threads allocating one type never wait
+for threads allocating the other. A third lock guards what both types
+share: person ids, the indexes of people and the journal.
+
+Commands that read or change rooms of both types at once, such as
+creating rooms, moving many people at once, the reports and saving or
+loading, hold every lock.
+
+Locks are always taken in the same order, the office lock, the living
+space lock and then the index lock, so threads never deadlock. They are
+reentrant, so a locked method may call any other.
+
+Example:
+    To allocate people from several threads, use
+        dojo = ThreadSafeDojo()
+        threads = [threading.Thread(target=dojo.load_people, args=(file,))
+                   for file in files]
+
+Attributes:
+    locks (dict): Lock of the rooms, vacancies and waitlist of each room type
+    index_lock (threading.RLock): Lock of the state shared by both room types
+"""
+
+import functools
+import threading
+
+from .columnar import ROOM_TYPES
+from .dojo import Dojo
+
+
+def exclusive(method):
+    """Wraps a Dojo method so it runs holding every lock of the dojo"""
+
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.locks["office"], self.locks["living_space"], \
+                self.index_lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+
+class ThreadSafeDojo(Dojo):
+    """ This class is responsible for sharing a Dojo between threads
+
+    Takes the same arguments as Dojo.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ThreadSafeDojo, self).__init__(*args, **kwargs)
+        self.locks = {room_type: threading.RLock() for room_type in ROOM_TYPES}
+        self.index_lock = threading.RLock()
+
+    def _create_person(self, *args):
+        with self.index_lock:
+            return super(ThreadSafeDojo, self)._create_person(*args)
+
+    def _add_to_room(self, person, room):
+        with self.locks[room._type], self.index_lock:
+            return super(ThreadSafeDojo, self)._add_to_room(person, room)
+
+    def _remove_from_room(self, person, room):
+        with self.locks[room._type], self.index_lock:
+            return super(ThreadSafeDojo, self)._remove_from_room(person, room)
+
+    def _reserve(self, person, room_type):
+        with self.locks[room_type]:
+            # Another thread may reallocate a new person by id before
+            # add_person has allocated them
+            room = getattr(person, room_type)
+            if room is not None:
+                return room
+            return super(ThreadSafeDojo, self)._reserve(person, room_type)
+
+    def _drain_waitlist(self, room_type):
+        with self.locks[room_type]:
+            return super(ThreadSafeDojo, self)._drain_waitlist(room_type)
+
+    def _fill_evenly(self, room_type, people):
+        with self.locks[room_type]:
+            return super(ThreadSafeDojo, self)._fill_evenly(
+                room_type, people)
+
+    def reallocate_person(self, person_id, new_room_name=None,
+                          room_type="office"):
+        """Reallocates a person under the lock of the room type involved
+
+        See Dojo.reallocate_person
+        """
+
+        new_room = self.rooms_by_name.get(new_room_name)
+        with self.locks[room_type if new_room is None else new_room._type]:
+            super(ThreadSafeDojo, self).reallocate_person(
+                person_id, new_room_name, room_type)
+
+    _create_rooms = exclusive(Dojo._create_rooms)
+    reallocate_many = exclusive(Dojo.reallocate_many)
+    print_room = exclusive(Dojo.print_room)
+    print_allocations = exclusive(Dojo.print_allocations)
+    print_unallocated = exclusive(Dojo.print_unallocated)
+    print_utilisation = exclusive(Dojo.print_utilisation)
+    save_state = exclusive(Dojo.save_state)
+    load_state = exclusive(Dojo.load_state)
+    to_columns = exclusive(Dojo.to_columns)
@@ -0,0 +1,173 @@
+"""class VacancyIndex
+
+Keeps track of the rooms of a single type that still have free slots so that
+a room can be picked for a new person without scanning every room.
+
+Example:
+    To create a new instance, use
+        vacancies = VacancyIndex()
+
+Attributes:
+    _vacant (Room[]): Rooms that are not fully occupied, in no given order
+    _positions (dict): Position of each vacant room in _vacant by room name
+    _sequence (dict): Creation order of every registered room by room name
+    _first_fit (list): Heap of (sequence, room name) used for first-fit picks
+    _by_free_slots (dict): Heaps of (key, sequence, room name) used for
+        least-loaded ("most") and most-loaded ("fewest") picks. They are only
+        built once such a pick is first made.
+"""
+
+import heapq
+import itertools
+import random
+
+
+class VacancyIndex(object):
+    """ This class is responsible for tracking rooms with free slots """
+
+    def __init__(self):
+        self._vacant = []
+        self._positions = {}
+        self._sequence = {}
+        self._first_fit = []
+        self._by_free_slots = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._vacant)
+
+    def __contains__(self, room):
+        return room.name in self._positions
+
+    def __iter__(self):
+        """Iterates over the vacant rooms in creation order"""
+
+        return iter(sorted(
+            self._vacant, key=lambda room: self._sequence[room.name]))
+
+    def add(self, room):
+        """Registers a newly created room with the index
+
+        Args:
+            room (Room): Room to be tracked
+        """
+
+        if room.name not in self._sequence:
+            self._sequence[room.name] = next(self._counter)
+        self.update(room)
+
+    def update(self, room):
+        """Refreshes the vacancy of a room after its residents have changed
+
+        Args:
+            room (Room): Room whose residents have changed
+        """
+
+        if room.fully_occupied:
+            self.discard(room)
+        else:
+            self._insert(room)
+            for order, heap in self._by_free_slots.items():
+                heapq.heappush(heap, self._free_slots_entry(order, room))
+                # Picks of another order never drop stale entries, so the
+                # heap is rebuilt here once they pile up
+                if len(heap) > 2 * len(self._vacant) + 32:
+                    self._rebuild_by_free_slots(order)
+
+    def discard(self, room):
+        """Stops tracking a room as vacant until it is next updated
+
+        Args:
+            room (Room): Room to be ignored by picks
+        """
+
+        position = self._positions.pop(room.name, None)
+        if position is None:
+            return
+        last_room = self._vacant.pop()
+        if last_room is not room:
+            self._vacant[position] = last_room
+            self._positions[last_room.name] = position
+
+    def pick_random(self, rng=random):
+        """Picks a vacant room uniformly at random in O(1)
+
+        Returns:
+            Room: A room with free slots or None if every room is full
+        """
+
+        return rng.choice(self._vacant) if self._vacant else None
+
+    def pick_first(self):
+        """Picks the earliest created vacant room in O(log n)
+
+        Returns:
+            Room: A room with free slots or None if every room is full
+        """
+
+        while self._first_fit and \
+                self._first_fit[0][1] not in self._positions:
+            heapq.heappop(self._first_fit)
+        if not self._first_fit:
+            return None
+        return self._vacant[self._positions[self._first_fit[0][1]]]
+
+    def pick_least_loaded(self):
+        """Picks the vacant room with the most free slots in O(log n)
+
+        Ties go to the earliest created room.
+
+        Returns:
+            Room: A room with free slots or None if every room is full
+        """
+
+        return self._pick_by_free_slots("most")
+
+    def pick_most_loaded(self):
+        """Picks the vacant room with the fewest free slots in O(log n)
+
+        Ties go to the earliest created room.
+
+        Returns:
+            Room: A room with free slots or None if every room is full
+        """
+
+        return self._pick_by_free_slots("fewest")
+
+    def _free_slots_entry(self, order, room):
+        free_slots = room.maximum_no_of_people - len(room.residents)
+        return (-free_slots if order == "most" else free_slots,
+                self._sequence[room.name], room.name)
+
+    def _rebuild_by_free_slots(self, order):
+        heap = [self._free_slots_entry(order, room) for room in self._vacant]
+        heapq.heapify(heap)
+        self._by_free_slots[order] = heap
+        return heap
+
+    def _pick_by_free_slots(self, order):
+        heap = self._by_free_slots.get(order)
+        if heap is None or len(heap) > 2 * len(self._vacant) + 32:
+            heap = self._rebuild_by_free_slots(order)
+        # Entries go stale when a room fills up or its residents change
+        while heap:
+            name = heap[0][2]
+            if name in self._positions:
+                room = self._vacant[self._positions[name]]
+                if heap[0] == self._free_slots_entry(order, room):
+                    return room
+            heapq.heappop(heap)
+        return None
+
+    def _insert(self, room):
+        if room.name in self._positions:
+            return
+        self._positions[room.name] = len(self._vacant)
+        self._vacant.append(room)
+        heapq.heappush(
+            self._first_fit, (self._sequence[room.name], room.name))
+        # Stale heap entries are dropped lazily, rebuild once they pile up
+        if len(self._first_fit) > 2 * len(self._vacant) + 32:
+            self._first_fit = [
+                (self._sequence[name], name) for name in self._positions]
+            heapq.heapify(self._first_fit)
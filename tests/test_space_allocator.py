@@ -1,15 +1,42 @@
 """Unit tests for the application"""
 
+import asyncio
+import contextlib
+import gzip
 import io
+import json
 import os
+import random
+import sqlite3
+import subprocess
 import sys
+import tempfile
+import threading
+import time
 import unittest
 
 import colorful
 from prettytable import PrettyTable
 
+from docopt import docopt
+
+from space_allocator import SpaceAllocator, main, parse_command, \
+    usage_patterns
+from src.columnar_dojo import ColumnarDojo, PersonRow
 from src.dojo import Dojo
-from src.helpers import get_residents, remove_person, find_room, find_person
+from src.helpers import get_residents, remove_person, find_room, \
+    find_person, add_person_to_room
+from src.journal import Journal
+from src.output import OutputSink, SilentSink, TextSink, JSONLinesSink
+from src.occupancy import OccupancyMatrix, numpy
+from src.schema import create_schema
+from src.service import AllocatorService
+from src.sharded import ShardedDojo
+from src.stats import Stats
+from src.sqlite_dojo import SQLiteDojo
+from src.thread_safe_dojo import ThreadSafeDojo
+from src.strategies import AllocationStrategy, FirstFitStrategy, \
+    LeastLoadedStrategy, MostLoadedStrategy, make_strategy
 
 
 class TestSpaceAllocator(unittest.TestCase):
@@ -147,12 +174,13 @@ class TestSpaceAllocator(unittest.TestCase):
 
         self.dojo.add_person("Dele", "Ali", "Fellow", "Y")
         result = self.dojo.print_allocations("allocations.txt", "N")
-        file = open("allocations.txt").read()
+        with open("resources/allocations.txt") as report:
+            file = report.read()
         self.assertTrue("Room: testoffice" in file)
         self.assertTrue("DELE ALI" in file)
         self.assertTrue("Room: testlivingspace" in file)
-        self.assertEqual([{'testoffice': ['DELE ALI']}, {
-            'testlivingspace': ['DELE ALI']}], result)
+        # Reports written to a file are streamed, not returned
+        self.assertIsNone(result)
 
     def test_print_allocations_tabular_view(self):
         """Tests that tabular data is output on print_allocations"""
@@ -268,3 +296,1267 @@ class TestSpaceAllocator(unittest.TestCase):
         dojo2.load_state("resources/testdb.db")
         room = find_room(dojo2.rooms, "orange")
         self.assertIn(room, dojo2.rooms)
+
+    def test_indexes_in_sync(self):
+        """Tests that the room and person indexes follow every mutation"""
+
+        self.dojo.create_room("office", "orange", "lion")
+        self.dojo.load_people("resources/people.txt")
+        self.assertEqual(
+            [room.name for room in self.dojo.rooms],
+            list(self.dojo.rooms_by_name))
+        self.assertEqual(
+            [person.id_ for person in self.dojo.people],
+            list(self.dojo.people_by_id))
+        self.assertIs(
+            find_room(self.dojo.rooms_by_name, "orange"),
+            find_room(self.dojo.rooms, "orange"))
+        self.assertIs(
+            find_person(self.dojo.people_by_id, 3),
+            find_person(self.dojo.people, 3))
+
+    def test_vacancy_index_follows_occupancy(self):
+        """Tests that full rooms leave the vacancy index and freed ones return"""
+
+        dojo = Dojo()
+        dojo.create_room("living_space", "lion", "tiger")
+        for name in ["Ann", "Ben", "Cat", "Dan"]:
+            dojo.add_person(name, "Doe", "Fellow", "Y")
+        lion = find_room(dojo.rooms_by_name, "lion")
+        tiger = find_room(dojo.rooms_by_name, "tiger")
+        vacancies = dojo.vacancies["living_space"]
+        self.assertNotIn(lion, vacancies)
+        self.assertIs(vacancies.pick_first(), tiger)
+        dojo.create_room("office", "orange")
+        dojo.reallocate_person(1, "tiger")
+        self.assertIn(lion, vacancies)
+        self.assertIs(vacancies.pick_first(), lion)
+        self.assertIs(dojo.vacancies["office"].pick_random(),
+                      find_room(dojo.rooms_by_name, "orange"))
+
+    def test_load_people_in_batches(self):
+        """Tests that streamed people are allocated and bad lines rejected"""
+
+        dojo = Dojo()
+        dojo.create_room("office", "orange")
+        dojo.create_room("living_space", "lion")
+        lines = ["Ann Doe fellow Y\n", "\n", "Ben Doe staff\n",
+                 "Cat 3 fellow\n", "Dan Doe fellow Y\n", "Eve Doe chef\n",
+                 "Fay Doe fellow Y\n", "Gus Doe fellow Y\n",
+                 "Hal Doe fellow Y\n"]
+        with tempfile.NamedTemporaryFile("w", suffix=".txt") as people:
+            people.writelines(lines)
+            people.flush()
+            program_captured_output = io.StringIO()
+            sys.stdout = program_captured_output
+            totals = dojo.load_people(people.name, batch_size=3)
+            sys.stdout = sys.__stdout__
+            output, dojo.output = dojo.output, SilentSink()
+            SpaceAllocator(dojo).onecmd(
+                "load_people {0} --batch=abc".format(people.name))
+            self.assertEqual(1, dojo.output.errors)
+            dojo.output = output
+        self.assertEqual(6, totals["added"])
+        self.assertEqual(5, totals["allocated"])
+        self.assertEqual(1, totals["unallocated"])
+        self.assertNotIn("waitlisted", totals)
+        self.assertEqual([4, 6], [line for line, _ in totals["rejected"]])
+        self.assertEqual(4, len(find_room(dojo.rooms, "lion").residents))
+        self.assertIn("Batch 1 (lines 1-4)", program_captured_output.getvalue())
+        self.assertIn("1 unallocated", program_captured_output.getvalue())
+
+    def test_silent_sink_does_not_format(self):
+        """Tests that a silent sink never renders messages"""
+
+        def fail():
+            raise AssertionError("message was formatted")
+
+        sink = SilentSink()
+        dojo = Dojo(output=sink)
+        dojo.add_person("Dele", "Ali", "Fellow", "Y")
+        dojo.add_person("Dele", "4li", "Fellow", "Y")
+        sink.emit("blue", "table", fail)
+        self.assertEqual(1, sink.errors)
+
+    def test_text_and_json_sinks(self):
+        """Tests that messages reach the buffered text and JSON-lines sinks"""
+
+        text_sink = TextSink()
+        dojo = Dojo(output=text_sink)
+        dojo.create_room("office", "orange")
+        self.assertEqual("Office called orange has been successfully created!",
+                         text_sink.getvalue())
+        stream = io.StringIO()
+        dojo = Dojo(output=JSONLinesSink(stream))
+        dojo.create_room("office", "orange", "orange")
+        events = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(["room_created", "duplicate_room"],
+                         [event["event"] for event in events])
+        self.assertEqual("error", events[1]["level"])
+        self.assertEqual("orange", events[1]["room_name"])
+
+    def test_save_state_writes_only_changes(self):
+        """Tests that repeated saves update rows in place and skip clean ones"""
+
+        db_path = "resources/deltadb.db"
+        self.addCleanup(os.remove, db_path)
+        dojo = Dojo(output=SilentSink())
+        dojo.create_room("office", "orange", "lion")
+        dojo.add_person("John", "Ashaba", "Staff")
+        dojo.add_person("Dele", "Ali", "Fellow")
+        dojo.save_state("deltadb.db")
+        connection = sqlite3.connect(db_path)
+        with connection:
+            connection.execute(
+                "UPDATE person SET first_name = 'Edited' WHERE person_id = 1")
+        person = find_person(dojo.people_by_id, 2)
+        new_office = "lion" if person.rooms_occupied[0]["office"] == "orange" \
+            else "orange"
+        dojo.reallocate_person(2, new_office)
+        dojo.save_state("deltadb.db")
+        dojo.save_state("deltadb.db")
+        self.assertEqual(
+            [(1, "Edited"), (2, "Dele")],
+            connection.execute(
+                "SELECT person_id, first_name FROM person").fetchall())
+        self.assertEqual(
+            [(2, new_office)],
+            connection.execute(
+                "SELECT person_id, room_name FROM room_person "
+                "WHERE person_id = 2").fetchall())
+        self.assertEqual(
+            2, connection.execute("SELECT COUNT(*) FROM room").fetchone()[0])
+        connection.close()
+
+    def test_save_state_migrates_unkeyed_tables(self):
+        """Tests that databases saved without keys are deduplicated"""
+
+        db_path = "resources/legacydb.db"
+        self.addCleanup(os.remove, db_path)
+        connection = sqlite3.connect(db_path)
+        connection.execute("CREATE TABLE room (room_name text, "
+                           "room_type text, occupation_status text)")
+        connection.executemany("INSERT INTO room VALUES (?,?,?)",
+                               [("orange", "office", None)] * 2)
+        connection.commit()
+        create_schema(connection)
+        connection.execute("INSERT OR IGNORE INTO room VALUES "
+                           "('orange', 'office', NULL)")
+        self.assertEqual(
+            [("orange", "office", None)],
+            connection.execute("SELECT * FROM room").fetchall())
+        connection.close()
+
+    def test_load_state_restores_occupancy(self):
+        """Tests that load_state rebuilds people, residents and full rooms"""
+
+        self.addCleanup(os.remove, "resources/loaddb.db")
+        dojo1 = Dojo(output=SilentSink())
+        dojo1.create_room("living_space", "lion", "tiger")
+        for name in ["Ann", "Ben", "Cat", "Dan", "Eve"]:
+            dojo1.add_person(name, "Doe", "Fellow", "Y")
+        dojo1.add_person("John", "Ashaba", "Staff")
+        dojo1.save_state("loaddb.db")
+        dojo2 = Dojo(output=SilentSink())
+        dojo2.load_state("resources/loaddb.db")
+        lion = find_room(dojo2.rooms_by_name, "lion")
+        self.assertTrue(lion.fully_occupied)
+        self.assertEqual(["Ann Doe", "Ben Doe", "Cat Doe", "Dan Doe"],
+                         get_residents(lion))
+        self.assertEqual("staff", find_person(dojo2.people_by_id, 6)._type)
+        self.assertTrue(find_person(dojo2.people_by_id, 5).has_living_space)
+        self.assertIs(dojo2.vacancies["living_space"].pick_first(),
+                      find_room(dojo2.rooms_by_name, "tiger"))
+
+        dojo3 = Dojo(output=TextSink())
+        dojo3.add_person("Zed", "Roe", "Staff")
+        dojo3.add_person("Yan", "Roe", "Staff")
+        dojo3.load_state("resources/loaddb.db")
+        self.assertEqual(["Zed Roe", "Yan Roe", "Cat Doe"],
+                         [person.get_fullname() for person in dojo3.people[:3]])
+        self.assertIn("Loaded 2 rooms, 4 people and 3 allocations\n"
+                      "2 people were not loaded as their ids are already in "
+                      "use: 1, 2", dojo3.output.getvalue())
+
+    def test_load_state_skips_duplicate_residents(self):
+        """Tests that legacy databases listing a person twice load once"""
+
+        db_path = "resources/legacydb.db"
+        self.addCleanup(os.remove, db_path)
+        connection = sqlite3.connect(db_path)
+        connection.execute("CREATE TABLE room (room_name text, "
+                           "room_type text, occupation_status text)")
+        connection.execute("CREATE TABLE person (person_id INTEGER, "
+                           "first_name text, last_name text, person_type "
+                           "text, has_living_space text, has_office text, "
+                           "wants_accommodation text)")
+        connection.execute("CREATE TABLE room_person (person_id INTEGER, "
+                           "room_name text, room_type text)")
+        connection.executemany("INSERT INTO room VALUES (?,?,?)",
+                               [("orange", "office", None),
+                                ("red", "office", None),
+                                ("lion", "living_space", None)])
+        connection.executemany(
+            "INSERT INTO person VALUES (?,?,?,?,?,?,?)",
+            [(1, "Ann", "Doe", "fellow", None, True, "N")] +
+            [(n, "Ben", "Doe", "fellow", True, None, "Y")
+             for n in range(2, 8)])
+        connection.executemany(
+            "INSERT INTO room_person VALUES (?,?,?)",
+            [(1, "orange", "office"), (1, "orange", "office"),
+             (1, "red", "office")] +
+            [(n, "lion", "living_space") for n in range(2, 8)])
+        connection.commit()
+        connection.close()
+
+        dojo = Dojo(output=SilentSink())
+        dojo.load_state(db_path)
+        orange, red, lion = dojo.rooms
+        self.assertEqual([1], [person.id_ for person in orange.residents])
+        self.assertEqual({}, red.residents)
+        self.assertEqual(4, len(lion.residents))
+        self.assertEqual(6, len(dojo.unallocated))
+        dojo.reallocate_person(1, "red")
+        self.assertEqual([[], [1]], [[person.id_ for person in room.residents]
+                                     for room in (orange, red)])
+
+    def test_allocate_batch_balances_rooms(self):
+        """Tests that a cohort fills every free slot and spreads evenly"""
+
+        dojo = Dojo(output=SilentSink())
+        dojo.create_room("office", "orange", "lion", "tiger")
+        dojo.create_room("living_space", "python")
+        dojo.add_person("John", "Ashaba", "Staff")
+        cohort = [("Fellow", "Number" + "abcdefghijklmnopqrstuvwxyz"[i],
+                   "fellow", "Y") for i in range(17)]
+        cohort.append(("Bad", "Name1", "staff"))
+        results = dojo.allocate_batch(cohort)
+        self.assertEqual(17, len(results))
+        occupancy = sorted(
+            len(room.residents) for room in dojo.rooms
+            if room._type == "office")
+        self.assertEqual([6, 6, 6], occupancy)
+        with_office = [person for person in dojo.people if person.has_office]
+        self.assertEqual(18, len(with_office))
+        self.assertEqual(
+            4, len([result for result in results
+                    if {"living_space": "python"} in result["Rooms"]]))
+
+    def test_allocate_batch_spreads_partial_cohort(self):
+        """Tests that a small cohort goes to the emptiest offices first"""
+
+        dojo = Dojo(output=SilentSink())
+        dojo.create_room("office", "orange", "lion")
+        dojo.allocate_batch([("Ann", "Doe", "staff"), ("Ben", "Doe", "staff"),
+                             ("Cat", "Doe", "staff"), ("Dan", "Doe", "staff")])
+        self.assertEqual([2, 2], [len(room.residents) for room in dojo.rooms])
+
+    def test_allocation_strategies(self):
+        """Tests the room picked by each allocation strategy"""
+
+        def occupancy(strategy):
+            dojo = Dojo(output=SilentSink(), office_strategy=strategy)
+            dojo.create_room("office", "orange", "lion", "tiger")
+            for name in ["Ann", "Ben", "Cat", "Dan", "Eve", "Fay", "Gus"]:
+                dojo.add_person(name, "Doe", "Staff")
+            return [len(room.residents) for room in dojo.rooms]
+
+        self.assertEqual([6, 1, 0], occupancy(FirstFitStrategy()))
+        self.assertEqual([3, 2, 2], occupancy(LeastLoadedStrategy()))
+        self.assertEqual([6, 1, 0], occupancy(MostLoadedStrategy()))
+        self.assertEqual(occupancy(make_strategy("random", 7)),
+                         occupancy(make_strategy("random", 7)))
+        with self.assertRaises(ValueError):
+            make_strategy("fastest")
+
+    def test_free_slot_heaps_stay_bounded(self):
+        """Tests that heaps built for loaded picks are compacted on updates"""
+
+        dojo = Dojo(output=SilentSink(),
+                    office_strategy=LeastLoadedStrategy())
+        dojo.create_room("office", "orange", "lion")
+        dojo.add_person("Ann", "Doe", "Staff")
+        for n in range(1000):
+            dojo.reallocate_person(1, "lion" if n % 2 == 0 else "orange")
+        heap = dojo.vacancies["office"]._by_free_slots["most"]
+        self.assertLessEqual(len(heap), 2 * 2 + 32)
+        self.assertIs(find_room(dojo.rooms, "lion"),
+                      dojo.vacancies["office"].pick_least_loaded())
+
+    def test_incomplete_strategies_and_sinks_are_rejected(self):
+        """Tests that strategies and sinks must implement pick and write"""
+
+        class NoPick(AllocationStrategy):
+            pass
+
+        class NoWrite(OutputSink):
+            pass
+
+        for incomplete in (NoPick, NoWrite):
+            with self.assertRaises(TypeError):
+                incomplete()
+
+    def test_reallocate_person_with_strategy(self):
+        """Tests that reallocation without a room name uses the strategy"""
+
+        dojo = Dojo(output=SilentSink(),
+                    office_strategy=LeastLoadedStrategy())
+        dojo.create_room("office", "orange", "lion")
+        dojo.add_person("Ann", "Doe", "Staff")
+        dojo.add_person("Ben", "Doe", "Staff")
+        dojo.add_person("Cat", "Doe", "Staff")
+        dojo.reallocate_person(1)
+        self.assertEqual([1, 2], [len(room.residents) for room in dojo.rooms])
+        self.assertEqual([{"office": "lion"}],
+                         find_person(dojo.people_by_id, 1).rooms_occupied)
+
+    def test_reallocate_many_swaps_and_rolls_back(self):
+        """Tests that plans of moves are applied whole or not at all"""
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        stored = SQLiteDojo(os.path.join(directory.name, "campus.db"),
+                            output=SilentSink(),
+                            office_strategy=FirstFitStrategy())
+        self.addCleanup(stored.close)
+        memory = Dojo(output=SilentSink(), office_strategy=FirstFitStrategy())
+        for dojo in (memory, stored):
+            dojo.create_room("office", "orange", "red", "blue")
+            for n in range(19):
+                dojo.add_person("Staff", "X" * (n + 1), "Staff")
+            # Offices hold six, so all three are full and 19 has none
+            errors = dojo.output.errors
+            result = dojo.reallocate_many(
+                [(1, "red"), (7, "orange"), (99, "red"), (13, "blue"),
+                 (2, "red"), (2, "blue"), (19, "blue")])
+            self.assertEqual([1, 3, 4, 5, 6, 7],
+                             [entry for entry, _ in result["rejected"]])
+            self.assertEqual(0, result["moved"])
+            self.assertEqual(errors + 1, dojo.output.errors)
+            # A swap between full rooms and a cycle through all three
+            result = dojo.reallocate_many(
+                [(1, "red"), (7, "orange"), (2, "red"), (8, "blue"),
+                 (13, "orange")])
+            self.assertEqual({"moved": 5, "rejected": []}, result)
+            self.assertEqual(
+                [("orange", 6), ("red", 6), ("blue", 6)],
+                [(room.name, len(room.residents)) for room in dojo.rooms])
+        self.assertEqual(memory.print_allocations(),
+                         stored.print_allocations())
+
+        add_to_room, added = memory._add_to_room, []
+
+        def fail_third_add(person, room):
+            added.append(person)
+            if len(added) == 3:
+                return False
+            return add_to_room(person, room)
+        memory._add_to_room = fail_third_add
+        offices = {person.id_: person.office for person in memory.people}
+        result = memory.reallocate_many(
+            [(1, "orange"), (7, "red"), (2, "blue"), (8, "red")])
+        self.assertEqual({"moved": 0, "rejected": []}, result)
+        self.assertEqual(offices, {person.id_: person.office
+                                   for person in memory.people})
+        self.assertEqual([6, 6, 6],
+                         [len(room.residents) for room in memory.rooms])
+
+    def test_people_and_rooms_use_slots(self):
+        """Tests that people and rooms carry no per instance __dict__"""
+
+        self.dojo.add_person("Dele", "Ali", "Fellow", "Y")
+        person = self.dojo.people[0]
+        self.assertFalse(hasattr(person, "__dict__"))
+        self.assertFalse(hasattr(self.testoffice, "__dict__"))
+        self.assertIs(self.testoffice, person.office)
+        self.assertIs(self.testlivingspace, person.living_space)
+        self.dojo.create_room("office", "orange")
+        self.dojo.reallocate_person(1, "orange")
+        self.assertEqual("orange", person.office.name)
+        self.assertEqual([{"office": "orange"},
+                          {"living_space": "testlivingspace"}],
+                         person.rooms_occupied)
+
+    def test_room_flags_follow_assignments(self):
+        """Tests that has_office, has_living_space and fully_occupied follow
+        the rooms people are in"""
+
+        dojo = Dojo(output=SilentSink(), office_strategy=FirstFitStrategy())
+        dojo.create_room("office", "orange", "red")
+        dojo.create_room("living_space", "lion")
+        dojo.add_person("Dele", "Ali", "Fellow", "Y")
+        person = dojo.people[0]
+        orange, red = dojo.rooms[0], dojo.rooms[1]
+        self.assertTrue(person.has_office and person.has_living_space)
+        self.assertFalse(add_person_to_room(person, red))
+        self.assertFalse(add_person_to_room(person, orange))
+        self.assertEqual([person], list(orange.residents))
+        self.assertFalse(remove_person(person, red))
+        self.assertTrue(remove_person(person, orange))
+        self.assertIsNone(person.has_office)
+        self.assertTrue(person.has_living_space)
+        for n in range(6):
+            dojo.add_person("Staff", "X" * (n + 1), "Staff")
+        self.assertTrue(orange.fully_occupied)
+        dojo.reallocate_person(2, "red")
+        self.assertIsNone(orange.fully_occupied)
+        self.assertEqual([None, True], [
+            dojo.people_by_id[2].has_living_space,
+            dojo.people_by_id[2].has_office])
+
+    def test_columnar_store_round_trip(self):
+        """Tests that a dojo survives conversion to columns and back"""
+
+        self.dojo.load_people("resources/people.txt")
+        store = self.dojo.to_columns()
+        self.assertEqual(len(self.dojo.people), len(store))
+        dojo = Dojo.from_columns(store, output=SilentSink())
+        self.assertEqual(
+            [(person.id_, person._type, person.rooms_occupied)
+             for person in self.dojo.people],
+            [(person.id_, person._type, person.rooms_occupied)
+             for person in dojo.people])
+        self.assertEqual(
+            [get_residents(room) for room in self.dojo.rooms],
+            [get_residents(room) for room in dojo.rooms])
+
+    def test_columnar_dojo_matches_dojo(self):
+        """Tests that a dojo kept in columns behaves as a Dojo"""
+
+        results = []
+        for dojo_class in (Dojo, ColumnarDojo):
+            dojo = dojo_class(output=SilentSink(), waitlist=True,
+                              office_strategy=FirstFitStrategy())
+            dojo.add_person("Kylian", "Mbappe", "Fellow", "Y")
+            dojo.create_room("office", "red", "blue")
+            dojo.create_room("living_space", "lion")
+            dojo.load_people("resources/people.txt")
+            dojo.reallocate_person(1, "blue")
+            dojo.reallocate_many([(2, "blue"), (3, "red")])
+            dojo.allocate_batch([("Ann", "Doe", "fellow", "Y"),
+                                 ("Ben", "Doe", "staff")])
+            results.append(
+                (dojo.print_allocations(), dojo.print_unallocated(),
+                 dojo.print_utilisation(), dojo.print_room("red"),
+                 [(person.id_, person.get_fullname(), person._type,
+                   person.rooms_occupied) for person in dojo.people],
+                 [[person.id_ for person in dojo.waitlists[room_type]]
+                  for room_type in ("office", "living_space")]))
+        self.assertEqual(results[0], results[1])
+        self.assertIsInstance(dojo.people_by_id[9], PersonRow)
+        self.assertEqual(
+            [7, 9],
+            [person.id_ for person in dojo.waitlists["living_space"]])
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.assertEqual(0, self.run_main(
+            "--script=" + self.command_script(directory.name),
+            "--columnar", "--output=silent", "--office-strategy=first_fit",
+            "--stats"))
+        loaded = ColumnarDojo(output=SilentSink())
+        loaded.load_state(os.path.join(directory.name, "saved.db"))
+        self.assertEqual(
+            [("Dele Ali", [{"office": "red"}, {"living_space": "tiger"}]),
+             ("Ann Doe", [{"office": "orange"}])],
+            [(person.get_fullname(), person.rooms_occupied)
+             for person in loaded.people[:2]])
+        self.assertEqual(loaded.people[1], find_person(loaded.people_by_id, 2))
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_occupancy_matrix_reports(self):
+        """Tests the vectorized occupancy reports against the dojo"""
+
+        for dojo in (Dojo(output=SilentSink()),
+                     ColumnarDojo(output=SilentSink())):
+            dojo.add_person("Kylian", "Mbappe", "Fellow", "Y")
+            dojo.add_person("Gianluggi", "Buffon", "Fellow", "N")
+            dojo.create_room("office", "red")
+            dojo.add_person("Timoue", "Bakayoko", "Fellow", "Y")
+            dojo.create_room("living_space", "lion")
+            for name in ["Ann", "Ben", "Cat", "Dan"]:
+                dojo.add_person(name, "Doe", "Fellow", "Y")
+            occupancy = OccupancyMatrix(dojo.store) \
+                if isinstance(dojo, ColumnarDojo) \
+                else OccupancyMatrix.from_dojo(dojo)
+            self.assertEqual(
+                [(1, "Office and Living Space"), (2, "Office"),
+                 (3, "Living Space")], occupancy.unallocated())
+            self.assertEqual({"red": 5, "lion": 4}, occupancy.room_counts())
+            self.assertEqual(["lion"], occupancy.full_rooms())
+            del occupancy
+            self.assertEqual(
+                {"residents": 5, "capacity": 6, "ratio": 5 / 6},
+                dojo.print_utilisation()["office"])
+            self.assertEqual(
+                [{"Name": "Kylian Mbappe", "Person id": 1,
+                  "Missing": "Office and Living Space"},
+                 {"Name": "Gianluggi Buffon", "Person id": 2,
+                  "Missing": "Office"},
+                 {"Name": "Timoue Bakayoko", "Person id": 3,
+                  "Missing": "Living Space"}], dojo.print_unallocated())
+
+    def test_waitlist_drains_on_new_room(self):
+        """Tests that waiting people get rooms once rooms are created"""
+
+        dojo = Dojo(output=SilentSink(), waitlist=True)
+        dojo.add_person("Kylian", "Mbappe", "Fellow", "Y")
+        dojo.add_person("Gianluggi", "Buffon", "Staff")
+        self.assertEqual(2, len(dojo.waitlists["office"]))
+        dojo.create_room("office", "red")
+        dojo.create_room("living_space", "lion")
+        self.assertEqual(["Kylian Mbappe", "Gianluggi Buffon"],
+                         get_residents(find_room(dojo.rooms, "red")))
+        self.assertEqual(["Kylian Mbappe"],
+                         get_residents(find_room(dojo.rooms, "lion")))
+        self.assertFalse(dojo.waitlists["office"])
+        self.assertFalse(dojo.waitlists["living_space"])
+
+    def test_waitlist_keeps_arrival_order(self):
+        """Tests that waiting people are allocated first come first served"""
+
+        dojo = Dojo(output=SilentSink(), waitlist=True)
+        dojo.create_room("living_space", "lion")
+        dojo.allocate_batch(
+            [(name, "Doe", "fellow", "Y")
+             for name in ["Ann", "Ben", "Cat", "Dan", "Eve", "Fay"]])
+        self.assertEqual(["Eve Doe", "Fay Doe"],
+                         [person.get_fullname() for person
+                          in dojo.waitlists["living_space"]])
+        dojo.create_room("office", "red")
+        self.assertEqual(6, len(find_room(dojo.rooms, "red").residents))
+        dojo.create_room("living_space", "tiger")
+        self.assertEqual(["Eve Doe", "Fay Doe"],
+                         get_residents(find_room(dojo.rooms, "tiger")))
+
+    def test_unallocated_index_and_file(self):
+        """Tests that the unallocated index follows allocations"""
+
+        self.addCleanup(os.remove, "resources/unallocated.txt")
+        dojo = Dojo(output=SilentSink())
+        dojo.add_person("Kylian", "Mbappe", "Fellow", "Y")
+        dojo.add_person("Gianluggi", "Buffon", "Staff")
+        dojo.create_room("office", "red")
+        dojo.add_person("Timoue", "Bakayoko", "Fellow", "Y")
+        dojo.add_person("Dele", "Ali", "Fellow", "N")
+        self.assertEqual([1, 2, 3], sorted(dojo.unallocated))
+        dojo.reallocate_person(2, "red")
+        self.assertEqual([1, 3], sorted(dojo.unallocated))
+        self.assertEqual(
+            [{"Name": "Kylian Mbappe", "Person id": 1,
+              "Missing": "Office and Living Space"},
+             {"Name": "Timoue Bakayoko", "Person id": 3,
+              "Missing": "Living Space"}], dojo.print_unallocated())
+        self.assertIsNone(dojo.print_unallocated("unallocated.txt"))
+        with open("resources/unallocated.txt") as file:
+            self.assertEqual(
+                ["Name, Person id, Missing",
+                 "Kylian Mbappe, 1, Office and Living Space",
+                 "Timoue Bakayoko, 3, Living Space"],
+                file.read().splitlines())
+
+    def test_print_allocations_formats(self):
+        """Tests the CSV, JSON lines and gzipped allocation reports"""
+
+        self.dojo.add_person("Dele", "Ali", "Fellow", "Y")
+        self.dojo.create_room("office", "orange")
+        for file_name in ["allocations.csv", "allocations.jsonl.gz"]:
+            self.addCleanup(os.remove, "resources/" + file_name)
+        self.dojo.print_allocations("allocations.csv")
+        with open("resources/allocations.csv") as file:
+            self.assertEqual(
+                ["room_name,room_type,person_id,name",
+                 "testoffice,office,1,Dele Ali",
+                 "testlivingspace,living_space,1,Dele Ali",
+                 "orange,office,,"], file.read().splitlines())
+        self.dojo.print_allocations("allocations.jsonl.gz")
+        with gzip.open("resources/allocations.jsonl.gz", "rt") as file:
+            rooms = [json.loads(line) for line in file]
+        self.assertEqual(["testoffice", "testlivingspace", "orange"],
+                         [room["room_name"] for room in rooms])
+        self.assertEqual([{"person_id": 1, "name": "Dele Ali"}],
+                         rooms[0]["people"])
+
+    def test_create_rooms_rejects_only_bad_names(self):
+        """Tests that bad names do not stop the rest of a bulk creation"""
+
+        stream = io.StringIO()
+        dojo = Dojo(output=JSONLinesSink(stream))
+        dojo.create_room("office", "orange")
+        rooms = dojo.create_rooms([
+            ("office", "orange"), ("office", "red1"), ("office", "blue"),
+            ("living_space", "lion"), ("office", "blue")])
+        self.assertEqual(["blue", "lion"], [room.name for room in rooms])
+        events = [json.loads(line)["event"]
+                  for line in stream.getvalue().splitlines()]
+        self.assertEqual(
+            ["room_created", "duplicate_room", "invalid_room_name",
+             "room_created", "room_created", "duplicate_room"], events)
+        self.assertIn(dojo.rooms_by_name["lion"],
+                      dojo.vacancies["living_space"])
+
+    def test_load_rooms(self):
+        """Tests that rooms are loaded from a file and bad lines reported"""
+
+        dojo = Dojo(output=SilentSink(), waitlist=True)
+        dojo.add_person("Dele", "Ali", "Fellow")
+        with tempfile.NamedTemporaryFile(
+                "w", suffix=".txt", delete=False) as file:
+            file.write("office orange\nliving_space lion\nattic bat\n"
+                       "office\n\noffice orange\n")
+        self.addCleanup(os.remove, file.name)
+        result = dojo.load_rooms(file.name)
+        self.assertEqual(["orange", "lion"],
+                         [room.name for room in result["created"]])
+        self.assertEqual([(3, "unknown room type attic"),
+                          (4, "expected a room type and a room name"),
+                          (6, "room name already exists")], result["rejected"])
+        self.assertEqual("orange", dojo.people[0].office.name)
+
+    def test_service_handles_concurrent_requests(self):
+        """Tests the HTTP service with many clients and a final checkpoint"""
+
+        db_path = "resources/servicedb.db"
+        self.addCleanup(os.remove, db_path)
+        service = AllocatorService(
+            Dojo(output=SilentSink(), office_strategy=FirstFitStrategy()),
+            db_file="servicedb.db")
+
+        async def request(port, method, path, body=None):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            data = json.dumps(body).encode() if body is not None else b""
+            writer.write("{0} {1} HTTP/1.1\r\nContent-Length: {2}\r\n"
+                         "Connection: close\r\n\r\n".format(
+                             method, path, len(data)).encode() + data)
+            response = await reader.read()
+            writer.close()
+            head, _, payload = response.partition(b"\r\n\r\n")
+            return int(head.split()[1]), json.loads(payload)
+
+        async def scenario():
+            server = await service.start(port=0)
+            port = server.sockets[0].getsockname()[1]
+            status, response = await request(
+                port, "POST", "/rooms",
+                {"room_type": "office", "room_names": ["orange", "red"]})
+            self.assertEqual(["orange", "red"], response["result"])
+            responses = await asyncio.gather(*[
+                request(port, "POST", "/people",
+                        {"first_name": "Fellow", "last_name": "X" * (n + 1),
+                         "person_type": "Fellow"}) for n in range(20)])
+            not_found = await request(port, "GET", "/nowhere")
+            allocations = await request(port, "GET", "/allocations")
+            await service.stop(server)
+            return responses, not_found, allocations
+
+        responses, not_found, allocations = asyncio.run(scenario())
+        self.assertEqual(20, sum(response["ok"] for _, response in responses))
+        self.assertEqual(404, not_found[0])
+        self.assertEqual([6, 6], [len(room["people"])
+                                  for room in allocations[1]["result"]])
+        self.assertEqual(1, service.checkpoints)
+        dojo = Dojo(output=SilentSink())
+        dojo.load_state(db_path)
+        self.assertEqual(20, len(dojo.people))
+
+    def test_service_checkpoints_in_a_worker_thread(self):
+        """Tests that checkpoints leave the event loop and block changes"""
+
+        self.addCleanup(os.remove, "resources/servicethread.db")
+        service = AllocatorService(Dojo(output=SilentSink()),
+                                   db_file="servicethread.db",
+                                   checkpoint_interval=0.01)
+        service.handle("POST", "/rooms",
+                       {"room_type": "office", "room_names": ["orange"]})
+        events, save_state = [], service.dojo.save_state
+
+        def slow_save(db_file):
+            events.append(threading.current_thread() is
+                          threading.main_thread())
+            time.sleep(0.05)
+            save_state(db_file)
+            events.append("saved")
+        service.dojo.save_state = slow_save
+
+        async def scenario():
+            server = await service.start(port=0)
+            port = server.sockets[0].getsockname()[1]
+            await asyncio.sleep(0.03)
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            data = json.dumps(
+                {"room_type": "office", "room_names": ["red"]}).encode()
+            writer.write("POST /rooms HTTP/1.1\r\nContent-Length: {0}\r\n"
+                         "Connection: close\r\n\r\n".format(
+                             len(data)).encode() + data)
+            await reader.read()
+            writer.close()
+            events.append("created")
+            await service.stop(server)
+
+        asyncio.run(scenario())
+        self.assertEqual([False, "saved", "created"], events[:3])
+        self.assertEqual([True, "saved"], events[-2:])
+
+    def test_service_rejects_bad_fields(self):
+        """Tests that badly typed requests get a 400 and failures a 500"""
+
+        service = AllocatorService(Dojo(output=SilentSink()))
+        for path, body in [
+                ("/rooms", {"room_type": 1, "room_names": ["orange"]}),
+                ("/rooms", ["orange"]),
+                ("/rooms", {"room_type": "kitchen"}),
+                ("/rooms", {"room_type": "office", "room_names": [1]}),
+                ("/people", {"first_name": 1, "last_name": "Ali",
+                             "person_type": "fellow"}),
+                ("/people", {"first_name": "Dele", "last_name": "Ali",
+                             "person_type": "fellow",
+                             "wants_accommodation": 1}),
+                ("/people", {"first_name": "Dele", "last_name": "Ali",
+                             "person_type": "guest"}),
+                ("/reallocations", {"person_id": True}),
+                ("/reallocations", {"person_id": 1, "room_type": 1})]:
+            status, response = service.handle("POST", path, body)
+            self.assertEqual(400, status, body)
+            self.assertFalse(response["ok"])
+        self.assertEqual(200, service.handle("POST", "/people", {
+            "first_name": "Dele", "last_name": "Ali", "person_type": "Fellow",
+            "wants_accommodation": "y"})[0])
+
+        def fail(body):
+            raise KeyError("boom")
+        service.routes[("GET", "/unallocated")] = fail
+
+        async def scenario():
+            server = await service.start(port=0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            statuses = []
+            for path in ("/unallocated", "/allocations"):
+                writer.write("GET {0} HTTP/1.1\r\n\r\n".format(
+                    path).encode())
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = int(head.split(b"Content-Length: ")[1].split()[0])
+                statuses.append(int(head.split()[1]))
+                await reader.readexactly(length)
+            writer.close()
+            await service.stop(server)
+            return statuses
+
+        self.assertEqual([500, 200], asyncio.run(scenario()))
+
+    def test_startup_imports_no_heavy_modules(self):
+        """Tests that importing the application only loads what it needs"""
+
+        output = subprocess.run(
+            [sys.executable, "-c",
+             "import sys, space_allocator, src.dojo; src.dojo.Dojo(); "
+             "print(sorted({'colorful', 'prettytable', 'sqlite3', 'numpy', "
+             "'asyncio'} & set(sys.modules)))"],
+            stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        self.assertEqual("[]", output.stdout.strip())
+
+    def test_parse_command_matches_docopt(self):
+        """Tests that cached command parsing gives docopt's results"""
+
+        doc = SpaceAllocator.do_reallocate_person.__doc__
+        for argv in ["1", "1 red", "2 --living", "3 lion --living"]:
+            self.assertEqual(dict(docopt(doc, argv)),
+                             parse_command(doc, argv))
+        self.assertIn(doc, usage_patterns)
+
+    def test_run_script(self):
+        """Tests that scripts stop at the first failure unless told not to"""
+
+        script = ["# setup", "create_room office orange", "",
+                  "add_person Dele Ali fellow", "print_room blue",
+                  "create_room", "print_room orange"]
+        with contextlib.redirect_stdout(io.StringIO()), \
+                contextlib.redirect_stderr(io.StringIO()) as errors:
+            dojo = Dojo(output=SilentSink())
+            self.assertEqual(1, SpaceAllocator(dojo).run_script(script))
+            self.assertEqual(1, len(dojo.people))
+            self.assertIn("line 5", errors.getvalue())
+            dojo = Dojo(output=TextSink())
+            self.assertEqual(2, SpaceAllocator(dojo).run_script(
+                script, keep_going=True))
+        self.assertTrue(dojo.output.getvalue().endswith("Dele Ali"))
+        with contextlib.redirect_stderr(io.StringIO()):
+            dojo = Dojo(output=SilentSink())
+            self.assertEqual(2, SpaceAllocator(dojo).run_script(
+                ["create_room office or4nge", "create_room office orange",
+                 "add_person Dele 4li fellow", "add_person Dele Ali fellow"],
+                keep_going=True))
+        self.assertEqual(1, len(dojo.people))
+        with contextlib.redirect_stderr(io.StringIO()) as errors:
+            dojo = Dojo(output=SilentSink(), waitlist=True)
+            self.assertEqual(1, SpaceAllocator(dojo).run_script(
+                ["create_room office orange", "add_person Ann Doe staff",
+                 "add_person Ben Doe fellow Y",
+                 "reallocate_person abc orange", "print_room orange"],
+                keep_going=True))
+        self.assertIn("Line 4 raised ValueError", errors.getvalue())
+        self.assertEqual(2, len(dojo.people))
+
+    def allocation_state(self, dojo):
+        return [(room.name, [person.id_ for person in room.residents])
+                for room in dojo.rooms]
+
+    def test_journal_recovers_random_allocations(self):
+        """Tests that replaying the journal gives back the same rooms"""
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "dojo.journal")
+        dojo = Dojo(output=SilentSink(), office_strategy=make_strategy("random"))
+        Journal(path).recover(dojo)
+        dojo.create_room("office", "orange", "red", "blue")
+        dojo.create_room("living_space", "lion")
+        for n in range(10):
+            dojo.add_person("Fellow", "X" * (n + 1), "Fellow", "Y")
+        dojo.reallocate_person(1, next(
+            room.name for room in dojo.rooms[:3] if not room.fully_occupied
+            and room is not dojo.people[0].office))
+        dojo.journal.close()
+
+        recovered = Dojo(output=SilentSink())
+        replayed = Journal(path).recover(recovered)
+        self.assertEqual(4 + 10 + 10 + 4 + 2, replayed)
+        self.assertEqual(self.allocation_state(dojo),
+                         self.allocation_state(recovered))
+        self.assertEqual(dict(dojo.unallocated), {
+            person_id: dojo.people_by_id[person_id]
+            for person_id in recovered.unallocated})
+        self.assertTrue(recovered.people[0].has_living_space)
+
+    def test_journal_compaction_and_torn_writes(self):
+        """Tests that snapshots bound the replay and torn lines are dropped"""
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "dojo.journal")
+        dojo = Dojo(output=SilentSink())
+        Journal(path, group_size=1, snapshot_every=5).recover(dojo)
+        dojo.create_room("office", "orange", "red")
+        for n in range(6):
+            dojo.add_person("Staff", "X" * (n + 1), "Staff")
+        self.assertTrue(os.path.isfile(path + ".snapshot"))
+        self.assertLess(dojo.journal.since_snapshot, 5)
+        dojo.journal.close()
+        with open(path, "a") as file:
+            file.write('[99,"R","tor')
+
+        recovered = Dojo(output=SilentSink())
+        journal = Journal(path)
+        self.assertLess(journal.recover(recovered), 5)
+        self.assertEqual(self.allocation_state(dojo),
+                         self.allocation_state(recovered))
+        recovered.add_person("Dele", "Ali", "Fellow")
+        journal.close()
+        with open(path) as file:
+            self.assertEqual(
+                '[15,"P",7,"Dele","Ali","fellow","N"]', file.readlines()[-2]
+                .strip())
+        self.assertEqual(7, recovered.people[-1].id_)
+
+    def test_sqlite_dojo_matches_dojo(self):
+        """Tests that SQLiteDojo allocates and reports like Dojo"""
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        stored = SQLiteDojo(os.path.join(directory.name, "campus.db"),
+                            output=SilentSink(),
+                            office_strategy=FirstFitStrategy(),
+                            living_space_strategy=FirstFitStrategy())
+        self.addCleanup(stored.close)
+        memory = Dojo(output=SilentSink(), office_strategy=FirstFitStrategy(),
+                      living_space_strategy=FirstFitStrategy())
+        for dojo in (stored, memory):
+            dojo.create_room("office", "orange", "red")
+            dojo.create_room("living_space", "lion")
+            for n in range(9):
+                dojo.add_person("Fellow", "X" * (n + 1), "Fellow", "Y")
+            dojo.reallocate_person(2, "red")
+            dojo.reallocate_person(3, "lion", "living_space")
+        self.assertEqual(memory.print_allocations(),
+                         stored.print_allocations())
+        self.assertEqual(memory.print_room("red"), stored.print_room("red"))
+        self.assertEqual(memory.print_unallocated(),
+                         stored.print_unallocated())
+        self.addCleanup(os.remove, "resources/stored_unallocated.txt")
+        self.assertIsNone(stored.print_unallocated("stored_unallocated.txt"))
+        with open("resources/stored_unallocated.txt") as file:
+            self.assertEqual(
+                len(memory.print_unallocated()) + 1,
+                len(file.read().splitlines()))
+        self.assertEqual(
+            [("orange", 1), ("red", 2), ("lion", 0)],
+            stored.connection.execute(
+                "SELECT room_name, free_slots FROM room_vacancy").fetchall())
+        self.assertEqual(2, len(stored.vacancies["office"]))
+        self.assertEqual(memory.print_allocations(print_table="Y"),
+                         stored.print_allocations(print_table="Y"))
+        report = os.path.relpath(
+            os.path.join(directory.name, "report.csv"), "resources")
+        for dojo in (stored, memory):
+            self.assertIsNone(dojo.print_allocations(report))
+
+    def test_sqlite_random_pick_only_returns_vacant_rooms(self):
+        """Tests that random picks in SQLite reach every vacant room"""
+
+        stored = SQLiteDojo(":memory:", output=SilentSink())
+        self.addCleanup(stored.close)
+        stored.create_room("office", "orange", "red", "blue", "green")
+        stored.create_room("living_space", "lion")
+        stored.create_room("office", "pink")
+        stored.connection.execute(
+            "UPDATE room_vacancy SET free_slots = 0 WHERE room_name = 'red'")
+        vacancies = stored.vacancies["office"]
+        vacancies.excluded = "blue"
+        rng = random.Random(7)
+        self.assertEqual({"orange", "green", "pink"},
+                         {vacancies.pick_random(rng) for _ in range(100)})
+        stored.connection.execute("UPDATE room_vacancy SET free_slots = 0")
+        self.assertIsNone(vacancies.pick_random(rng))
+
+    def test_sqlite_load_state_keeps_room_capacity(self):
+        """Tests that loading into a partly full room does not overfill it"""
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        saved = Dojo(output=SilentSink())
+        for name in ["Ann", "Ben", "Cat", "Dan"]:
+            saved.add_person(name, "Doe", "staff")
+        saved.create_room("office", "orange")
+        saved.create_room("living_space", "lion")
+        for name in ["Eve", "Fay", "Gus", "Hal"]:
+            saved.add_person(name, "Doe", "fellow", "Y")
+        db_file = os.path.relpath(
+            os.path.join(directory.name, "saved.db"), "resources")
+        saved.save_state(db_file)
+
+        stored = SQLiteDojo(":memory:", output=SilentSink())
+        self.addCleanup(stored.close)
+        results = []
+        for dojo in (stored, Dojo(output=SilentSink())):
+            dojo.create_room("office", "orange")
+            dojo.create_room("living_space", "lion")
+            for name in ["Ivy", "Jon", "Kim", "Lea"]:
+                dojo.add_person(name, "Roe", "fellow", "Y")
+            dojo.load_state(os.path.join("resources", db_file))
+            results.append((
+                [(room.name, [person.id_ for person in room.residents])
+                 for room in dojo.rooms],
+                [row["Person id"] for row in dojo.print_unallocated()]))
+        self.assertEqual(results[1], results[0])
+        self.assertEqual(
+            ([("orange", [1, 2, 3, 4, 5, 6]), ("lion", [1, 2, 3, 4])],
+             [5, 6, 7, 8]), results[0])
+        self.assertEqual(
+            [("orange", 0), ("lion", 0)], stored.connection.execute(
+                "SELECT room_name, free_slots FROM room_vacancy "
+                "ORDER BY rowid").fetchall())
+
+    def test_sqlite_dojo_opens_dojo_database(self):
+        """Tests that a database saved by Dojo opens with its vacancies"""
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        db_file = os.path.relpath(
+            os.path.join(directory.name, "saved.db"), "resources")
+        self.dojo.save_state(db_file)
+        stored = SQLiteDojo(os.path.join("resources", db_file),
+                            output=SilentSink())
+        self.addCleanup(stored.close)
+        self.assertEqual(
+            [("testoffice", 6), ("testlivingspace", 4)],
+            stored.connection.execute(
+                "SELECT room_name, free_slots FROM room_vacancy").fetchall())
+        stored.add_person("Dele", "Ali", "Fellow", "Y")
+        stored.save_state(db_file)
+
+        restored = Dojo(output=SilentSink())
+        restored.load_state(os.path.join("resources", db_file))
+        self.assertEqual(
+            ["Dele Ali"], restored.print_room("testoffice"))
+        restored.add_person("Ann", "Doe", "Staff")
+        restored.create_room("office", "orange")
+        restored.reallocate_person(2, "orange")
+        self.assertEqual(["Ann Doe"], restored.print_room("orange"))
+        restored.save_state(db_file)
+        reopened = SQLiteDojo(os.path.join("resources", db_file),
+                              output=SilentSink())
+        self.addCleanup(reopened.close)
+        self.assertEqual(
+            [("testoffice", 5), ("testlivingspace", 3), ("orange", 5)],
+            reopened.connection.execute(
+                "SELECT room_name, free_slots FROM room_vacancy").fetchall())
+
+    def command_script(self, directory, campus=None):
+        """Writes a script using every command to directory/script.txt
+
+        Args:
+            directory (str): Where the script and its files are written
+            campus (str): Campus the rooms people move between are created
+                on, for a dojo started with --campuses
+
+        Returns:
+            str: Path of the script
+        """
+
+        def write(name, text):
+            path = os.path.join(directory, name)
+            with open(path, "w") as file:
+                file.write(text)
+            return path
+
+        def in_resources(name):
+            return os.path.relpath(os.path.join(directory, name), "resources")
+
+        on_campus = " --campus=" + campus if campus else ""
+        rooms = write("rooms.txt", "office blue\nliving_space puma\n")
+        people = write("people.txt",
+                       "Kylian Mbappe fellow Y\nTimoue Bakayoko staff\n")
+        moves = write("moves.txt", "3 red\n")
+        return write("script.txt", "\n".join([
+            "create_room office orange red" + on_campus,
+            "create_room living_space lion tiger" + on_campus,
+            "load_rooms " + rooms, "add_person Dele Ali fellow Y",
+            "add_person Ann Doe staff", "load_people " + people,
+            "load_people {0} --batch=1".format(people), "print_room orange",
+            "print_allocations", "print_allocations --table",
+            "print_allocations " + in_resources("allocations.txt"),
+            "print_unallocated",
+            "print_unallocated " + in_resources("unallocated.txt"),
+            "print_utilisation", "reallocate_person 1 red",
+            "reallocate_person 1 --living", "reallocate_people " + moves,
+            "save_state " + in_resources("saved.db"),
+            "load_state " + os.path.join(directory, "saved.db"), "stats"]))
+
+    def run_main(self, *argv):
+        """Runs the command line application, returning its exit code"""
+
+        with contextlib.redirect_stdout(io.StringIO()), \
+                contextlib.redirect_stderr(io.StringIO()), \
+                self.assertRaises(SystemExit) as exit_:
+            main(list(argv))
+        return exit_.exception.code
+
+    def test_every_command_runs_against_store(self):
+        """Tests that the commands of a script all run with --store"""
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        db_file = os.path.join(directory.name, "campus.db")
+        self.assertEqual(0, self.run_main(
+            "--script=" + self.command_script(directory.name),
+            "--store=" + db_file, "--output=silent",
+            "--office-strategy=first_fit", "--stats"))
+
+        stored = SQLiteDojo(db_file, output=SilentSink())
+        self.addCleanup(stored.close)
+        self.assertEqual(["orange", "red", "lion", "tiger", "blue", "puma"],
+                         [room.name for room in stored.rooms])
+        self.assertEqual(6, len(stored.rooms))
+        self.assertEqual("puma", stored.rooms[-1].name)
+        self.assertEqual(["Dele Ali", "Kylian Mbappe"],
+                         [person.get_fullname()
+                          for person in stored.rooms[1].residents])
+        with open(os.path.join(directory.name, "unallocated.txt")) as file:
+            self.assertEqual(["Name, Person id, Missing"],
+                             file.read().splitlines())
+
+        batch_store = SQLiteDojo(os.path.join(directory.name, "batch.db"),
+                                 output=SilentSink())
+        self.addCleanup(batch_store.close)
+        cohort = [("Ann", "Doe", "staff"), ("Ben", "Doe", "fellow", "Y"),
+                  ("Bad", "Entry"), ("Cid", "Doe", "fellow", "y"),
+                  ("Dan", "Doe", "staff", "Y")]
+        results = []
+        for dojo in (batch_store, Dojo(output=SilentSink())):
+            dojo.create_room("office", "blue", "green")
+            dojo.create_room("living_space", "puma")
+            results.append(dojo.allocate_batch(cohort))
+        self.assertEqual(results[1], results[0])
+        self.assertEqual(
+            {"Person": "Cid Doe",
+             "Rooms": [{"office": "blue"}, {"living_space": "puma"}]},
+            results[0][2])
+
+    def test_every_command_runs_on_campuses(self):
+        """Tests that the commands of a script all run with --campuses"""
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.assertEqual(0, self.run_main(
+            "--script=" + self.command_script(directory.name, "nairobi"),
+            "--campuses=nairobi,lagos", "--output=silent",
+            "--office-strategy=first_fit", "--stats"))
+        with open(os.path.join(directory.name, "allocations.txt")) as file:
+            allocations = file.read()
+        for room_name in ("orange", "red", "lion", "tiger", "blue", "puma"):
+            self.assertIn("Room: " + room_name, allocations)
+        for campus in ("nairobi", "lagos"):
+            self.assertTrue(os.path.isfile(os.path.join(
+                directory.name, "saved_{0}.db".format(campus))))
+
+        dojo = ShardedDojo(["nairobi", "lagos"], output=TextSink())
+        self.addCleanup(dojo.close)
+        dojo.create_room("office", "orange", campus="nairobi")
+        dojo.create_room("office", "blue", campus="lagos")
+        dojo.create_room("living_space", "lion", campus="lagos")
+        results = dojo.allocate_batch(
+            [("Ann", "Doe", "staff"), ("Bad", "Entry"),
+             ("Ben", "Doe", "fellow", "Y"), ("Cid", "Doe", "fellow")])
+        self.assertEqual(["Ann Doe", "Ben Doe", "Cid Doe"],
+                         [result["Person"] for result in results])
+        self.assertEqual([{"office": "blue"}, {"living_space": "lion"}],
+                         results[1]["Rooms"])
+        self.assertEqual({1: 0, 2: 1, 3: 0}, dojo.person_campus)
+        self.assertIn("3 people added: 3 allocated offices, 1 of 1 "
+                      "allocated living spaces, 1 rejected",
+                      dojo.output.getvalue())
+
+    def test_thread_safe_dojo_never_overfills_rooms(self):
+        """Tests that rooms stay within capacity under concurrent use"""
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, switch_interval)
+        dojo = ThreadSafeDojo(output=SilentSink(), waitlist=True,
+                              office_strategy=make_strategy("random"))
+        offices = ["office" + letter for letter in "abcdefghij"]
+        dojo.create_room("office", *offices)
+        dojo.create_room("living_space", "lion", "tiger", "puma")
+
+        def work(seed):
+            for n in range(25):
+                dojo.add_person("Fellow", "X" * (seed + 1), "Fellow", "Y")
+                dojo.reallocate_person(
+                    (seed * 25 + n) // 2 + 1, offices[(seed + n) % 10])
+
+        threads = [threading.Thread(target=work, args=(seed,))
+                   for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(list(range(1, 201)),
+                         sorted(person.id_ for person in dojo.people))
+        for room in dojo.rooms:
+            self.assertLessEqual(len(room.residents),
+                                 room.maximum_no_of_people)
+            for person in room.residents:
+                self.assertIs(room, getattr(person, room._type))
+        self.assertEqual(60, sum(person.office is not None
+                                 for person in dojo.people))
+        self.assertEqual(12, sum(person.living_space is not None
+                                 for person in dojo.people))
+        self.assertEqual(0, len(dojo.vacancies["office"]))
+        self.assertEqual(200 - 12, len(dojo.unallocated))
+        self.assertEqual(140, len(dojo.waitlists["office"]))
+
+    def test_sharded_dojo_routes_and_merges_campuses(self):
+        """Tests allocation, fallback and reports across campus processes"""
+
+        dojo = ShardedDojo(["nairobi", "lagos"], output=SilentSink(),
+                           office_strategy=FirstFitStrategy())
+        self.addCleanup(dojo.close)
+        dojo.create_room("office", "orange", campus="nairobi")
+        dojo.create_room("office", "blue", "green", campus="lagos")
+        self.assertEqual([], dojo.create_room("office", "blue"))
+        for n in range(8):
+            dojo.add_person("Fellow", "X" * (n + 1), "Fellow",
+                            campus="nairobi")
+        self.assertEqual(
+            [0] * 6 + [1] * 2, [dojo.person_campus[person_id]
+                                for person_id in range(1, 9)])
+        dojo.reallocate_person(1, "blue")
+        self.assertEqual(["Fellow X"], dojo.print_room("orange")[:1])
+        self.assertEqual(2, dojo.output.errors)
+        dojo.reallocate_person(7, "green")
+        self.assertEqual(2, dojo.output.errors)
+
+        path = "resources/sharded.csv"
+        self.addCleanup(os.remove, path)
+        dojo.print_allocations("sharded.csv")
+        with open(path) as file:
+            rows = file.read().splitlines()
+        self.assertEqual(9, len(rows))
+        self.assertEqual(["orange", "blue", "green"],
+                         [room.name for room in dojo.rooms()])
+
+        self.addCleanup(os.remove, "resources/sharded_lagos.db")
+        self.addCleanup(os.remove, "resources/sharded_nairobi.db")
+        dojo.save_state("sharded.db")
+        dojo.processes[1].terminate()
+        dojo.processes[1].join()
+        dojo.add_person("Dele", "Ali", "Staff")
+        self.assertFalse(dojo.up[1])
+        self.assertEqual([{"Name": "Dele Ali", "Person id": 9,
+                           "Missing": "Office"}], dojo.print_unallocated())
+
+        restored = ShardedDojo(["nairobi", "lagos"], output=SilentSink())
+        self.addCleanup(restored.close)
+        restored.load_state("resources/sharded.db")
+        self.assertEqual(1, restored.person_campus[7])
+        self.assertEqual(9, restored.next_person_id)
+
+    def test_hot_path_benchmarks_compare_with_baselines(self):
+        """Tests that the benchmark suite saves and checks baselines"""
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        baselines = os.path.join(directory.name, "baselines.json")
+        command = [sys.executable, os.path.abspath("benchmarks/hot_paths.py"),
+                   "--sizes=300", "--repeat=1"]
+        subprocess.run(command + ["--save=baselines.json"], check=True,
+                       stdout=subprocess.DEVNULL, cwd=directory.name)
+        with open(baselines) as file:
+            results = json.load(file)
+        self.assertEqual(
+            {"add_person", "load_people", "reallocate_person",
+             "print_allocations", "save_state", "load_state"},
+            set(results["300"]))
+        self.assertIn("peak_mb", results["300"]["load_state"])
+
+        results["300"]["save_state"]["peak_mb"] = 0.0
+        with open(baselines, "w") as file:
+            json.dump(results, file)
+        compared = subprocess.run(
+            command + ["--operations=save_state", "--compare=" + baselines,
+                       "--tolerance=0"],
+            stdout=subprocess.PIPE, universal_newlines=True)
+        self.assertEqual(1, compared.returncode)
+        self.assertIn("regression: save_state at 300 people: peak_mb",
+                      compared.stdout)
+
+    def test_stats_time_commands_and_count_events(self):
+        """Tests the instrumentation and the stats command"""
+
+        dojo = Dojo(output=SilentSink())
+        stats = Stats()
+        stats.instrument(dojo)
+        path = "resources/stats.json"
+        self.addCleanup(os.remove, path)
+        script = ["create_room office orange", "add_person Dele Ali fellow",
+                  "add_person Ada Obi staff", "reallocate_person 7 orange",
+                  "print_room orange", "stats stats.json"]
+        with contextlib.redirect_stdout(io.StringIO()):
+            SpaceAllocator(dojo, stats).run_script(script, keep_going=True)
+        with open(path) as file:
+            figures = json.load(file)
+
+        self.assertEqual(2, figures["latency"]["dojo.add_person"]["count"])
+        self.assertEqual(
+            1, figures["latency"]["command.reallocate_person"]["count"])
+        self.assertEqual(2, figures["events"]["office_allocated"])
+        self.assertEqual(1, figures["events"]["unknown_person"])
+        self.assertEqual({"hits": 2, "misses": 0, "hit_rate": 1.0},
+                         figures["caches"]["vacancies.office"])
+        parser = figures["caches"]["command_parser"]
+        self.assertEqual(6, parser["hits"] + parser["misses"])
+        self.assertGreaterEqual(parser["hits"], 1)
+        self.assertEqual(2, figures["rooms"]["office"]["residents"])
+        self.assertEqual(1, dojo.output.errors)
+